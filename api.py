@@ -1,36 +1,31 @@
 # api.py
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import requests
-from requests.auth import HTTPBasicAuth
+from contextlib import aclosing
+from functools import partial
+import aiohttp
 import xml.etree.ElementTree as ET
+import torznab
 from bs4 import BeautifulSoup
 from models import Movie, Show, SearchResult
+from release_ranking import DEFAULT_SHORTLIST, rank_releases
 from tracker_manager import load_trackers_config
-from watchlist_manager import load_watchlist, save_watchlist
+from tracker_sessions import TrackerSessionPool
+from watchlist_manager import load_watchlist, add_to_watchlist, remove_from_watchlist
 
 # A simple script to handle all core logic for search and watchlist management.
 
-def parse_torznab_xml(xml_content):
+def _search_result(item, tracker_name=None):
+    return SearchResult(item['title'], item['link'] or item['magneturl'], item['size'], item['seeders'],
+                        peers=item['peers'], infohash=item['infohash'], imdbid=item['imdbid'],
+                        tvdbid=item['tvdbid'], tracker=tracker_name)
+
+def parse_torznab_xml(xml_content, limit=None):
     """Parses a Torznab-style XML response and extracts torrent data."""
     results = []
     try:
-        root = ET.fromstring(xml_content)
-        channel = root.find("channel")
-        for item in channel.findall("item"):
-            title = item.find("title").text
-            link = item.find("link").text
-            size = None
-            seeders = None
-            
-            for attr in item.findall("{http://torznab.com/schemas/2015/feed}attr"):
-                if attr.attrib['name'] == 'size':
-                    size = int(attr.attrib['value'])
-                if attr.attrib['name'] == 'seeders':
-                    seeders = int(attr.attrib['value'])
-            
-            if title and link:
-                results.append(SearchResult(title, link, size, seeders))
+        for item in torznab.iter_items(xml_content, limit):
+            if item['title'] and (item['link'] or item['magneturl']):
+                results.append(_search_result(item))
     except ET.ParseError as e:
         print(f"Error parsing XML: {e}")
     return results
@@ -58,111 +53,168 @@ def parse_html_response(html_content, tracker_name):
             ))
     return results
 
-def _perform_search_sync(tracker_config, query_data):
-    """
-    Performs a search on a single tracker with enhanced logic for
-    authentication and parsing. This is a synchronous helper function.
-    """
-    tracker_name = tracker_config.get('name', 'Unknown')
-    base_url = tracker_config.get('base_url')
-    auth_type = tracker_config.get('auth_type', 'none')
-    parser_type = tracker_config.get('parser', 'torznab_xml')
+# --- Tracker Search Engine ---
+DEFAULT_TRACKER_TIMEOUT = 8.0    # per-tracker deadline; a tracker can set its own "timeout" in trackers_config.json
+DEFAULT_SEARCH_DEADLINE = 20.0   # nothing that answers later than this is waited for
+ENOUGH_RESULTS = 25              # find_best_release stops waiting for slower trackers once this many good results are in
+GOOD_RESULT_SEEDERS = 5
 
-    if not base_url:
-        return []
+def _search_params(tracker_config, query_data):
+    """Maps a query onto the tracker's parameter names."""
+    params_map = tracker_config.get("params", {})
+    search_params = {
+        params_map.get("q", "q"): query_data["query"],
+        params_map.get("t", "t"): query_data["type"]
+    }
+    if query_data.get("categories"):
+        search_params[params_map.get("cat", "cat")] = ",".join(query_data["categories"])
+    if query_data.get("min_seeders"):
+        search_params[params_map.get("min_seeders", "min_seeders")] = query_data["min_seeders"]
+    if tracker_config.get("auth_type") == "api_key" and tracker_config.get("api_key"):
+        search_params[params_map.get("apikey", "apikey")] = tracker_config["api_key"]
+    return {name: str(value) for name, value in search_params.items() if value is not None}
 
-    session = requests.Session()
-    
+async def _read_torznab_results(response, tracker_name, limit):
+    """Parses a Torznab response while it downloads, stopping once `limit` items are in."""
+    results = []
     try:
-        # --- Authentication Logic ---
-        if auth_type == "cookies":
-            auth_url = tracker_config.get("auth_url")
-            login_data = tracker_config.get("login_data")
-            if auth_url and login_data:
-                session.post(auth_url, data=login_data)
-        elif auth_type == "http_basic":
+        items = await torznab.parse_chunks(response.content.iter_chunked(torznab.READ_CHUNK_SIZE), limit)
+    except ET.ParseError as e:
+        print(f"Error parsing XML from {tracker_name}: {e}")
+        return results
+    for item in items:
+        if item['title'] and (item['link'] or item['magneturl']):
+            results.append(_search_result(item, tracker_name))
+    return results
+
+def _parse_html(content, tracker_name, query_data):
+    # Mock-up HTML response for demonstration
+    mock_html = f"""
+    <html><body>
+    <h1>Search Results for {query_data['query']} from {tracker_name}</h1>
+    <table>
+    <tr class="torrent-row"><td><a class="torrent-title">Result 1</a></td><td><span class="torrent-size">2.1 GB</span></td><td><span class="torrent-seeders">100</span></td></tr>
+    <tr class="torrent-row"><td><a class="torrent-title">Result 2</a></td><td><span class="torrent-size">4.5 GB</span></td><td><span class="torrent-seeders">50</span></td></tr>
+    </table>
+    </body></html>
+    """
+    return parse_html_response(mock_html, tracker_name)
+
+class TrackerSearchEngine:
+    """
+    Searches trackers concurrently over persistent per-tracker sessions (one shared connection
+    pool), giving each tracker its own deadline so a slow one only costs its own results.
+    """
+    def __init__(self):
+        self._pool = TrackerSessionPool()
+
+    async def _fetch(self, tracker_config, query_data):
+        auth = None
+        if tracker_config.get("auth_type") == "http_basic":
             username = tracker_config.get("username")
             password = tracker_config.get("password")
             if username and password:
-                session.auth = HTTPBasicAuth(username, password)
-        
-        # --- Search Parameters ---
-        params_map = tracker_config.get("params", {})
-        search_params = {
-            params_map.get("q", "q"): query_data["query"],
-            params_map.get("t", "t"): query_data["type"]
-        }
-        
-        if query_data.get("categories"):
-            search_params[params_map.get("cat", "cat")] = ",".join(query_data["categories"])
-        if query_data.get("min_seeders"):
-            search_params[params_map.get("min_seeders", "min_seeders")] = query_data["min_seeders"]
-        
-        if auth_type == "api_key":
-            api_key = tracker_config.get("api_key")
-            search_params[params_map.get("apikey", "apikey")] = api_key
-
-        # --- Perform the search ---
-        response = session.get(base_url, params=search_params, timeout=15)
-        response.raise_for_status()
-        
-        # --- Parsing Logic ---
+                auth = aiohttp.BasicAuth(username, password)
+        # Cookie trackers log in through the session pool, only when their saved cookies stop working.
+        session = self._pool.get(tracker_config)
+        tracker_name = tracker_config.get('name', 'Unknown')
+        url, params = tracker_config["base_url"], _search_params(tracker_config, query_data)
+        parser_type = tracker_config.get('parser', 'torznab_xml')
         if parser_type == "torznab_xml":
-            results = parse_torznab_xml(response.text)
-        elif parser_type == "html":
-            # Mock-up HTML response for demonstration
-            mock_html = f"""
-            <html><body>
-            <h1>Search Results for {query_data['query']} from {tracker_name}</h1>
-            <table>
-            <tr class="torrent-row"><td><a class="torrent-title">Result 1</a></td><td><span class="torrent-size">2.1 GB</span></td><td><span class="torrent-seeders">100</span></td></tr>
-            <tr class="torrent-row"><td><a class="torrent-title">Result 2</a></td><td><span class="torrent-size">4.5 GB</span></td><td><span class="torrent-seeders">50</span></td></tr>
-            </table>
-            </body></html>
-            """
-            results = parse_html_response(mock_html, tracker_name)
-        else:
-            results = []
-        return results
-
-    except requests.exceptions.RequestException as e:
-        print(f"Error searching {tracker_name}: {e}")
+            read = partial(_read_torznab_results, tracker_name=tracker_name, limit=query_data.get("limit"))
+            return await session.fetch(url, params=params, auth=auth, read=read)
+        if parser_type == "html":
+            content = await session.get_text(url, params=params, auth=auth)
+            return await asyncio.to_thread(_parse_html, content, tracker_name, query_data)
         return []
-    finally:
-        session.close()
 
-async def find_best_release(query_data):
+    async def search_tracker(self, tracker_config, query_data):
+        """Searches one tracker within its deadline. Returns (tracker_name, results); failures give no results."""
+        tracker_name = tracker_config.get('name', 'Unknown')
+        if not tracker_config.get('base_url'):
+            return tracker_name, []
+        timeout = float(tracker_config.get('timeout') or DEFAULT_TRACKER_TIMEOUT)
+        try:
+            results = await asyncio.wait_for(self._fetch(tracker_config, query_data), timeout)
+        except asyncio.TimeoutError:
+            self._pool.record_timeout(tracker_name)
+            print(f"Search on {tracker_name} timed out after {timeout:.0f}s")
+            return tracker_name, []
+        except aiohttp.ClientError as e:
+            print(f"Error searching {tracker_name}: {e}")
+            return tracker_name, []
+        return tracker_name, results
+
+    async def search(self, query_data, trackers=None, deadline=DEFAULT_SEARCH_DEADLINE):
+        """
+        Async iterator yielding (tracker_name, results) as each tracker answers. Trackers still
+        running when the deadline passes, or when the caller stops iterating, are cancelled.
+        """
+        if trackers is None:
+            trackers = load_trackers_config() or []
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        pending = {asyncio.ensure_future(self.search_tracker(tracker, query_data)) for tracker in trackers}
+        try:
+            while pending:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    print(f"Search deadline reached; dropping {len(pending)} tracker(s) still running")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        print(f"Tracker search failed: {task.exception()}")
+                        continue
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def close(self):
+        await self._pool.close()
+
+    def get_stats(self):
+        return self._pool.get_stats()
+
+_engine = TrackerSearchEngine()
+
+def search_trackers(query_data, trackers=None, deadline=DEFAULT_SEARCH_DEADLINE):
+    """Async iterator over (tracker_name, results) from all configured trackers, in answer order."""
+    return _engine.search(query_data, trackers, deadline)
+
+async def close_search_engine():
+    """Saves tracker cookies and closes the shared connection pool (call before the event loop shuts down)."""
+    await _engine.close()
+
+def get_tracker_stats():
+    """Per-tracker search latency, errors, timeouts and login counts."""
+    return _engine.get_stats()
+
+async def find_best_releases(query_data, k=DEFAULT_SHORTLIST, enough=ENOUGH_RESULTS):
     """
-    Runs a parallel search across all configured trackers and returns
-    the best result based on seeders.
+    Runs a parallel search across all configured trackers and returns the
+    k best releases, deduplicated across trackers and ranked by seeders,
+    resolution, source and size. Stops waiting on slower trackers once
+    `enough` results with a healthy seeder count are in.
     """
-    trackers = load_trackers_config()
-    if not trackers:
-        return None
-    
-    with ThreadPoolExecutor(max_workers=len(trackers)) as executor:
-        loop = asyncio.get_event_loop()
-        futures = [
-            loop.run_in_executor(
-                executor,
-                _perform_search_sync,
-                tracker,
-                query_data
-            )
-            for tracker in trackers
-        ]
-    all_results = await asyncio.gather(*futures)
-    
+    min_seeders = max(int(query_data.get("min_seeders") or 0), GOOD_RESULT_SEEDERS)
     final_results = []
-    for tracker_results in all_results:
-        final_results.extend(tracker_results)
-    
-    if not final_results:
-        return None
-    
-    # Sort by seeders in descending order to find the "best" release
-    sorted_results = sorted(final_results, key=lambda x: x.seeders, reverse=True)
-    return sorted_results[0]
+    good = 0
+    async with aclosing(search_trackers(query_data)) as answers:
+        async for tracker_name, results in answers:
+            final_results.extend(results)
+            good += sum(1 for result in results if (result.seeders or 0) >= min_seeders)
+            if good >= enough:
+                break
+    return rank_releases(final_results, k)
+
+async def find_best_release(query_data, enough=ENOUGH_RESULTS):
+    """Returns the top-ranked release across all configured trackers, or None."""
+    shortlist = await find_best_releases(query_data, k=1, enough=enough)
+    return shortlist[0] if shortlist else None
 
 
 def get_watchlist():
@@ -171,21 +223,14 @@ def get_watchlist():
 
 def add_item_to_watchlist(item_type, title, unique_id=None):
     """Adds a new movie or show to the watchlist."""
-    watchlist = load_watchlist()
     if item_type == "movie":
-        watchlist["movies"].append(Movie(title, unique_id, False))
+        add_to_watchlist([Movie(title, unique_id, False)])
     elif item_type == "show":
-        watchlist["shows"].append(Show(title, unique_id, False))
-    save_watchlist(watchlist)
+        add_to_watchlist([Show(title, unique_id, False)])
     print(f"{item_type.capitalize()} '{title}' added to the watchlist.")
 
 def remove_item_from_watchlist(item_type, title):
     """Removes an item from the watchlist."""
-    watchlist = load_watchlist()
-    if item_type == "movie":
-        watchlist["movies"] = [m for m in watchlist["movies"] if m.title.lower() != title.lower()]
-    elif item_type == "show":
-        watchlist["shows"] = [s for s in watchlist["shows"] if s.title.lower() != title.lower()]
-    save_watchlist(watchlist)
+    if item_type in ("movie", "show"):
+        remove_from_watchlist(item_type, [title])
     print(f"{item_type.capitalize()} '{title}' removed from the watchlist.")
-
@@ -1,16 +1,25 @@
 import os
 import json
+import hashlib
 import logging
+import time
 from datetime import timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session, send_file, abort
+import click
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, session, send_file, abort, g, make_response
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_caching import Cache
 import database
 import request_handler as rh
-from media_scanner import start_media_scanner, get_library_movies, get_library_tv_shows, get_movie_details_by_id, get_tv_show_details_by_id, scan_and_update_library
+from media_scanner import start_media_scanner, get_library_movies, get_library_tv_shows, get_library_page, LIBRARY_PAGE_SIZE, LIBRARY_SORTS, LIBRARY_TABLES, get_movie_details_by_id, get_tv_show_details_by_id, get_media_file, scan_and_update_library
 import tracker_manager
+import tmdb_client
+from media_streaming import resolve_library_path, stream_file
+import hls_transcoder
+import image_cache
+import search_orchestrator
+import playback_telemetry
 
 # --- Logging and App Initialization ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,9 +27,6 @@ app = Flask(__name__)
 app.secret_key = os.urandom(24)
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=30)
 
-# --- Caching Configuration ---
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
-
 # --- Configuration Management ---
 CONFIG_FILE = 'config.json'
 
@@ -35,6 +41,79 @@ def load_config():
 config = load_config()
 app.config.update(config)
 
+# --- Caching Configuration ---
+# On disk so every worker process shares one copy. Library reads are keyed on the library
+# version (database.get_library_version) and the build, so entries from before a scan or a
+# deploy are never served.
+cache = Cache(app, config={
+    'CACHE_TYPE': 'FileSystemCache',
+    'CACHE_DIR': config.get('RESPONSE_CACHE_DIR') or 'response_cache',
+    'CACHE_DEFAULT_TIMEOUT': 3600,
+    'CACHE_THRESHOLD': 5000,
+})
+
+def _build_id():
+    """
+    Fingerprints the app's modules and templates by name, size and mtime, so every worker of one
+    deploy computes the same value and the next deploy a different one.
+    """
+    files = [os.path.join(app.root_path, name) for name in os.listdir(app.root_path) if name.endswith('.py')]
+    for dirpath, _, filenames in os.walk(os.path.join(app.root_path, app.template_folder)):
+        files.extend(os.path.join(dirpath, name) for name in filenames)
+    digest = hashlib.sha1()
+    for path in sorted(files):
+        stat = os.stat(path)
+        digest.update(f"{os.path.relpath(path, app.root_path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:12]
+
+BUILD_ID = config.get('BUILD_ID') or _build_id()
+
+def library_version():
+    """The library version, read once per request."""
+    if 'library_version' not in g:
+        g.library_version = database.get_library_version()
+    return g.library_version
+
+def library_cached(func):
+    """Memoizes a library read in the shared cache, keyed on the library version as well as the arguments."""
+    def at_version(version, *args, **kwargs):
+        return func(*args, **kwargs)
+    # memoize keys on the function's module and name, so each wrapped read needs its own.
+    at_version.__module__, at_version.__qualname__ = func.__module__, func.__qualname__
+    at_version = cache.memoize()(at_version)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        version = library_version()
+        if version is None:
+            return func(*args, **kwargs)
+        return at_version(f"{BUILD_ID}-{version}", *args, **kwargs)
+    return wrapper
+
+cached_library_page = library_cached(get_library_page)
+cached_library_movies = library_cached(get_library_movies)
+cached_library_tv_shows = library_cached(get_library_tv_shows)
+cached_movie_details = library_cached(get_movie_details_by_id)
+cached_tv_show_details = library_cached(get_tv_show_details_by_id)
+
+def library_etag_response(render):
+    """
+    Answers 304 when the client's copy was rendered for the same user at the current library
+    version by the same build, otherwise calls render(). Pending flash messages always get a fresh page.
+    """
+    version = library_version()
+    if version is None or session.get('_flashes'):
+        return render()
+    etag = f"lib-{BUILD_ID}-{version}-{current_user.id}-{current_user.role}"
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 # --- User Authentication ---
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -68,18 +147,112 @@ def admin_required(f):
 # --- Initialization ---
 with app.app_context():
     database.init_db()
+    rh.migrate_requests_file()
     start_media_scanner(app)
+    hls_transcoder.configure(cache_dir=config.get('HLS_CACHE_DIR'), cache_max_bytes=config.get('HLS_CACHE_MAX_BYTES'),
+                             ffmpeg=config.get('FFMPEG_PATH'), ffprobe=config.get('FFPROBE_PATH'), workers=config.get('HLS_WORKERS'))
+    image_cache.configure(cache_dir=config.get('IMAGE_CACHE_DIR'), cache_max_bytes=config.get('IMAGE_CACHE_MAX_BYTES'),
+                          origin=config.get('IMAGE_ORIGIN'))
 
 # --- Main Routes ---
 @app.route('/')
 @login_required
 def index():
-    return render_template('index.html',
-                           recent_movies=get_library_movies(sort_by='added', limit=12),
-                           recent_tv=get_library_tv_shows(sort_by='added', limit=12))
+    return library_etag_response(lambda: render_template('index.html',
+                                                         recent_movies=cached_library_movies(sort_by='added', limit=12),
+                                                         recent_tv=cached_library_tv_shows(sort_by='added', limit=12)))
 
 # ... (login, signup, logout routes remain the same) ...
 
+# --- Library ---
+def _library_sort():
+    sort_by = request.args.get('sort', 'title')
+    return sort_by if sort_by in LIBRARY_SORTS else 'title'
+
+def _library_next_url(media_type, sort_by, next_cursor):
+    return url_for('library_api', media_type=media_type, sort=sort_by, cursor=next_cursor) if next_cursor else None
+
+def _library_page(media_type, title):
+    """Renders the first page; the template fetches the rest from library_api as the user scrolls."""
+    sort_by = _library_sort()
+    def render():
+        page = cached_library_page(media_type, sort_by)
+        return render_template('library_page.html', title=title, media_type=media_type, items=page['items'], sort_by=sort_by,
+                               next_url=_library_next_url(media_type, sort_by, page['next_cursor']))
+    return library_etag_response(render)
+
+@app.route('/movies')
+@login_required
+def movies_library():
+    return _library_page('movie', 'Movies')
+
+@app.route('/tv')
+@login_required
+def tv_shows_library():
+    return _library_page('tv', 'TV Shows')
+
+@app.route('/api/library/<media_type>')
+@login_required
+def library_api(media_type):
+    """One keyset page of the library as JSON: ?sort=title|added&cursor=...&limit=N."""
+    if media_type not in LIBRARY_TABLES:
+        abort(404)
+    sort_by = _library_sort()
+    try:
+        page = cached_library_page(media_type, sort_by, request.args.get('cursor'), request.args.get('limit', LIBRARY_PAGE_SIZE, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    def render():
+        for item in page['items']:
+            item['poster'] = image_url(item['poster'], 'thumb')
+            item['detail_url'] = (url_for('movie_detail_page', movie_id=item['id']) if media_type == 'movie'
+                                  else url_for('tv_show_detail_page', show_id=item['id']))
+        return jsonify({'items': page['items'], 'next_cursor': page['next_cursor'],
+                        'next_url': _library_next_url(media_type, sort_by, page['next_cursor'])})
+    return library_etag_response(render)
+
+@app.route('/movie/<movie_id>')
+@login_required
+def movie_detail_page(movie_id):
+    movie = cached_movie_details(movie_id)
+    if movie is None:
+        abort(404)
+    return library_etag_response(lambda: render_template('movie_detail.html', movie=movie))
+
+@app.route('/tv_show/<show_id>')
+@login_required
+def tv_show_detail_page(show_id):
+    show = cached_tv_show_details(show_id)
+    if show is None:
+        abort(404)
+    return library_etag_response(lambda: render_template('tv_show_detail.html', show=show))
+
+# --- Images ---
+@app.template_filter('image_url')
+def image_url(url, variant='thumb'):
+    """Points a stored TMDb image URL at the local image proxy; anything else is left alone."""
+    filename = image_cache.tmdb_filename(url)
+    return url_for('image_proxy', variant=variant, filename=filename) if filename else url
+
+@app.route('/img/<variant>/<filename>')
+@login_required
+def image_proxy(variant, filename):
+    if variant not in image_cache.VARIANTS or not image_cache.is_valid_filename(filename):
+        abort(404)
+    try:
+        cached = image_cache.get_image(variant, filename)
+        if cached is None:
+            abort(404)
+        path, size = cached
+        # TMDb never changes the image behind a file name, so a variant can be cached for good.
+        response = send_file(path, conditional=True, etag=f"{variant}-{filename}-{size:x}", max_age=image_cache.IMMUTABLE_MAX_AGE)
+    except (image_cache.ImageError, OSError) as e:
+        # Includes a disk error or the file being evicted by another worker before it was sent.
+        logging.warning(f"Image proxy falling back to the origin: {e}")
+        return redirect(image_cache.origin_url(variant, filename))
+    response.cache_control.immutable = True
+    return response
+
 # --- Control Panel (Admin Only) ---
 @app.route('/control')
 @admin_required
@@ -130,6 +303,26 @@ def control_settings():
                            btn_conf=btn_conf,
                            ptp_conf=ptp_conf)
 
+@app.route('/control/tmdb_stats')
+@admin_required
+def tmdb_stats():
+    return jsonify(tmdb_client.get_stats())
+
+@app.route('/control/playback_stats')
+@admin_required
+def playback_stats():
+    return jsonify(playback_telemetry.get_stats())
+
+@app.route('/control/image_stats')
+@admin_required
+def image_stats():
+    return jsonify(image_cache.get_stats())
+
+@app.route('/control/poster_stats')
+@admin_required
+def poster_stats():
+    return jsonify(rh.get_poster_stats())
+
 # --- Statistics (Admin Only) ---
 @app.route('/statistics')
 @admin_required
@@ -141,10 +334,174 @@ def statistics_page():
     }
     return render_template('statistics.html', stats=stats)
 
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recomputes the statistics rollups from playback history and the library."""
+    if not database.rebuild_statistics():
+        raise SystemExit(1)
+    print("Statistics rollups rebuilt.")
+
+@app.cli.command('scan')
+@click.option('--full', is_flag=True, help="Stat every file, ignoring the stored directory fingerprints.")
+def scan_command(full):
+    """Scans the library now, waiting for any scan that is already running."""
+    stats = scan_and_update_library(full=full, wait=True)
+    print(f"Library scan finished: {stats.summary()}")
+
 # ... (other routes like search, libraries, details, player remain the same) ...
 
+# --- Search ---
+@app.route('/search', methods=['GET'])
+@login_required
+def search():
+    query = request.args.get('query', '')
+    if not query:
+        return redirect(url_for('index'))
+
+    # Jackett sources start first and run in the background; the page streams them in from /search/stream.
+    job = search_orchestrator.start_search(query, config)
+    started = time.monotonic()
+    library_results = database.search_library(query)
+    logging.info(f"Search '{query}': library done in {(time.monotonic() - started) * 1000:.0f} ms")
+
+    return render_template('search_results.html',
+                           query=query,
+                           library_results=library_results,
+                           remote_search_url=url_for('search_stream', job=job.id, query=query) if job else None)
+
+@app.route('/search/stream')
+@login_required
+def search_stream():
+    query = request.args.get('query', '')
+    # A job started by another worker process (or one that expired) is simply run again here.
+    job = search_orchestrator.take_search(request.args.get('job')) or search_orchestrator.start_search(query, config)
+    if job is None:
+        return jsonify({'error': 'No search sources configured'}), 404
+    return Response(search_orchestrator.event_stream(job), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Streaming ---
+@app.route('/stream/<path:file_path>')
+@login_required
+def stream_media(file_path):
+    path = resolve_library_path(file_path, [config.get('MOVIE_DIR'), config.get('TV_DIR')])
+    if path is None:
+        abort(404)
+    return stream_file(path)
+
+def _library_media_path(media_id):
+    """Resolves a movie/episode id to its file, refusing anything outside the library roots."""
+    path, _ = get_media_file(media_id)
+    if path is None:
+        return None
+    return resolve_library_path(path, [config.get('MOVIE_DIR'), config.get('TV_DIR')])
+
+@app.route('/player')
+@login_required
+def player():
+    stream_url = request.args.get('stream_url')
+    media_id = request.args.get('media_id')
+    media_type = request.args.get('media_type')
+    hls_url = None
+    if media_id and not stream_url:
+        path = _library_media_path(media_id)
+        if path is None:
+            abort(404)
+        stream_url = url_for('stream_media', file_path=path.lstrip('/'))
+        if hls_transcoder.needs_hls(path):
+            hls_url = url_for('hls_playlist', media_id=media_id)
+    if not stream_url:
+        return "No stream URL provided", 400
+    resume_position = playback_telemetry.get_resume_position(current_user.id, media_id) if media_id else None
+    return render_template('player.html', stream_url=stream_url, hls_url=hls_url, media_id=media_id, media_type=media_type,
+                           resume_position=resume_position)
+
+@app.route('/log_play', methods=['POST'])
+@login_required
+def log_play():
+    """Player telemetry: a 'play' when playback starts, 'progress' heartbeats with the current position."""
+    data = request.get_json(silent=True, force=True) or {}
+    media_id = data.get('media_id')
+    media_type = data.get('media_type')
+    if not media_id or media_type not in ('movie', 'tv'):
+        return jsonify({'status': 'error', 'message': 'media_id and media_type are required'}), 400
+    if data.get('event', 'play') == 'play':
+        playback_telemetry.record_play(current_user.id, media_id, media_type)
+    try:
+        position = float(data['position'])
+        duration = float(data['duration']) if data.get('duration') else None
+    except (KeyError, TypeError, ValueError):
+        position = None
+    if position is not None and position >= 0:
+        playback_telemetry.record_progress(current_user.id, media_id, media_type, position, duration)
+    return jsonify({'status': 'success'})
+
+@app.route('/hls/<media_id>/index.m3u8')
+@login_required
+def hls_playlist(media_id):
+    path = _library_media_path(media_id)
+    if path is None:
+        abort(404)
+    try:
+        playlist = hls_transcoder.get_playlist(media_id, path)
+    except hls_transcoder.HlsError as e:
+        logging.error(f"HLS playlist for {media_id} failed: {e}")
+        abort(503)
+    return Response(playlist, mimetype='application/vnd.apple.mpegurl', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/hls/<media_id>/<int:index>.ts')
+@login_required
+def hls_segment(media_id, index):
+    path = _library_media_path(media_id)
+    if path is None:
+        abort(404)
+    try:
+        segment_path = hls_transcoder.get_segment(media_id, path, index)
+        # Another worker can evict the segment between the lookup and here.
+        return send_file(segment_path, mimetype='video/mp2t', conditional=True, max_age=3600)
+    except IndexError:
+        abort(404)
+    except (hls_transcoder.HlsError, OSError) as e:
+        logging.error(f"HLS segment {index} for {media_id} failed: {e}")
+        abort(503)
+
 @app.route('/requests')
 @login_required
 def requests_page():
-    return render_template('requests.html', requests=rh.load_requests())
+    # Each list pages on its own: ?movie_pending=2&tv_approved=3
+    pages = {f"{media_type}_{status}": request.args.get(f"{media_type}_{status}", 1, type=int)
+             for media_type in rh.MEDIA_TYPES for status in ('pending', 'approved')}
+    return render_template('requests.html', requests=rh.get_request_pages(pages))
+
+@app.route('/requests/add', methods=['POST'])
+@login_required
+def add_request_route():
+    media_type = request.form.get('media_type')
+    title = request.form.get('title', '').strip()
+    if rh.add_request(media_type, title, current_user.username):
+        flash(f"Requested '{title}'.", 'success')
+    else:
+        flash(f"'{title}' has already been requested.", 'error')
+    return redirect(request.referrer or url_for('requests_page'))
+
+@app.route('/requests/approve/<media_type>/<path:title>', methods=['POST'])
+@admin_required
+def approve_request_route(media_type, title):
+    if not rh.approve_request(media_type, title, current_user.username):
+        flash(f"No pending request for '{title}'.", 'error')
+    return redirect(request.referrer or url_for('requests_page'))
+
+@app.route('/requests/deny/<media_type>/<path:title>', methods=['POST'])
+@admin_required
+def deny_request_route(media_type, title):
+    if not rh.deny_request(media_type, title, current_user.username):
+        flash(f"No pending request for '{title}'.", 'error')
+    return redirect(request.referrer or url_for('requests_page'))
+
+@app.route('/requests/history/<media_type>/<path:title>')
+@login_required
+def request_history_route(media_type, title):
+    if media_type not in rh.MEDIA_TYPES:
+        abort(404)
+    return jsonify(rh.get_request_history(media_type, title))
 
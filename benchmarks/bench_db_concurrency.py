@@ -0,0 +1,133 @@
+# benchmarks/bench_db_concurrency.py
+"""
+Measures page-style read latency while a library scan is writing.
+
+    python benchmarks/bench_db_concurrency.py [seconds] [reader_threads]
+
+Runs twice against a fresh database each time:
+  legacy  - a new connection per call on the default rollback journal (the old behaviour)
+  pooled  - database.get_db_connection() (pooled connections, WAL, tuned pragmas)
+A writer thread commits batches of movie upserts like media_scanner._BatchWriter while reader
+threads call load_user's query and search_library. Reports latency percentiles per call and the
+number of reads that failed (e.g. "database is locked").
+"""
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from threading import Event, Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database
+
+SEED_MOVIES = 5_000
+WRITE_BATCH_SIZE = 50
+WRITE_PAUSE_SECONDS = 0.02  # a real scan waits on TMDb between batches
+WORDS = 'night city dark river star lost king queen blood storm shadow ocean fire winter'.split()
+
+class _ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def _legacy_connection():
+    conn = sqlite3.connect(database.DB_NAME)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+def _movie_row(rng, i):
+    title = ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 3)))
+    return (str(uuid.uuid4()), title, f"/bench/movie{i}.mkv", '["Drama"]', 1950 + i % 75,
+            ' '.join(f"word{rng.randrange(20_000)}" for _ in range(30)), time.time())
+
+UPSERT_MOVIE = """
+    INSERT INTO movies (id, title, path, genre, year, overview, last_modified) VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET title = excluded.title, overview = excluded.overview, last_modified = excluded.last_modified
+"""
+
+def _writer(stop, counts):
+    rng = random.Random(1)
+    conn = database.get_db_connection()
+    try:
+        while not stop.is_set():
+            try:
+                with conn:
+                    conn.executemany(UPSERT_MOVIE, [_movie_row(rng, rng.randrange(SEED_MOVIES * 2)) for _ in range(WRITE_BATCH_SIZE)])
+                counts['batches'] += 1
+            except sqlite3.OperationalError:
+                counts['write_errors'] += 1
+            stop.wait(WRITE_PAUSE_SECONDS)
+    finally:
+        conn.close()
+
+def _reader(stop, timings, seed):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        started = time.perf_counter()
+        if rng.random() < 0.5:
+            database.get_user_by_id(1)
+            timings['load_user'].append((time.perf_counter() - started) * 1000)
+        else:
+            database.search_library(rng.choice(WORDS) + ' ' + rng.choice(WORDS))
+            timings['search'].append((time.perf_counter() - started) * 1000)
+
+def run(mode, seconds, readers):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DB_NAME = os.path.join(tmp, f'{mode}.db')
+        original = database.get_db_connection
+        if mode == 'legacy':
+            database.get_db_connection = _legacy_connection
+        try:
+            database.init_db()
+            if mode == 'legacy':
+                with sqlite3.connect(database.DB_NAME) as conn:
+                    conn.execute("PRAGMA journal_mode = DELETE")
+            rng = random.Random(0)
+            conn = database.get_db_connection()
+            with conn:
+                conn.executemany(UPSERT_MOVIE, [_movie_row(rng, i) for i in range(SEED_MOVIES)])
+            conn.close()
+
+            errors = _ErrorCounter()
+            logging.getLogger().addHandler(errors)
+            stop = Event()
+            counts = {'batches': 0, 'write_errors': 0}
+            timings = [{'load_user': [], 'search': []} for _ in range(readers)]
+            threads = [Thread(target=_writer, args=(stop, counts))]
+            threads += [Thread(target=_reader, args=(stop, timings[i], i)) for i in range(readers)]
+            for thread in threads:
+                thread.start()
+            time.sleep(seconds)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            logging.getLogger().removeHandler(errors)
+        finally:
+            database.get_db_connection = original
+            database.close_all_connections()
+
+    print(f"{mode}: {counts['batches']} write batches ({counts['write_errors']} failed), {errors.count} failed reads")
+    for name in ('load_user', 'search'):
+        samples = sorted(t for reader in timings for t in reader[name])
+        pct = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))]
+        print(f"  {name:>9}: {len(samples):6d} calls  p50 {pct(0.5):6.2f} ms  p95 {pct(0.95):6.2f} ms  "
+              f"p99 {pct(0.99):7.2f} ms  max {samples[-1]:7.1f} ms")
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    logging.getLogger().setLevel(logging.ERROR)
+    for mode in ('legacy', 'pooled'):
+        run(mode, seconds, readers)
+
+if __name__ == '__main__':
+    main()
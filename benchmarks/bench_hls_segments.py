@@ -0,0 +1,45 @@
+# benchmarks/bench_hls_segments.py
+"""
+Exercises hls_transcoder against a local sample file with the real ffmpeg/ffprobe.
+
+    python benchmarks/bench_hls_segments.py path/to/sample.mkv [segments]
+
+Uses a throwaway cache directory and reports the time to build the playlist, a cold segment,
+the same segment from cache, and the next segment after prefetch had a chance to run.
+static/videos/*.mp4 works as a small sample.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hls_transcoder
+
+def _timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:>28}: {(time.perf_counter() - started) * 1000:8.1f} ms")
+    return result
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    path = os.path.abspath(sys.argv[1])
+    segments = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    with tempfile.TemporaryDirectory() as tmp:
+        hls_transcoder.configure(cache_dir=tmp)
+        print(f"needs_hls: {hls_transcoder.needs_hls(path)}")
+        playlist = _timed('playlist', hls_transcoder.get_playlist, 'sample', path)
+        count = playlist.count('#EXTINF')
+        print(f"{count} segments, mode {'remux' if hls_transcoder._manager.sessions['sample'].remux else 'transcode'}")
+        for index in range(min(segments, count)):
+            if index:
+                time.sleep(hls_transcoder.SEGMENT_SECONDS / 2)  # roughly how long a player takes to want the next one
+            segment = _timed(f"segment {index} (first request)", hls_transcoder.get_segment, 'sample', path, index)
+            _timed(f"segment {index} (cached)", hls_transcoder.get_segment, 'sample', path, index)
+            print(f"{'':>28}  {os.path.getsize(segment)} bytes")
+        print(hls_transcoder.get_stats()['cache'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_library_search.py
+"""
+Times database.search_library against a synthetic library.
+
+    python benchmarks/bench_library_search.py [item_count]
+
+Builds a throwaway database with item_count movies and shows (default 100,000)
+and reports the latency of typical queries. The target is under 10 ms per search.
+"""
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import database
+
+# A long tail of generated words drawn with Zipf-like weights, with the recognisable query words
+# placed mid-table, so term frequencies look like real titles and overviews rather than uniform noise.
+COMMON_WORDS = ('night city dark river star lost king queen blood storm shadow ocean fire winter summer '
+                'ghost machine empire island secret garden silent broken golden last first wild hidden').split()
+GENERATED_WORDS = [f"{a}{b}{c}{d}" for a in 'bcdfgklmnprstvz' for b in 'aeiou' for c in ('r', 'l', 'n', 'st', 'v', 'k', 'd', 'm')
+                   for d in ('a', 'en', 'ion', 'ar', 'is', 'o', 'et', 'um', 'ia', 'ok', 'ed', 'y')]
+VOCABULARY = GENERATED_WORDS[:200] + COMMON_WORDS + GENERATED_WORDS[200:]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (rank + 50) for rank in range(len(VOCABULARY))))
+NAMES = ('Anna Ben Carla David Emma Frank Grace Henry Iris Jack Kate Leo Maya Noah Olga Paul').split()
+GENRES = ('Drama', 'Comedy', 'Action', 'Thriller', 'Horror', 'Documentary', 'Animation', 'Romance')
+QUERIES = ('night', 'dark riv', 'golden empire', 'anna', 'thriller storm', 'zzz no match')
+
+def _words(rng, count):
+    return rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=count)
+
+def _title(rng):
+    return ' '.join(word.capitalize() for word in _words(rng, rng.randint(1, 4)))
+
+def _cast(rng):
+    return json.dumps([{'name': f"{rng.choice(NAMES)} {_words(rng, 1)[0].capitalize()}", 'character': '', 'profile_path': None} for _ in range(5)])
+
+def build_library(item_count):
+    rng = random.Random(42)
+    conn = database.get_db_connection()
+    with conn:
+        cursor = conn.cursor()
+        for i in range(item_count):
+            table = 'movies' if i % 2 else 'shows'
+            overview = ' '.join(_words(rng, 30))
+            genre = json.dumps(rng.sample(GENRES, 2))
+            if table == 'movies':
+                cursor.execute("INSERT INTO movies (id, title, path, genre, year, overview, cast) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (str(uuid.uuid4()), _title(rng), f"/bench/movie{i}.mkv", genre, 1950 + i % 75, overview, _cast(rng)))
+            else:
+                cursor.execute("INSERT INTO shows (id, tmdb_id, title, genre, overview, cast) VALUES (?, ?, ?, ?, ?, ?)",
+                               (str(uuid.uuid4()), str(i), _title(rng), genre, overview, _cast(rng)))
+    conn.close()
+
+def main():
+    item_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        started = time.perf_counter()
+        build_library(item_count)
+        print(f"Indexed {item_count} items in {time.perf_counter() - started:.1f}s")
+
+        for query in QUERIES:
+            timings = []
+            for _ in range(20):
+                started = time.perf_counter()
+                hits = database.search_library(query)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            print(f"{query!r:>18}: {len(hits):3d} hits, median {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms")
+
+if __name__ == '__main__':
+    main()
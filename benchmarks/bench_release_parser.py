@@ -0,0 +1,81 @@
+# benchmarks/bench_release_parser.py
+"""
+Checks release_parser against the labelled names in release_corpus.json and times it against
+the old media_scanner.parse_filename regex passes.
+
+    python benchmarks/bench_release_parser.py [names]
+"""
+import json
+import os
+import re
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+import release_parser
+
+def legacy_parse_filename(filename):
+    """media_scanner.parse_filename before release_parser, kept here for comparison."""
+    title = os.path.basename(filename)
+    year = season = episode = None
+    year_match = re.search(r'\(?(\d{4})\)?', title)
+    if year_match:
+        year = int(year_match.group(1))
+        title = title.replace(year_match.group(0), '').strip()
+    se_match = re.search(r'[._\s-]([Ss](\d{1,2})[._\s-]*[Ee](\d{1,2}))[._\s-]', title, re.IGNORECASE)
+    if se_match:
+        season, episode = int(se_match.group(2)), int(se_match.group(3))
+        title = re.split(r'[._\s-][Ss]\d{1,2}[._\s-]*[Ee]\d{1,2}', title, flags=re.IGNORECASE)[0]
+    title = re.sub(r'\b(1080p|720p|WEB-DL|BluRay|x264|H264|DDP5.1|Atmos|REPACK|PRSRPNT|T3STDRV|Dolf4c3)\b.*', '', title, flags=re.IGNORECASE)
+    title = title.replace('.', ' ').replace('_', ' ').strip()
+    return {'title': title, 'year': year, 'season': season, 'episode': episode}
+
+def accuracy(parse, corpus, fields=None):
+    """(names fully right, field checks right, field checks made, failures)."""
+    names_right = checks_right = checks = 0
+    failures = []
+    for name, expected in corpus:
+        parsed = parse(name)
+        wrong = {field: parsed.get(field) for field, value in expected.items()
+                 if (fields is None or field in fields) and parsed.get(field) != value}
+        checked = sum(1 for field in expected if fields is None or field in fields)
+        checks += checked
+        checks_right += checked - len(wrong)
+        names_right += not wrong
+        if wrong:
+            failures.append((name, wrong))
+    return names_right, checks_right, checks, failures
+
+def names_per_second(parse_batch, names):
+    started = time.perf_counter()
+    parse_batch(names)
+    return len(names) / (time.perf_counter() - started)
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    with open(os.path.join(HERE, 'release_corpus.json')) as f:
+        corpus = json.load(f)
+
+    basic = ('title', 'year', 'season', 'episode')
+    for label, parse, fields in (('legacy parse_filename', legacy_parse_filename, basic),
+                                 ('release_parser (basic)', release_parser.parse, basic),
+                                 ('release_parser (all)', release_parser.parse, None)):
+        names_right, checks_right, checks, failures = accuracy(parse, corpus, fields)
+        print(f"{label:>24}: {names_right}/{len(corpus)} names, {checks_right}/{checks} fields right")
+        if parse is release_parser.parse and fields is None:
+            for name, wrong in failures:
+                print(f"{'':>26}{name}: {wrong}")
+
+    # Distinct names (a fresh group suffix each), so the per-name cache never helps.
+    names = [f"{name}-B{i}" for i in range(count // len(corpus) + 1) for name, _ in corpus][:count]
+    uncached = release_parser._parse.__wrapped__
+    print(f"{'legacy parse_filename':>24}: {names_per_second(lambda batch: [legacy_parse_filename(n) for n in batch], names):9,.0f} names/s")
+    print(f"{'release_parser.parse':>24}: {names_per_second(lambda batch: [uncached(n) for n in batch], names):9,.0f} names/s")
+    # A rescan or repeated feed sees the same names again; parse_many parses each distinct one once.
+    repeated = [name for name, _ in corpus] * (count // len(corpus))
+    release_parser._parse.cache_clear()
+    print(f"{'parse_many (repeats)':>24}: {names_per_second(release_parser.parse_many, repeated):9,.0f} names/s")
+
+if __name__ == '__main__':
+    main()
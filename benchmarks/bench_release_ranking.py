@@ -0,0 +1,52 @@
+# benchmarks/bench_release_ranking.py
+"""
+Times release_ranking.rank_releases against the old approach (collect everything, full sort
+by seeders) on synthetic results from many trackers with heavy overlap between them.
+
+    python benchmarks/bench_release_ranking.py [trackers] [results_per_tracker] [k]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models import SearchResult
+from release_ranking import rank_releases
+
+RESOLUTIONS = ('2160p', '1080p', '720p', '480p', '')
+SOURCES = ('REMUX', 'BluRay', 'WEB-DL', 'WEBRip', 'HDTV', 'CAM')
+
+def synthetic_results(trackers, per_tracker, seed=1):
+    rng = random.Random(seed)
+    releases = [(f"Some.Movie.2017.{rng.choice(RESOLUTIONS)}.{rng.choice(SOURCES)}.x264-GRP{i}", f"{i:040x}",
+                 rng.randint(100, 60000) * 1024 * 1024, int(rng.paretovariate(1.2) * 20)) for i in range(per_tracker * 3)]
+    results = []
+    for t in range(trackers):
+        for title, infohash, size, swarm in rng.sample(releases, per_tracker):
+            if rng.random() < 0.3:
+                title, infohash = title.replace('.', ' '), None  # HTML trackers: no hash, different separators
+            seeders = None if rng.random() < 0.05 else int(swarm * rng.uniform(0.8, 1.2))  # same swarm, per-tracker view
+            results.append(SearchResult(title, f"link-{t}", size, seeders, infohash=infohash, tracker=f"tracker{t}"))
+    return results
+
+def main():
+    trackers = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    per_tracker = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    results = synthetic_results(trackers, per_tracker)
+    print(f"{len(results)} results from {trackers} trackers")
+
+    started = time.perf_counter()
+    old = sorted(results, key=lambda result: result.seeders or 0, reverse=True)[:k]
+    print(f"{'full sort by seeders':>22}: {(time.perf_counter() - started) * 1000:7.1f} ms, "
+          f"{len({result.title.replace(' ', '.') for result in old})} distinct in top {k}")
+
+    started = time.perf_counter()
+    shortlist = rank_releases(results, k)
+    print(f"{'rank_releases':>22}: {(time.perf_counter() - started) * 1000:7.1f} ms, {len(shortlist)} distinct in top {k}")
+    for release in shortlist[:5]:
+        print(f"{release.score:8.1f}  {release.title}  seeders={release.seeders}  trackers={len(release.trackers)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_rescan.py
+"""
+Times a library rescan in which nothing has changed, with and without directory fingerprints.
+
+    python benchmarks/bench_rescan.py [file_count]
+
+Builds a throwaway library tree of file_count empty .mkv files (default 40,000, 20 per
+directory) and a throwaway database. TMDb lookups are replaced by a fixed record, so only the
+walk and the change check are timed. The old walk (os.walk, then getmtime and a UNION ALL
+lookup per file) is kept here for comparison.
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from flask import Flask
+import database
+import media_scanner
+
+FILES_PER_DIR = 20
+
+def build_tree(root, file_count):
+    for i in range(file_count):
+        directory = os.path.join(root, f"group{i // 2000:03d}", f"title{i // FILES_PER_DIR:05d}")
+        os.makedirs(directory, exist_ok=True)
+        open(os.path.join(directory, f"Title.{i // FILES_PER_DIR}.Part{i % FILES_PER_DIR}.2020.1080p.mkv"), 'w').close()
+
+def fake_record(path, parsed, current_mtime, is_tv, memo=None):
+    """Stands in for the TMDb lookup."""
+    return ('movies', (str(uuid.uuid4()), parsed['title'], path, '[]', parsed['year'], None, None, None, None,
+                       str(uuid.uuid4()), current_mtime, '[]', '[]'))
+
+def legacy_rescan(root):
+    """The walk and change check before fingerprints: one stat and one query per file."""
+    conn = database.get_db_connection()
+    changed = 0
+    try:
+        cursor = conn.cursor()
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                if not name.lower().endswith(media_scanner.VIDEO_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, name)
+                current_mtime = os.path.getmtime(path)
+                cursor.execute("SELECT last_modified FROM movies WHERE path = ? UNION ALL SELECT last_modified FROM episodes WHERE path = ?", (path, path))
+                result = cursor.fetchone()
+                changed += not (result and result['last_modified'] == current_mtime)
+    finally:
+        conn.close()
+    return changed
+
+def timed(label, scan):
+    started = time.perf_counter()
+    result = scan()
+    print(f"{label:>28}: {(time.perf_counter() - started) * 1000:8.1f} ms")
+    return result
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 40_000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, 'bench.db')
+        database.init_db()
+        root = os.path.join(tmp, 'Movies')
+        build_tree(root, file_count)
+        app = Flask(__name__)
+        app.config.update(MOVIE_DIR=root, SCAN_WORKERS=4)
+        media_scanner.app_instance = app
+        media_scanner.fetch_media_record = fake_record
+
+        stats = timed('initial scan', media_scanner.scan_and_update_library)
+        print(f"{'':>30}{stats.summary()}")
+        # Let the directory mtimes fall outside the racy window before fingerprinting them again.
+        time.sleep(media_scanner.MTIME_GRANULARITY_NS / 1e9)
+        media_scanner.scan_and_update_library()
+
+        timed('no-op rescan, old walk', lambda: legacy_rescan(root))
+        stats = timed('no-op rescan, full', lambda: media_scanner.scan_and_update_library(full=True))
+        print(f"{'':>30}{stats.summary()}")
+        time.sleep(media_scanner.MTIME_GRANULARITY_NS / 1e9)
+        media_scanner.scan_and_update_library()
+        stats = timed('no-op rescan, fingerprints', media_scanner.scan_and_update_library)
+        print(f"{'':>30}{stats.summary()}")
+
+        new_file = os.path.join(root, 'group000', 'title00003', 'Added.Later.2021.mkv')
+        open(new_file, 'w').close()
+        stats = timed('rescan after adding a file', media_scanner.scan_and_update_library)
+        print(f"{'':>30}{stats.summary()}")
+        assert stats.files_changed == 1 and stats.records_written == 1
+
+if __name__ == '__main__':
+    main()
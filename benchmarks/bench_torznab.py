@@ -0,0 +1,72 @@
+# benchmarks/bench_torznab.py
+"""
+Compares the old whole-document Torznab parsing (ET.fromstring + findall) with torznab.py.
+
+    python benchmarks/bench_torznab.py [feed.xml | item_count] [limit]
+
+Without a recorded feed a synthetic Jackett-style feed is generated (5000 items by default).
+Reports wall time and peak traced memory for the old parse, a full streaming parse and a
+streaming parse that stops after `limit` items (50 by default).
+"""
+import os
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import torznab
+
+def synthetic_feed(count):
+    items = []
+    for i in range(count):
+        items.append(
+            f'<item><title>Some.Movie.{1990 + i % 30}.1080p.BluRay.x264-GRP{i}</title>'
+            f'<guid>https://tracker.example/details/{i}</guid><jackettindexer id="x">Example</jackettindexer>'
+            f'<comments>https://tracker.example/details/{i}</comments><pubDate>Mon, 01 Jan 2024 00:00:00 +0000</pubDate>'
+            f'<size>{1_000_000_000 + i}</size><description>{"Lorem ipsum dolor sit amet. " * 8}</description>'
+            f'<link>https://jackett.example/dl/{i}</link><category>2000</category><category>2040</category>'
+            f'<enclosure url="https://jackett.example/dl/{i}" length="{1_000_000_000 + i}" type="application/x-bittorrent" />'
+            f'<torznab:attr name="category" value="2000" /><torznab:attr name="seeders" value="{i % 500}" />'
+            f'<torznab:attr name="peers" value="{i % 700}" /><torznab:attr name="grabs" value="{i}" />'
+            f'<torznab:attr name="infohash" value="{i:040X}" /><torznab:attr name="imdbid" value="{1000000 + i}" />'
+            f'<torznab:attr name="minimumratio" value="1" /><torznab:attr name="minimumseedtime" value="172800" />'
+            f'<torznab:attr name="downloadvolumefactor" value="0" /><torznab:attr name="uploadvolumefactor" value="1" /></item>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            f'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:torznab="{torznab.TORZNAB_NS}">'
+            '<channel><title>Example</title>' + ''.join(items) + '</channel></rss>').encode('utf-8')
+
+def old_parse(data, limit=None):
+    """What api.py and request_handler.py did before: build the whole tree, then walk it."""
+    root = ET.fromstring(data)
+    results = []
+    for item in root.findall('.//item'):
+        attrs = {attr.get('name'): attr.get('value') for attr in item.findall(f'{{{torznab.TORZNAB_NS}}}attr')}
+        results.append({'title': item.findtext('title'), 'link': item.findtext('link'),
+                        'size': item.findtext('size'), 'seeders': attrs.get('seeders')})
+    return results[:limit]
+
+def _measure(label, func, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    items = func(*args)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:>24}: {elapsed_ms:8.1f} ms  peak {peak / 1024 / 1024:7.2f} MiB  {len(items)} items")
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 else '5000'
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    if source.isdigit():
+        data = synthetic_feed(int(source))
+    else:
+        with open(source, 'rb') as f:
+            data = f.read()
+    print(f"feed: {len(data) / 1024 / 1024:.2f} MiB")
+    _measure('ET.fromstring + findall', old_parse, data)
+    _measure('torznab.parse', torznab.parse, data)
+    _measure(f'torznab.parse limit={limit}', torznab.parse, data, limit)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# benchmarks/bench_watchlist.py
+"""
+Times one watchlist add and one remove against lists of growing size: the old whole-file JSON
+round trip (decode everything, append/filter, rewrite with indent=4) versus WatchlistStore.
+
+    python benchmarks/bench_watchlist.py [sizes...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from models import Movie, Show, json_decoder, json_encoder
+from watchlist_manager import WatchlistStore
+
+def _json_add(path, item):
+    with open(path) as f:
+        data = json.load(f, object_hook=json_decoder)
+    data["movies"].append(item)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4, default=json_encoder)
+
+def _json_remove(path, title):
+    with open(path) as f:
+        data = json.load(f, object_hook=json_decoder)
+    data["movies"] = [m for m in data["movies"] if m.title.lower() != title.lower()]
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4, default=json_encoder)
+
+def _ms(func, *args, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(*args)
+    return (time.perf_counter() - started) * 1000 / repeat
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000]
+    print(f"{'items':>8} {'json add':>10} {'json remove':>12} {'store add':>10} {'store remove':>13}")
+    for size in sizes:
+        movies = [Movie(f"Movie {i}", f"tt{i:07d}") for i in range(size)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'watchlist.json')
+            with open(path, 'w') as f:
+                json.dump({"movies": movies, "shows": [Show("Some Show")]}, f, indent=4, default=json_encoder)
+            json_add = _ms(_json_add, path, Movie("Extra", "tt9999999"))
+            json_remove = _ms(_json_remove, path, "extra")
+
+            store = WatchlistStore(os.path.join(tmp, 'watchlist.db'), legacy_file=None)
+            store.add(movies)
+            store_add = _ms(store.add, [Movie("Extra", "tt9999999")])
+            store_remove = _ms(store.remove, 'movie', ["extra"])
+        print(f"{size:>8} {json_add:>8.2f}ms {json_remove:>10.2f}ms {store_add:>8.2f}ms {store_remove:>11.2f}ms")
+
+if __name__ == '__main__':
+    main()
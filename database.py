@@ -1,24 +1,119 @@
+import re
 import sqlite3
 import logging
+import uuid
+from markupsafe import Markup, escape
 from werkzeug.security import generate_password_hash
-from collections import defaultdict
+from threading import Lock
 
 # --- Configuration ---
 DB_NAME = 'slimstash.db'
+SEARCH_RESULT_LIMIT = 50
+# Private-use characters FTS5 wraps around matches; swapped for <mark> after HTML escaping.
+_MATCH_START = '\ue000'
+_MATCH_END = '\ue001'
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def get_db_connection():
-    """Creates and returns a new database connection."""
-    try:
-        conn = sqlite3.connect(DB_NAME)
+# --- Connection Management ---
+POOL_MAX_IDLE = 8
+STATEMENT_CACHE_SIZE = 256
+# Applied to every new connection. WAL lets page loads read while the scanner is writing.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # durable at checkpoints; safe with WAL
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",   # 16 MB page cache per connection
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA foreign_keys = ON",
+)
+
+class PooledConnection(sqlite3.Connection):
+    """A connection whose close() hands it back to the pool instead of closing it."""
+    pool = None
+    db_path = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        else:
+            self.pool.release(self)
+
+    def close_for_real(self):
+        super().close()
+
+class ConnectionPool:
+    """
+    Keeps long-lived, pre-configured connections around so requests don't pay for connect + pragmas,
+    and sqlite3's per-connection prepared-statement cache survives between calls.
+    """
+    def __init__(self, max_idle=POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(DB_NAME, factory=PooledConnection, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
         conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.db_path = DB_NAME
+        conn.pool = self
         return conn
+
+    def acquire(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.db_path == DB_NAME:
+                    conn.checked_out = True
+                    return conn
+                conn.close_for_real()
+        conn = self._connect()
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return  # already released
+        conn.checked_out = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close_for_real()
+            return
+        with self._lock:
+            if len(self._idle) < self.max_idle and conn.db_path == DB_NAME:
+                self._idle.append(conn)
+                return
+        conn.close_for_real()
+
+    def close_all(self):
+        """Closes every idle connection, e.g. before DB_NAME is pointed somewhere else."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close_for_real()
+
+_pool = ConnectionPool()
+
+def get_db_connection():
+    """Returns a pooled database connection; close() returns it to the pool."""
+    try:
+        return _pool.acquire()
     except sqlite3.Error as e:
         logging.error(f"Database connection error: {e}")
         return None
 
+def close_all_connections():
+    """Closes the pooled connections that are not currently in use."""
+    _pool.close_all()
+
 def init_db():
     """Initializes the database, creating tables if they don't exist."""
     conn = get_db_connection()
@@ -63,28 +158,57 @@ def init_db():
                     recommendations TEXT
                 )
             ''')
-            # TV Shows Table
+            # TV: one row per show, season and episode file
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tv_shows (
+                CREATE TABLE IF NOT EXISTS shows (
                     id TEXT PRIMARY KEY,
+                    tmdb_id TEXT UNIQUE,
                     title TEXT NOT NULL,
-                    path TEXT UNIQUE NOT NULL,
                     genre TEXT,
-                    season INTEGER,
-                    episode INTEGER,
-                    episode_title TEXT,
-                    episode_overview TEXT,
                     poster TEXT,
                     backdrop_path TEXT,
                     overview TEXT,
                     release_date TEXT,
-                    tmdb_id TEXT,
-                    episode_still_path TEXT,
-                    last_modified REAL,
                     cast TEXT,
-                    recommendations TEXT
+                    recommendations TEXT,
+                    last_modified REAL
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS seasons (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    show_id TEXT NOT NULL REFERENCES shows (id) ON DELETE CASCADE,
+                    season_number INTEGER NOT NULL,
+                    UNIQUE (show_id, season_number)
                 )
             ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS episodes (
+                    id TEXT PRIMARY KEY,
+                    show_id TEXT NOT NULL REFERENCES shows (id) ON DELETE CASCADE,
+                    season_id INTEGER NOT NULL REFERENCES seasons (id) ON DELETE CASCADE,
+                    season INTEGER,
+                    episode INTEGER,
+                    episode_title TEXT,
+                    episode_overview TEXT,
+                    episode_still_path TEXT,
+                    path TEXT UNIQUE NOT NULL,
+                    last_modified REAL
+                )
+            ''')
+            _migrate_tv_shows(cursor)
+
+            # Library directories as of the last scan, so rescans can skip unchanged ones (media_scanner.DirectoryFingerprints)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_directories (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    entries INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    subdirs TEXT NOT NULL,
+                    scanned_at_ns INTEGER NOT NULL
+                ) WITHOUT ROWID
+            ''')
 
             # Playback History Table
             cursor.execute('''
@@ -98,6 +222,66 @@ def init_db():
                 )
             ''')
 
+            # Resume positions: one row per user and title, overwritten by each flush of player heartbeats
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS watch_progress (
+                    user_id INTEGER NOT NULL,
+                    media_id TEXT NOT NULL,
+                    media_type TEXT NOT NULL,
+                    position REAL NOT NULL,
+                    duration REAL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, media_id)
+                ) WITHOUT ROWID
+            ''')
+
+            # Media requests: one row per title and type, plus a log of every state change
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS media_requests (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    media_type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    title_key TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    requested_by TEXT,
+                    requested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    decided_by TEXT,
+                    decided_at TIMESTAMP,
+                    UNIQUE (media_type, title_key)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS media_request_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    request_id INTEGER NOT NULL REFERENCES media_requests (id) ON DELETE CASCADE,
+                    action TEXT NOT NULL,
+                    actor TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Indexes for the library views, detail pages and statistics joins
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_movies_tmdb_id ON movies (tmdb_id)")
+            # Keyset orderings of the library listings (media_scanner.LIBRARY_SORTS): by title, and newest first
+            for table in ('movies', 'shows'):
+                cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_title")
+                cursor.execute(f"DROP INDEX IF EXISTS idx_{table}_last_modified")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_title_id ON {table} (title COLLATE NOCASE, id)")
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_added_id ON {table} (COALESCE(last_modified, 0), id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_episodes_show ON episodes (show_id, season, episode)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_episodes_season ON episodes (season_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_episodes_last_modified ON episodes (last_modified)")
+            # Covering indexes for per-title lookups (and the rollup rebuild) and for the recent-history listing
+            cursor.execute("DROP INDEX IF EXISTS idx_playback_history_media")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_playback_history_title ON playback_history (media_type, media_id, watched_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_playback_history_watched ON playback_history (watched_at, user_id, media_type, media_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_media_requests_status ON media_requests (media_type, status, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_media_request_events_request ON media_request_events (request_id, id)")
+
+            _create_search_index(cursor)
+            _create_statistics_rollups(cursor)
+            _create_library_version(cursor)
+
             # Check for and create default admin user
             cursor.execute("SELECT id FROM users WHERE username = ?", ('admin',))
             if cursor.fetchone() is None:
@@ -109,6 +293,309 @@ def init_db():
     finally:
         conn.close()
 
+def _migrate_tv_shows(cursor):
+    """
+    Moves rows from the old per-episode tv_shows table into shows/seasons/episodes, then drops it.
+    Episode ids are kept so existing playback history still points at the right file.
+    """
+    if cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'tv_shows'").fetchone() is None:
+        return
+    rows = cursor.execute("SELECT * FROM tv_shows ORDER BY last_modified DESC").fetchall()
+    logging.info(f"Migrating {len(rows)} TV episode rows to the shows/seasons/episodes schema...")
+
+    show_ids = {}
+    season_ids = {}
+    for row in rows:
+        tmdb_id = row['tmdb_id'] if row['tmdb_id'] not in (None, '', 'None') else None
+        show_key = tmdb_id or row['title'].lower()
+        if show_key not in show_ids:
+            # Rows are newest first, so the show takes its metadata from its most recent episode.
+            show_ids[show_key] = str(uuid.uuid4())
+            cursor.execute("""
+                INSERT INTO shows (id, tmdb_id, title, genre, poster, backdrop_path, overview, release_date, cast, recommendations, last_modified)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (show_ids[show_key], tmdb_id, row['title'], row['genre'], row['poster'], row['backdrop_path'], row['overview'],
+                  row['release_date'], row['cast'], row['recommendations'], row['last_modified']))
+        show_id = show_ids[show_key]
+
+        season_number = row['season'] or 0
+        if (show_id, season_number) not in season_ids:
+            cursor.execute("INSERT INTO seasons (show_id, season_number) VALUES (?, ?)", (show_id, season_number))
+            season_ids[(show_id, season_number)] = cursor.lastrowid
+
+        cursor.execute("""
+            INSERT OR IGNORE INTO episodes (id, show_id, season_id, season, episode, episode_title, episode_overview, episode_still_path, path, last_modified)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (row['id'], show_id, season_ids[(show_id, season_number)], row['season'], row['episode'], row['episode_title'],
+              row['episode_overview'], row['episode_still_path'], row['path'], row['last_modified']))
+
+    cursor.execute("DROP TABLE tv_shows")
+    logging.info(f"Migrated TV library into {len(show_ids)} shows and {len(season_ids)} seasons.")
+
+# --- Full-Text Search Index ---
+# library_fts rowids are derived from the source row: movies use rowid * 2, shows rowid * 2 + 1,
+# so triggers can update or delete an entry without scanning the index.
+_FTS_GENRES = "(SELECT group_concat(value, ' ') FROM json_each(CASE WHEN json_valid({row}.genre) THEN {row}.genre ELSE '[]' END))"
+_FTS_CAST = "(SELECT group_concat(json_extract(value, '$.name'), ' ') FROM json_each(CASE WHEN json_valid({row}.\"cast\") THEN {row}.\"cast\" ELSE '[]' END))"
+_FTS_SOURCES = (('movies', 'movie', 0), ('shows', 'tv', 1))
+
+def _fts_insert_sql(table, media_type, offset, row):
+    values = f"{row}.rowid * 2 + {offset}, '{media_type}', {row}.id, {row}.title, {row}.overview, {_FTS_GENRES.format(row=row)}, {_FTS_CAST.format(row=row)}"
+    if row == 'NEW':
+        return f"INSERT INTO library_fts (rowid, media_type, media_id, title, overview, genres, cast_names) VALUES ({values});"
+    return f"INSERT INTO library_fts (rowid, media_type, media_id, title, overview, genres, cast_names) SELECT {values} FROM {table} {row};"
+
+def _create_search_index(cursor):
+    """Creates the FTS5 index over movies and shows, the triggers that keep it in sync, and backfills it."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'library_fts'").fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS library_fts USING fts5 (
+            media_type UNINDEXED,
+            media_id UNINDEXED,
+            title,
+            overview,
+            genres,
+            cast_names,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    ''')
+    for table, media_type, offset in _FTS_SOURCES:
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                {_fts_insert_sql(table, media_type, offset, 'NEW')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF title, overview, genre, "cast" ON {table} BEGIN
+                DELETE FROM library_fts WHERE rowid = OLD.rowid * 2 + {offset};
+                {_fts_insert_sql(table, media_type, offset, 'NEW')}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                DELETE FROM library_fts WHERE rowid = OLD.rowid * 2 + {offset};
+            END
+        """)
+    if not exists:
+        # Title matches matter most, then cast, then overview and genres.
+        cursor.execute("INSERT INTO library_fts (library_fts, rank) VALUES ('rank', 'bm25(0.0, 0.0, 10.0, 1.0, 2.0, 3.0)')")
+        rebuild_search_index(cursor)
+
+def rebuild_search_index(cursor):
+    """Repopulates library_fts from the movies and shows tables."""
+    cursor.execute("DELETE FROM library_fts")
+    for table, media_type, offset in _FTS_SOURCES:
+        cursor.execute(_fts_insert_sql(table, media_type, offset, 'src'))
+    logging.info("Rebuilt library search index.")
+
+def _fts_match_query(query):
+    """Turns free text into an FTS5 query: every word must match, as a prefix."""
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _highlighted(text):
+    """Escapes FTS output and turns the match markers into <mark> tags."""
+    if not text:
+        return Markup('')
+    return Markup(str(escape(text)).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>'))
+
+# --- Statistics Rollups ---
+# Kept current by triggers as plays are logged and files are ingested, rescanned or removed, so
+# /statistics reads a few rows instead of aggregating playback_history and the library on every load.
+# Plays are counted per title: the movie, or the show an episode belonged to when it was played.
+_PLAY_TITLE = "CASE {row}.media_type WHEN 'movie' THEN {row}.media_id ELSE (SELECT show_id FROM episodes WHERE id = {row}.media_id) END"
+_MONTH = "strftime('%Y-%m', {row}.last_modified, 'unixepoch')"
+_ROLLUP_TABLES = ('stats_daily_plays', 'stats_title_plays', 'stats_monthly_additions', 'stats_show_months')
+
+def _play_rollup_sql(row, delta):
+    title, day = _PLAY_TITLE.format(row=row), f"date({row}.watched_at)"
+    if delta > 0:
+        return f"""
+            INSERT INTO stats_daily_plays (media_type, title_id, day, plays) VALUES ({row}.media_type, {title}, {day}, 1)
+                ON CONFLICT (media_type, title_id, day) DO UPDATE SET plays = plays + 1;
+            INSERT INTO stats_title_plays (media_type, title_id, plays) VALUES ({row}.media_type, {title}, 1)
+                ON CONFLICT (media_type, title_id) DO UPDATE SET plays = plays + 1;
+        """
+    return f"""
+        UPDATE stats_daily_plays SET plays = plays - 1 WHERE media_type = {row}.media_type AND title_id = {title} AND day = {day};
+        DELETE FROM stats_daily_plays WHERE media_type = {row}.media_type AND title_id = {title} AND day = {day} AND plays <= 0;
+        UPDATE stats_title_plays SET plays = plays - 1 WHERE media_type = {row}.media_type AND title_id = {title};
+        DELETE FROM stats_title_plays WHERE media_type = {row}.media_type AND title_id = {title} AND plays <= 0;
+    """
+
+def _movie_month_sql(row, delta):
+    month = _MONTH.format(row=row)
+    if delta > 0:
+        return f"""
+            INSERT INTO stats_monthly_additions (month, movies) SELECT {month}, 1 WHERE {row}.last_modified IS NOT NULL
+                ON CONFLICT (month) DO UPDATE SET movies = movies + 1;
+        """
+    return f"""
+        UPDATE stats_monthly_additions SET movies = movies - 1 WHERE month = {month};
+        DELETE FROM stats_monthly_additions WHERE month = {month} AND movies <= 0 AND shows <= 0;
+    """
+
+def _episode_month_sql(row, delta):
+    """A show counts once in each month it has episode files from, however many there are."""
+    month = _MONTH.format(row=row)
+    episodes = f"(SELECT episodes FROM stats_show_months WHERE show_id = {row}.show_id AND month = {month})"
+    if delta > 0:
+        return f"""
+            INSERT INTO stats_show_months (show_id, month, episodes) SELECT {row}.show_id, {month}, 1 WHERE {row}.last_modified IS NOT NULL
+                ON CONFLICT (show_id, month) DO UPDATE SET episodes = episodes + 1;
+            INSERT INTO stats_monthly_additions (month, shows) SELECT {month}, 1 WHERE {episodes} = 1
+                ON CONFLICT (month) DO UPDATE SET shows = shows + 1;
+        """
+    return f"""
+        UPDATE stats_show_months SET episodes = episodes - 1 WHERE show_id = {row}.show_id AND month = {month};
+        UPDATE stats_monthly_additions SET shows = shows - 1 WHERE month = {month} AND {episodes} = 0;
+        DELETE FROM stats_show_months WHERE show_id = {row}.show_id AND month = {month} AND episodes <= 0;
+        DELETE FROM stats_monthly_additions WHERE month = {month} AND movies <= 0 AND shows <= 0;
+    """
+
+def _create_statistics_rollups(cursor):
+    """Creates the rollup tables and the triggers that maintain them, and backfills them once."""
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_title_plays'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_daily_plays (
+            media_type TEXT NOT NULL,
+            title_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            plays INTEGER NOT NULL,
+            PRIMARY KEY (media_type, title_id, day)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_title_plays (
+            media_type TEXT NOT NULL,
+            title_id TEXT NOT NULL,
+            plays INTEGER NOT NULL,
+            PRIMARY KEY (media_type, title_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_monthly_additions (
+            month TEXT PRIMARY KEY,
+            movies INTEGER NOT NULL DEFAULT 0,
+            shows INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_show_months (
+            show_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            episodes INTEGER NOT NULL,
+            PRIMARY KEY (show_id, month)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_daily_plays_day ON stats_daily_plays (day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_stats_title_plays_plays ON stats_title_plays (plays DESC)")
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS playback_history_stats_insert AFTER INSERT ON playback_history
+        WHEN {_PLAY_TITLE.format(row='NEW')} IS NOT NULL BEGIN {_play_rollup_sql('NEW', 1)} END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS playback_history_stats_delete AFTER DELETE ON playback_history
+        WHEN {_PLAY_TITLE.format(row='OLD')} IS NOT NULL BEGIN {_play_rollup_sql('OLD', -1)} END
+    """)
+    for table, month_sql, moved in (('movies', _movie_month_sql, ''), ('episodes', _episode_month_sql, ' OR OLD.show_id IS NOT NEW.show_id')):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_insert AFTER INSERT ON {table} BEGIN
+                {month_sql('NEW', 1)}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_delete AFTER DELETE ON {table} BEGIN
+                {month_sql('OLD', -1)}
+            END
+        """)
+        # A rescan rewrites last_modified on every upsert; only a change of month (or show) moves a count.
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_update AFTER UPDATE ON {table}
+            WHEN {_MONTH.format(row='OLD')} IS NOT {_MONTH.format(row='NEW')}{moved} BEGIN
+                {month_sql('OLD', -1)}
+                {month_sql('NEW', 1)}
+            END
+        """)
+    if not exists:
+        _rebuild_statistics(cursor)
+
+def _rebuild_statistics(cursor):
+    for table in _ROLLUP_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute(f"""
+        INSERT INTO stats_daily_plays (media_type, title_id, day, plays)
+        SELECT media_type, title_id, day, COUNT(*) FROM (
+            SELECT p.media_type, {_PLAY_TITLE.format(row='p')} AS title_id, date(p.watched_at) AS day FROM playback_history p
+        ) WHERE title_id IS NOT NULL GROUP BY media_type, title_id, day
+    """)
+    cursor.execute("""
+        INSERT INTO stats_title_plays (media_type, title_id, plays)
+        SELECT media_type, title_id, SUM(plays) FROM stats_daily_plays GROUP BY media_type, title_id
+    """)
+    cursor.execute(f"""
+        INSERT INTO stats_show_months (show_id, month, episodes)
+        SELECT e.show_id, {_MONTH.format(row='e')} AS month, COUNT(*) FROM episodes e
+        WHERE e.last_modified IS NOT NULL GROUP BY e.show_id, month
+    """)
+    cursor.execute(f"""
+        INSERT INTO stats_monthly_additions (month, movies, shows)
+        SELECT month, SUM(movies), SUM(shows) FROM (
+            SELECT {_MONTH.format(row='m')} AS month, 1 AS movies, 0 AS shows FROM movies m WHERE m.last_modified IS NOT NULL
+            UNION ALL
+            SELECT month, 0, 1 FROM stats_show_months
+        ) GROUP BY month
+    """)
+    logging.info("Rebuilt statistics rollups.")
+
+def rebuild_statistics():
+    """
+    Recomputes every statistics rollup from playback_history and the library in one transaction.
+    Plays of episodes whose files are gone can't be traced to a show any more, so they drop out.
+    """
+    conn = get_db_connection()
+    if conn is None: return False
+    try:
+        with conn:
+            _rebuild_statistics(conn.cursor())
+        return True
+    except sqlite3.Error as e:
+        logging.error(f"Error rebuilding statistics: {e}")
+        return False
+    finally:
+        conn.close()
+
+# --- Library Version ---
+# Bumped by triggers in the same transaction as any change to the library tables, so every worker
+# sees a new version as soon as a scan batch commits. app.py keys its shared cache and ETags on it.
+_VERSIONED_TABLES = ('movies', 'shows', 'seasons', 'episodes')
+
+def _create_library_version(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS library_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)")
+    cursor.execute("INSERT OR IGNORE INTO library_version (id, version) VALUES (1, 0)")
+    for table in _VERSIONED_TABLES:
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event.lower()} AFTER {event} ON {table} BEGIN
+                    UPDATE library_version SET version = version + 1 WHERE id = 1;
+                END
+            """)
+
+def get_library_version():
+    """The current library version, or None if it can't be read (callers then skip caching)."""
+    conn = get_db_connection()
+    if conn is None: return None
+    try:
+        row = conn.execute("SELECT version FROM library_version WHERE id = 1").fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Error reading library version: {e}")
+        return None
+    finally:
+        conn.close()
+
 # --- User Management Functions ---
 
 def add_user(username, password):
@@ -157,18 +644,41 @@ def get_user_by_username(username):
         conn.close()
     return user
 
-def search_library(query):
-    """Searches for movies and TV shows in the local database."""
+def search_library(query, limit=SEARCH_RESULT_LIMIT):
+    """
+    Full-text searches movies and shows (title, overview, genres, cast) and returns show-level
+    hits ordered by BM25 relevance, with highlighted title_html and snippet_html.
+    """
+    match = _fts_match_query(query)
+    if not match:
+        return []
     conn = get_db_connection()
     if conn is None: return []
 
     results = []
     try:
-        with conn:
-            movies = conn.execute("SELECT *, 'movie' as type FROM movies WHERE title LIKE ?", ('%' + query + '%',)).fetchall()
-            results.extend([dict(row) for row in movies])
-            tv_shows = conn.execute("SELECT *, 'tv' as type FROM tv_shows WHERE title LIKE ? GROUP BY title", ('%' + query + '%',)).fetchall()
-            results.extend([dict(row) for row in tv_shows])
+        rows = conn.execute("""
+            SELECT
+                f.media_type AS type,
+                f.media_id AS id,
+                highlight(library_fts, 2, ?, ?) AS title_html,
+                snippet(library_fts, -1, ?, ?, '...', 16) AS snippet_html,
+                COALESCE(m.title, s.title) AS title,
+                COALESCE(m.poster, s.poster) AS poster,
+                m.year,
+                COALESCE(m.release_date, s.release_date) AS release_date
+            FROM library_fts f
+            LEFT JOIN movies m ON f.media_type = 'movie' AND m.id = f.media_id
+            LEFT JOIN shows s ON f.media_type = 'tv' AND s.id = f.media_id
+            WHERE library_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (_MATCH_START, _MATCH_END, _MATCH_START, _MATCH_END, match, limit)).fetchall()
+        for row in rows:
+            result = dict(row)
+            result['title_html'] = _highlighted(result['title_html'])
+            result['snippet_html'] = _highlighted(result['snippet_html'])
+            results.append(result)
     except sqlite3.Error as e:
         logging.error(f"Error searching library: {e}")
     finally:
@@ -177,41 +687,78 @@ def search_library(query):
 
 # --- Statistics Functions ---
 
-def log_playback(user_id, media_id, media_type):
-    """Logs a playback event."""
+def record_playback_batch(plays, progress):
+    """
+    Writes queued plays [(user_id, media_id, media_type, watched_at)] and resume positions
+    [(user_id, media_id, media_type, position, duration, updated_at)] in one transaction.
+    A position never replaces one that was reported later.
+    """
     conn = get_db_connection()
-    if conn is None: return
+    if conn is None: return False
     try:
         with conn:
-            conn.execute("INSERT INTO playback_history (user_id, media_id, media_type) VALUES (?, ?, ?)",
-                         (user_id, media_id, media_type))
-        logging.info(f"Logged play for user {user_id}, media {media_id}")
+            conn.executemany("INSERT INTO playback_history (user_id, media_id, media_type, watched_at) VALUES (?, ?, ?, ?)", plays)
+            conn.executemany("""
+                INSERT INTO watch_progress (user_id, media_id, media_type, position, duration, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, media_id) DO UPDATE SET
+                    media_type = excluded.media_type, position = excluded.position,
+                    duration = COALESCE(excluded.duration, duration), updated_at = excluded.updated_at
+                WHERE excluded.updated_at >= watch_progress.updated_at
+            """, progress)
+        return True
     except sqlite3.Error as e:
-        logging.error(f"Error logging playback: {e}")
+        logging.error(f"Error writing {len(plays)} play(s) and {len(progress)} position(s): {e}")
+        return False
     finally:
         conn.close()
 
-def get_most_watched_media():
-    """Gets the most watched movies and TV shows."""
+def get_watch_progress(user_id, media_id):
+    """The stored resume position for a user and title, or None."""
+    conn = get_db_connection()
+    if conn is None: return None
+    try:
+        row = conn.execute("SELECT media_type, position, duration, updated_at FROM watch_progress WHERE user_id = ? AND media_id = ?",
+                           (user_id, media_id)).fetchone()
+        return dict(row) if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Error getting watch progress: {e}")
+        return None
+    finally:
+        conn.close()
+
+def get_most_watched_media(days=None, limit=10):
+    """
+    Gets the most watched movies and TV shows, from the play rollups. With `days`, only plays
+    from the last `days` days count.
+    """
     conn = get_db_connection()
     if conn is None: return []
-    query = """
+    if days is None:
+        plays = "SELECT media_type, title_id, plays FROM stats_title_plays"
+        params = (limit,)
+    else:
+        plays = """
+            SELECT media_type, title_id, SUM(plays) AS plays FROM stats_daily_plays
+            WHERE day >= date('now', ?) GROUP BY media_type, title_id
+        """
+        params = (f"-{int(days)} days", limit)
+    query = f"""
         SELECT
-            p.media_id,
-            p.media_type,
-            COUNT(p.id) as play_count,
-            COALESCE(m.title, t.title) as title,
-            COALESCE(m.poster, t.poster) as poster
-        FROM playback_history p
-        LEFT JOIN movies m ON p.media_id = m.id AND p.media_type = 'movie'
-        LEFT JOIN tv_shows t ON p.media_id = t.id AND p.media_type = 'tv'
-        WHERE title IS NOT NULL
-        GROUP BY title, poster
-        ORDER BY play_count DESC
-        LIMIT 10
+            t.title_id as media_id,
+            t.media_type,
+            t.plays as play_count,
+            COALESCE(m.title, s.title) as title,
+            COALESCE(m.poster, s.poster) as poster
+        FROM ({plays}) t
+        LEFT JOIN movies m ON t.title_id = m.id AND t.media_type = 'movie'
+        LEFT JOIN shows s ON t.title_id = s.id AND t.media_type = 'tv'
+        WHERE COALESCE(m.id, s.id) IS NOT NULL
+        ORDER BY t.plays DESC
+        LIMIT ?
     """
     try:
-        results = conn.execute(query).fetchall()
+        results = conn.execute(query, params).fetchall()
         return [dict(row) for row in results]
     except sqlite3.Error as e:
         logging.error(f"Error getting most watched media: {e}")
@@ -220,27 +767,14 @@ def get_most_watched_media():
         conn.close()
 
 def get_library_growth():
-    """Gets the number of media items added over time."""
+    """Gets the number of media items added per month (movies, plus shows with episodes from that month)."""
     conn = get_db_connection()
     if conn is None: return {}
-
-    growth_data = defaultdict(int)
     try:
-        # Movies
-        movie_growth = conn.execute("SELECT strftime('%Y-%m', last_modified, 'unixepoch') as month, COUNT(*) as count FROM movies GROUP BY month ORDER BY month").fetchall()
-        for row in movie_growth:
-            growth_data[row['month']] += row['count']
-
-        # TV Shows (count unique shows per month)
-        tv_growth = conn.execute("SELECT strftime('%Y-%m', last_modified, 'unixepoch') as month, COUNT(DISTINCT title) as count FROM tv_shows GROUP BY month ORDER BY month").fetchall()
-        for row in tv_growth:
-            growth_data[row['month']] += row['count']
-
-        # Sort and format for the chart
-        sorted_growth = sorted(growth_data.items())
+        rows = conn.execute("SELECT month, movies + shows AS count FROM stats_monthly_additions WHERE movies + shows > 0 ORDER BY month").fetchall()
         return {
-            "labels": [item[0] for item in sorted_growth],
-            "data": [item[1] for item in sorted_growth]
+            "labels": [row['month'] for row in rows],
+            "data": [row['count'] for row in rows]
         }
     except sqlite3.Error as e:
         logging.error(f"Error getting library growth: {e}")
@@ -257,14 +791,15 @@ def get_playback_history():
             p.watched_at,
             u.username,
             p.media_type,
-            COALESCE(m.title, t.title) as title,
-            t.season,
-            t.episode
+            COALESCE(m.title, s.title) as title,
+            e.season,
+            e.episode
         FROM playback_history p
         JOIN users u ON p.user_id = u.id
         LEFT JOIN movies m ON p.media_id = m.id AND p.media_type = 'movie'
-        LEFT JOIN tv_shows t ON p.media_id = t.id AND p.media_type = 'tv'
-        WHERE title IS NOT NULL
+        LEFT JOIN episodes e ON p.media_id = e.id AND p.media_type = 'tv'
+        LEFT JOIN shows s ON e.show_id = s.id
+        WHERE COALESCE(m.id, s.id) IS NOT NULL
         ORDER BY p.watched_at DESC
         LIMIT 20
     """
@@ -0,0 +1,464 @@
+# hls_transcoder.py
+import hashlib
+import json
+import logging
+import math
+import os
+import subprocess
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache, partial
+from threading import Lock, RLock, Thread
+
+# --- Configuration ---
+DEFAULT_FFMPEG = 'ffmpeg'
+DEFAULT_FFPROBE = 'ffprobe'
+DEFAULT_CACHE_DIR = 'hls_cache'
+DEFAULT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+DEFAULT_WORKERS = 2
+SEGMENT_SECONDS = 6.0
+PREFETCH_SEGMENTS = 3           # segments built ahead of the one the player just asked for
+SESSION_IDLE_SECONDS = 60       # a session with no playlist/segment request for this long is ended
+SEGMENT_TIMEOUT_SECONDS = 120
+KEYFRAME_PROBE_TIMEOUT_SECONDS = 600   # runs in the background, never inside a request
+MAX_KEYFRAME_INDEXES = 64
+STALE_TEMP_SECONDS = SEGMENT_TIMEOUT_SECONDS * 2  # older .tmp files are leftovers, not builds in progress
+BROWSER_VIDEO_CODECS = {'h264'}
+BROWSER_AUDIO_CODECS = {'aac', 'mp3'}
+BROWSER_CONTAINERS = ('mp4', 'mov')  # ffprobe reports mp4 as "mov,mp4,m4a,3gp,3g2,mj2"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class HlsError(Exception):
+    """Raised when a file can't be probed or a segment can't be produced."""
+
+# --- Probing ---
+@lru_cache(maxsize=256)
+def _probe(ffprobe, path, mtime_ns):
+    try:
+        result = subprocess.run([ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+                                capture_output=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise HlsError(f"ffprobe failed for {path}: {e}") from e
+    if result.returncode != 0:
+        raise HlsError(f"ffprobe failed for {path}: {result.stderr.decode(errors='replace').strip()}")
+    try:
+        info = json.loads(result.stdout)
+        duration = float(info.get('format', {}).get('duration') or 0)
+    except (ValueError, AttributeError) as e:
+        raise HlsError(f"ffprobe returned unreadable output for {path}: {e}") from e
+    streams = info.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    return {
+        'duration': duration,
+        'format': info.get('format', {}).get('format_name', ''),
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+    }
+
+def probe(path, ffprobe=DEFAULT_FFPROBE):
+    """Returns duration, container and codecs for a media file (cached until the file changes)."""
+    return _probe(ffprobe, path, os.stat(path).st_mtime_ns)
+
+def keyframes(path, ffprobe=DEFAULT_FFPROBE):
+    """Returns the video keyframe times of a media file. Slow: ffprobe reads every packet of the file."""
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=KEYFRAME_PROBE_TIMEOUT_SECONDS)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise HlsError(f"Keyframe probe failed for {path}: {e}") from e
+    if result.returncode != 0:
+        raise HlsError(f"Keyframe probe failed for {path}: {result.stderr.decode(errors='replace').strip()}")
+    keyframes = []
+    for line in result.stdout.decode(errors='replace').splitlines():
+        pts, _, flags = line.partition(',')
+        try:
+            pts = float(pts)
+        except ValueError:
+            continue
+        if flags.startswith('K'):
+            keyframes.append(pts)
+    return tuple(sorted(keyframes))
+
+def segment_boundaries(duration, keyframe_times=None):
+    """
+    Start times of every segment plus the end of the file. Without keyframes (transcoding) the
+    segments are SEGMENT_SECONDS each; with them, consecutive keyframe intervals are merged until
+    a segment reaches SEGMENT_SECONDS, so a remuxed segment always starts on a keyframe and none
+    is empty however far apart the keyframes are.
+    """
+    if keyframe_times is None:
+        starts = [index * SEGMENT_SECONDS for index in range(max(math.ceil(duration / SEGMENT_SECONDS), 1))]
+    else:
+        starts = [0.0]
+        for keyframe in keyframe_times:
+            if keyframe - starts[-1] >= SEGMENT_SECONDS and keyframe < duration:
+                starts.append(keyframe)
+    return starts + [duration]
+
+# --- Segment Cache ---
+class SegmentCache:
+    """
+    Size-bounded LRU of finished .ts segments on disk. Survives restarts (order rebuilt from mtimes).
+    Every worker process shares the directory but keeps its own accounting, so lookups go to the disk.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = None  # relative path -> size, least recently used first
+        self._total = 0
+        self._lock = Lock()
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        os.makedirs(self.directory, exist_ok=True)
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    if not name.endswith('.ts'):
+                        # Another worker may be building this one; only old temp files are leftovers.
+                        if stat.st_mtime < stale_before:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue  # removed by another worker while we walked
+                found.append((stat.st_mtime, os.path.relpath(path, self.directory), stat.st_size))
+        self._entries = OrderedDict((rel, size) for _, rel, size in sorted(found))
+        self._total = sum(self._entries.values())
+
+    def _relpath(self, key, index):
+        return os.path.join(key, f"{index}.ts")
+
+    def lookup(self, key, index):
+        """
+        Returns the cached segment's path (marking it recently used) or None. Picks up segments
+        other workers built and forgets ones they evicted.
+        """
+        rel = self._relpath(key, index)
+        path = os.path.join(self.directory, rel)
+        try:
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            size = None
+        with self._lock:
+            self._load()
+            self._total -= self._entries.pop(rel, 0)
+            if size is None:
+                return None
+            self._entries[rel] = size
+            self._total += size
+        return path
+
+    def contains(self, key, index):
+        return os.path.exists(os.path.join(self.directory, self._relpath(key, index)))
+
+    def temp_path(self, key, index):
+        os.makedirs(os.path.join(self.directory, key), exist_ok=True)
+        return os.path.join(self.directory, key, f"{index}.ts.{os.getpid()}.{time.monotonic_ns()}.tmp")
+
+    def add(self, key, index, temp_path):
+        """Moves a finished segment into the cache, evicting the least recently used ones over budget."""
+        rel = self._relpath(key, index)
+        path = os.path.join(self.directory, rel)
+        try:
+            os.replace(temp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            raise HlsError(f"Could not store segment {rel}: {e}") from e
+        with self._lock:
+            self._load()
+            self._total += size - self._entries.pop(rel, 0)
+            self._entries[rel] = size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_rel, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(os.path.join(self.directory, old_rel))
+                except OSError:
+                    pass
+        return path
+
+    def get_stats(self):
+        with self._lock:
+            self._load()
+            return {'segments': len(self._entries), 'bytes': self._total, 'max_bytes': self.max_bytes}
+
+# --- Sessions ---
+class HlsSession:
+    """One file being played: probe info, segment boundaries, queued prefetches and running ffmpeg processes."""
+    def __init__(self, media_id, path, ffmpeg, ffprobe, keyframe_times=None):
+        self.media_id = media_id
+        self.path = path
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        stat = os.stat(path)
+        self.info = probe(path, ffprobe)
+        if self.info['duration'] <= 0:
+            raise HlsError(f"Could not determine the duration of {path}")
+        # Browser-decodable video is only remuxed, which needs its keyframe times to cut segments;
+        # anything else (or anything whose keyframes aren't known yet) is transcoded to H.264.
+        self.remux = self.info['video_codec'] in BROWSER_VIDEO_CODECS and bool(keyframe_times)
+        self.copy_audio = self.info['audio_codec'] in BROWSER_AUDIO_CODECS
+        mode = 'remux' if self.remux else 'transcode'
+        if self.remux:
+            self.boundaries = segment_boundaries(self.info['duration'], keyframe_times)
+        else:
+            self.boundaries = segment_boundaries(self.info['duration'])
+        layout = hashlib.sha1(repr(self.boundaries).encode()).hexdigest()
+        self.cache_key = hashlib.sha1(f"{path}|{stat.st_size}|{stat.st_mtime_ns}|{mode}|{layout}".encode()).hexdigest()[:20]
+        self.segment_count = len(self.boundaries) - 1
+        self.last_access = time.monotonic()
+        self.pending = {}        # index -> Future for segments being built or queued
+        self.processes = set()
+        self.lock = RLock()      # re-entrant: Future.cancel() runs done-callbacks in the caller's thread
+        self.closed = False
+
+    def touch(self):
+        self.last_access = time.monotonic()
+
+    def forget(self, index, future):
+        with self.lock:
+            if self.pending.get(index) is future:
+                del self.pending[index]
+
+    def playlist(self):
+        durations = [end - start for start, end in zip(self.boundaries, self.boundaries[1:])]
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f"#EXT-X-TARGETDURATION:{math.ceil(max(durations))}",
+                 '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:VOD']
+        for index, duration in enumerate(durations):
+            lines += [f"#EXTINF:{duration:.3f},", f"{index}.ts"]
+        lines.append('#EXT-X-ENDLIST')
+        return '\n'.join(lines) + '\n'
+
+    def _ffmpeg_command(self, start, end, output):
+        video = ['-c:v', 'copy'] if self.remux else ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p']
+        audio = ['-c:a', 'copy'] if self.copy_audio else ['-c:a', 'aac', '-ac', '2', '-b:a', '160k']
+        return [self.ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin',
+                '-ss', f"{start:.6f}", '-i', self.path, '-t', f"{end - start:.6f}",
+                '-map', '0:v:0', '-map', '0:a:0?', *video, *audio, '-sn',
+                # Keep each segment's timestamps at its real position so the player sees one timeline.
+                '-output_ts_offset', f"{start:.6f}", '-muxdelay', '0', '-f', 'mpegts', '-y', output]
+
+    def build_segment(self, index, cache):
+        """Runs ffmpeg for one segment and stores the result in the cache. Returns the cached path."""
+        cached = cache.lookup(self.cache_key, index)
+        if cached:
+            return cached
+        start, end = self.boundaries[index], self.boundaries[index + 1]
+        try:
+            output = cache.temp_path(self.cache_key, index)
+            process = subprocess.Popen(self._ffmpeg_command(start, end, output), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            raise HlsError(f"Could not start ffmpeg: {e}") from e
+        with self.lock:
+            self.processes.add(process)
+        try:
+            _, stderr = process.communicate(timeout=SEGMENT_TIMEOUT_SECONDS)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            _, stderr = process.communicate()
+        finally:
+            with self.lock:
+                self.processes.discard(process)
+        if process.returncode != 0 or not os.path.exists(output):
+            try:
+                os.remove(output)
+            except OSError:
+                pass
+            raise HlsError(f"ffmpeg failed on segment {index} of {self.path}: {stderr.decode(errors='replace').strip()[-500:]}")
+        return cache.add(self.cache_key, index, output)
+
+    def close(self):
+        """Cancels queued prefetches and stops any ffmpeg still running for this session."""
+        with self.lock:
+            self.closed = True
+            futures = list(self.pending.values())
+            processes = list(self.processes)
+        for future in futures:
+            future.cancel()
+        for process in processes:
+            process.kill()
+
+# --- Manager ---
+class HlsManager:
+    """Owns the sessions, the segment cache and the prefetch pool; ends sessions nobody is reading."""
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                 ffmpeg=DEFAULT_FFMPEG, ffprobe=DEFAULT_FFPROBE, workers=DEFAULT_WORKERS):
+        self.cache = SegmentCache(cache_dir, cache_max_bytes)
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hls-prefetch')
+        self.indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hls-keyframes')
+        self.keyframe_indexes = OrderedDict()  # (path, mtime_ns) -> Future of the keyframe times
+        self.sessions = {}
+        self._lock = Lock()
+        self._reaper = None
+
+    def _keyframe_index(self, path):
+        """
+        Returns the file's keyframe times, or None until the background read of them has finished
+        (or if it failed). Reading them means going through the whole file, so it never blocks a request.
+        """
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            future = self.keyframe_indexes.get(key)
+            if future is None:
+                future = self.keyframe_indexes[key] = self.indexer.submit(keyframes, path, self.ffprobe)
+                future.add_done_callback(partial(self._keyframe_index_done, path))
+                while len(self.keyframe_indexes) > MAX_KEYFRAME_INDEXES:
+                    self.keyframe_indexes.popitem(last=False)
+            else:
+                self.keyframe_indexes.move_to_end(key)
+        if not future.done() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def _keyframe_index_done(self, path, future):
+        if future.exception() is not None:
+            logging.warning(f"Could not index keyframes, {path} will be transcoded: {future.exception()}")
+        else:
+            logging.info(f"Indexed {len(future.result())} keyframes of {path}")
+
+    def _session(self, media_id, path):
+        with self._lock:
+            session = self.sessions.get(media_id)
+        if session is None or session.path != path:
+            # Until the keyframes are indexed the session transcodes fixed-length segments; a session
+            # keeps its layout for its whole life, so remuxing starts with the next one.
+            keyframe_times = None
+            if probe(path, self.ffprobe)['video_codec'] in BROWSER_VIDEO_CODECS:
+                keyframe_times = self._keyframe_index(path)
+            created = HlsSession(media_id, path, self.ffmpeg, self.ffprobe, keyframe_times)
+            with self._lock:
+                session = self.sessions.get(media_id)
+                if session is None or session.path != path:
+                    if session is not None:
+                        session.close()
+                    session = self.sessions[media_id] = created
+                    logging.info(f"Started HLS session for {path} ({'remux' if session.remux else 'transcode'}, {session.segment_count} segments)")
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = Thread(target=self._reap_loop, name='hls-session-reaper', daemon=True)
+                self._reaper.start()
+        session.touch()
+        return session
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(SESSION_IDLE_SECONDS / 4)
+            now = time.monotonic()
+            with self._lock:
+                idle = [media_id for media_id, session in self.sessions.items() if now - session.last_access > SESSION_IDLE_SECONDS]
+                ended = [self.sessions.pop(media_id) for media_id in idle]
+            for session in ended:
+                session.close()
+                logging.info(f"Ended idle HLS session for {session.path}")
+
+    def _prefetch_job(self, session, index):
+        try:
+            return session.build_segment(index, self.cache)
+        except HlsError as e:
+            logging.warning(f"Prefetch failed: {e}")
+            raise
+
+    def _prefetch(self, session, index):
+        """Queues the next few segments and drops queued ones the player has seeked away from."""
+        wanted = range(index + 1, min(index + 1 + PREFETCH_SEGMENTS, session.segment_count))
+        with session.lock:
+            if session.closed:
+                return
+            for queued_index, future in list(session.pending.items()):
+                if queued_index != index and queued_index not in wanted:
+                    future.cancel()  # only succeeds if it hasn't started
+            for next_index in wanted:
+                if next_index in session.pending or self.cache.contains(session.cache_key, next_index):
+                    continue
+                future = self.executor.submit(self._prefetch_job, session, next_index)
+                session.pending[next_index] = future
+                future.add_done_callback(partial(session.forget, next_index))
+
+    def get_playlist(self, media_id, path):
+        return self._session(media_id, path).playlist()
+
+    def get_segment(self, media_id, path, index):
+        """
+        Returns the path of segment `index`, building it now if needed. Concurrent requests for
+        the same segment share one ffmpeg run; a queued prefetch of it is pulled forward.
+        """
+        session = self._session(media_id, path)
+        if not 0 <= index < session.segment_count:
+            raise IndexError(index)
+        self._prefetch(session, index)
+        cached = self.cache.lookup(session.cache_key, index)
+        if cached:
+            return cached
+
+        with session.lock:
+            future = session.pending.get(index)
+            owner = future is None or future.cancel()
+            if owner:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                session.pending[index] = future
+        if not owner:
+            try:
+                return future.result(timeout=SEGMENT_TIMEOUT_SECONDS)
+            except (FutureTimeoutError, CancelledError) as e:
+                raise HlsError(f"Gave up waiting for segment {index} of {path}") from e
+        try:
+            future.set_result(session.build_segment(index, self.cache))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            session.forget(index, future)
+        return future.result()
+
+    def get_stats(self):
+        with self._lock:
+            sessions = {media_id: {'path': s.path, 'remux': s.remux, 'pending': len(s.pending)} for media_id, s in self.sessions.items()}
+        return {'cache': self.cache.get_stats(), 'sessions': sessions}
+
+# --- Shared Instance ---
+_manager = HlsManager()
+
+def configure(cache_dir=None, cache_max_bytes=None, ffmpeg=None, ffprobe=None, workers=None):
+    """Replaces the shared manager with one using the given settings (None keeps the default)."""
+    global _manager
+    _manager = HlsManager(
+        cache_dir=cache_dir or DEFAULT_CACHE_DIR,
+        cache_max_bytes=cache_max_bytes or DEFAULT_CACHE_MAX_BYTES,
+        ffmpeg=ffmpeg or DEFAULT_FFMPEG,
+        ffprobe=ffprobe or DEFAULT_FFPROBE,
+        workers=workers or DEFAULT_WORKERS,
+    )
+
+def needs_hls(path):
+    """True if the browser can't play the file directly (non-MP4 container or codecs)."""
+    try:
+        info = probe(path, _manager.ffprobe)
+    except (HlsError, OSError) as e:
+        logging.warning(f"Could not probe {path}, falling back to direct streaming: {e}")
+        return False
+    container_ok = any(name in BROWSER_CONTAINERS for name in info['format'].split(','))
+    audio_ok = info['audio_codec'] is None or info['audio_codec'] in BROWSER_AUDIO_CODECS
+    return not (container_ok and info['video_codec'] in BROWSER_VIDEO_CODECS and audio_ok)
+
+def get_playlist(media_id, path):
+    """Returns the VOD playlist text for a library file."""
+    return _manager.get_playlist(media_id, path)
+
+def get_segment(media_id, path, index):
+    """Returns the filesystem path of a (possibly just built) .ts segment."""
+    return _manager.get_segment(media_id, path, index)
+
+def get_stats():
+    """Returns segment cache usage and the active sessions."""
+    return _manager.get_stats()
@@ -0,0 +1,267 @@
+# image_cache.py
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from queue import Queue, Full
+from threading import Lock, Thread
+import requests
+from requests.adapters import HTTPAdapter
+
+# --- Configuration ---
+DEFAULT_ORIGIN = 'https://image.tmdb.org/t/p'
+DEFAULT_CACHE_DIR = 'image_cache'
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 ** 2
+DEFAULT_TIMEOUT = (3.05, 15)    # (connect, read) seconds
+PREFETCH_WORKERS = 4
+MAX_QUEUED_PREFETCHES = 5000    # prefetches past this are dropped; the image is fetched on first view instead
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STALE_TEMP_SECONDS = 300       # older .tmp files are leftovers, not fetches in progress
+
+# Variant -> TMDb size. The origin serves each size already scaled and recompressed,
+# so a grid thumb is ~25 KB instead of the ~100 KB w500 poster stored in the library.
+VARIANTS = {
+    'thumb': 'w342',      # library grids and cards
+    'detail': 'w500',     # poster on the detail pages
+    'backdrop': 'w1280',  # detail page header
+}
+# Library column -> variants rendered from it, fetched when a new item is ingested.
+PREFETCH_VARIANTS = {'poster': ('thumb', 'detail'), 'backdrop_path': ('backdrop',)}
+
+_TMDB_IMAGE_URL = re.compile(r'^https?://image\.tmdb\.org/t/p/[^/]+/([^/?#]+)$')
+_FILENAME = re.compile(r'^[A-Za-z0-9_-]+\.(?:jpe?g|png|webp|svg)$')
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class ImageError(Exception):
+    """Raised when the origin can't be reached or answers with something other than an image or a 404."""
+
+def tmdb_filename(url):
+    """The image file named by a stored image.tmdb.org URL, or None for anything else."""
+    match = _TMDB_IMAGE_URL.match(url or '')
+    if not match or not _FILENAME.match(match.group(1)):
+        return None
+    return match.group(1)
+
+def is_valid_filename(filename):
+    return bool(_FILENAME.match(filename))
+
+# --- Image Cache ---
+class ImageCache:
+    """
+    Size-bounded LRU of origin images on disk, one file per variant/filename. Each image is
+    fetched once; concurrent requests for the same one wait for that fetch. Survives restarts
+    (order rebuilt from mtimes). Every worker process shares the directory but keeps its own
+    accounting, so lookups go to the disk.
+    """
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES, origin=DEFAULT_ORIGIN, timeout=DEFAULT_TIMEOUT):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.origin = origin.rstrip('/')
+        self.timeout = timeout
+        self._entries = None  # relative path -> size, least recently used first
+        self._total = 0
+        self._fetching = {}   # relative path -> Future of the running fetch's size
+        self._lock = Lock()
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=PREFETCH_WORKERS * 2))
+        self._session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=PREFETCH_WORKERS * 2))
+        self._prefetch_queue = Queue(maxsize=MAX_QUEUED_PREFETCHES)
+        self._queued = set()  # relative paths waiting in the prefetch queue
+        self._prefetch_workers = []
+        self._stats = {'hits': 0, 'misses': 0, 'fetches': 0, 'not_found': 0, 'errors': 0, 'evictions': 0, 'prefetches_dropped': 0}
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        found = []
+        os.makedirs(self.directory, exist_ok=True)
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                    if name.endswith('.tmp'):
+                        # Another worker may be writing this one; only old temp files are leftovers.
+                        if stat.st_mtime < stale_before:
+                            os.remove(path)
+                        continue
+                except OSError:
+                    continue  # removed by another worker while we walked
+                found.append((stat.st_mtime, os.path.relpath(path, self.directory), stat.st_size))
+        self._entries = OrderedDict((rel, size) for _, rel, size in sorted(found))
+        self._total = sum(self._entries.values())
+
+    def origin_url(self, variant, filename):
+        return f"{self.origin}/{VARIANTS[variant]}/{filename}"
+
+    def _lookup(self, rel):
+        """
+        Called with the lock held: marks a cached image recently used and returns its size, or None.
+        Picks up images other workers fetched and forgets ones they evicted.
+        """
+        self._load()
+        try:
+            size = os.path.getsize(os.path.join(self.directory, rel))
+        except OSError:
+            size = None
+        self._total -= self._entries.pop(rel, 0)
+        if size is not None:
+            self._entries[rel] = size
+            self._total += size
+        return size
+
+    def get(self, variant, filename):
+        """Returns (path, size) of the cached image, fetching it on a miss, or None if the origin has no such image."""
+        rel = os.path.join(variant, filename)
+        with self._lock:
+            size = self._lookup(rel)
+            fetching = self._fetching.get(rel)
+            owner = size is None and fetching is None
+            if owner:
+                fetching = self._fetching[rel] = Future()
+            self._stats['hits' if size is not None else 'misses'] += 1
+        if size is None:
+            if owner:
+                try:
+                    size = self._fetch(variant, filename, rel)
+                    fetching.set_result(size)
+                except Exception as e:
+                    fetching.set_exception(e)
+                    raise
+                finally:
+                    with self._lock:
+                        del self._fetching[rel]
+            else:
+                # Waiters share the owner's outcome, so a failed fetch falls back the same way.
+                try:
+                    size = fetching.result(timeout=sum(self.timeout))
+                except FutureTimeoutError as e:
+                    raise ImageError(f"Gave up waiting for {rel}") from e
+            if size is None:
+                return None
+        path = os.path.join(self.directory, rel)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path, size
+
+    def _fetch(self, variant, filename, rel):
+        url = self.origin_url(variant, filename)
+        try:
+            response = self._session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._count('errors')
+            raise ImageError(f"Fetching {url} failed: {e}") from e
+        if response.status_code == 404:
+            self._count('not_found')
+            return None
+        if response.status_code != 200 or not response.headers.get('Content-Type', '').startswith('image/'):
+            self._count('errors')
+            raise ImageError(f"Fetching {url} returned {response.status_code} ({response.headers.get('Content-Type')})")
+        self._count('fetches')
+        return self._add(rel, response.content)
+
+    def _add(self, rel, data):
+        """Writes an image into the cache, evicting the least recently used ones over budget."""
+        path = os.path.join(self.directory, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{time.monotonic_ns()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._load()
+            self._total += len(data) - self._entries.pop(rel, 0)
+            self._entries[rel] = len(data)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_rel, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                self._stats['evictions'] += 1
+                try:
+                    os.remove(os.path.join(self.directory, old_rel))
+                except OSError:
+                    pass
+        return len(data)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def prefetch(self, variant, filename):
+        """Queues an image to be fetched in the background unless it is already cached."""
+        rel = os.path.join(variant, filename)
+        with self._lock:
+            if rel in self._fetching or rel in self._queued or os.path.exists(os.path.join(self.directory, rel)):
+                return
+            self._queued.add(rel)
+            if not self._prefetch_workers:
+                self._prefetch_workers = [Thread(target=self._prefetch_loop, name=f'image-prefetch-{i}', daemon=True)
+                                          for i in range(PREFETCH_WORKERS)]
+                for worker in self._prefetch_workers:
+                    worker.start()
+        try:
+            self._prefetch_queue.put_nowait((variant, filename))
+        except Full:
+            with self._lock:
+                self._queued.discard(rel)
+                self._stats['prefetches_dropped'] += 1
+
+    def _prefetch_loop(self):
+        while True:
+            variant, filename = self._prefetch_queue.get()
+            try:
+                self.get(variant, filename)
+            except (ImageError, OSError) as e:
+                logging.warning(f"Image prefetch failed: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(os.path.join(variant, filename))
+
+    def get_stats(self):
+        with self._lock:
+            self._load()
+            return dict(self._stats, images=len(self._entries), bytes=self._total, max_bytes=self.max_bytes,
+                        queued_prefetches=self._prefetch_queue.qsize())
+
+# --- Shared Instance ---
+_cache = ImageCache()
+
+def configure(cache_dir=None, cache_max_bytes=None, origin=None):
+    """Replaces the shared cache with one using the given settings (None keeps the default)."""
+    global _cache
+    _cache = ImageCache(
+        directory=cache_dir or DEFAULT_CACHE_DIR,
+        max_bytes=cache_max_bytes or DEFAULT_CACHE_MAX_BYTES,
+        origin=origin or DEFAULT_ORIGIN,
+    )
+
+def get_image(variant, filename):
+    """Returns (path, size) of a cached image variant, fetching it on a miss; None if the origin has no such image."""
+    return _cache.get(variant, filename)
+
+def origin_url(variant, filename):
+    return _cache.origin_url(variant, filename)
+
+def prefetch(columns):
+    """Queues the variants rendered from a library row's image columns ({'poster': url, ...})."""
+    for column, url in columns.items():
+        filename = tmdb_filename(url)
+        if filename:
+            for variant in PREFETCH_VARIANTS.get(column, ()):
+                _cache.prefetch(variant, filename)
+
+def get_stats():
+    """Returns hit/fetch counters and disk usage of the shared cache."""
+    return _cache.get_stats()
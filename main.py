@@ -1,6 +1,6 @@
 # main.py
 import asyncio
-from api import find_best_release, add_item_to_watchlist, remove_item_from_watchlist, get_watchlist
+from api import find_best_release, find_best_releases, search_trackers, close_search_engine, get_tracker_stats, add_item_to_watchlist, remove_item_from_watchlist, get_watchlist
 
 async def main():
     """
@@ -22,6 +22,17 @@ async def main():
     else:
         print("No results found.")
 
+    print("\n--- Example: Ranked shortlist, deduplicated across trackers ---")
+    for release in await find_best_releases(query_data, k=5):
+        print(f"{release.score:6.1f}  {release.title} ({release.seeders} seeders, on {', '.join(release.trackers) or 'unknown'})")
+
+    print("\n--- Example: Streaming results as each tracker answers ---")
+    async for tracker_name, results in search_trackers(query_data):
+        print(f"{tracker_name}: {len(results)} result(s)")
+    for tracker_name, stats in get_tracker_stats().items():
+        print(f"{tracker_name}: {stats['searches']} searches, avg {stats['avg_ms']} ms, {stats['logins']} login(s)")
+    await close_search_engine()
+
     print("\n--- Example: Getting the current watchlist ---")
     watchlist = get_watchlist()
     for movie in watchlist["movies"]:
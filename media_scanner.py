@@ -4,42 +4,58 @@ import time
 import logging
 import json
 import uuid
+import base64
+import hashlib
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import requests
 import re
-from threading import Thread
+import tmdb_client
+import tmdb_cache
+import database
+import image_cache
+import release_parser
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from queue import Queue, Empty
+from threading import Thread, Lock, BoundedSemaphore, Event
 
 # --- Configuration ---
-DB_NAME = 'slimstash.db'
+VIDEO_EXTENSIONS = ('.mkv', '.mp4', '.avi')
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_SCAN_BATCH_SIZE = 50
+LIBRARY_PAGE_SIZE = 60          # cards per library page; divides evenly into every grid width
+MAX_LIBRARY_PAGE_SIZE = 200
+WRITER_IDLE_FLUSH_SECONDS = 2.0
+WATCHER_QUIET_PERIOD_SECONDS = 5.0
+MTIME_GRANULARITY_NS = 2 * 10 ** 9  # coarsest directory mtime resolution expected (FAT, some SMB mounts)
+_END_OF_SCAN = object()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Global Variables ---
 app_instance = None
 tmdb_api_key = None
+_scan_lock = Lock()
 
 # --- Database Interaction ---
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Borrows a connection from the shared pool in database.py (WAL, tuned pragmas)."""
+    return database.get_db_connection()
 
 # --- Metadata Fetching ---
+def get_tmdb_call_count():
+    """Returns the number of requests that actually went to TMDb (cache misses and refreshes)."""
+    return tmdb_client.get_stats()['cache']['network_calls']
+
 def get_tmdb_data(query, year=None, is_tv=False):
     """Fetches search results from TMDb."""
     if not tmdb_api_key:
         return None
     search_type = 'tv' if is_tv else 'movie'
-    url = f"https://api.themoviedb.org/3/search/{search_type}?api_key={tmdb_api_key}&query={query}"
-    if year:
-        url += f"&year={year}"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        results = response.json().get('results')
+        results = tmdb_client.get_json(f"/search/{search_type}", {'api_key': tmdb_api_key, 'query': query, 'year': year}).get('results')
         return results[0] if results else None
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logging.error(f"Error fetching TMDb data for '{query}': {e}")
         return None
 
@@ -48,159 +64,625 @@ def get_tmdb_details(tmdb_id, is_tv=False):
     if not tmdb_api_key or not tmdb_id:
         return {}
     media_type = 'tv' if is_tv else 'movie'
-    details_url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}?api_key={tmdb_api_key}&append_to_response=credits,recommendations"
     try:
-        response = requests.get(details_url)
-        response.raise_for_status()
-        return response.json()
-    except requests.RequestException as e:
+        return tmdb_client.get_json(f"/{media_type}/{tmdb_id}", {'api_key': tmdb_api_key, 'append_to_response': 'credits,recommendations'})
+    except (requests.RequestException, ValueError) as e:
         logging.error(f"Error fetching TMDb details for ID {tmdb_id}: {e}")
         return {}
 
 # --- Filename Parsing ---
 def parse_filename(filename):
-    """Extracts title, year, season, and episode from a filename."""
-    filename = os.path.basename(filename)
-    title = filename
-    year = None
-    season = None
-    episode = None
-
-    # Year pattern (e.g., 2023)
-    year_match = re.search(r'\(?(\d{4})\)?', title)
-    if year_match:
-        year = int(year_match.group(1))
-        title = title.replace(year_match.group(0), '').strip()
-
-    # Season/Episode pattern (e.g., S01E02)
-    se_match = re.search(r'[._\s-]([Ss](\d{1,2})[._\s-]*[Ee](\d{1,2}))[._\s-]', title, re.IGNORECASE)
-    if se_match:
-        season = int(se_match.group(2))
-        episode = int(se_match.group(3))
-        title = re.split(r'[._\s-][Ss]\d{1,2}[._\s-]*[Ee]\d{1,2}', title, flags=re.IGNORECASE)[0]
-
-    # Clean up title
-    title = re.sub(r'\b(1080p|720p|WEB-DL|BluRay|x264|H264|DDP5.1|Atmos|REPACK|PRSRPNT|T3STDRV|Dolf4c3)\b.*', '', title, flags=re.IGNORECASE)
-    title = title.replace('.', ' ').replace('_', ' ').strip()
-    
-    return {'title': title, 'year': year, 'season': season, 'episode': episode}
+    """
+    Extracts title, year, season and episode (plus the rest of release_parser.parse's fields)
+    from a file name.
+    """
+    return release_parser.parse(filename)
 
 # --- Library Management ---
-def scan_and_update_library():
-    """Scans media directories and updates the database."""
-    logging.info("Starting library scan...")
+class DirectoryFingerprints:
+    """
+    What each library directory looked like at the last scan, persisted in scan_directories: its
+    mtime, how many video files and subdirectories it held, a digest of their names, sizes and
+    mtimes, and the subdirectory names. Adding, removing or renaming an entry moves a directory's
+    mtime, so a directory whose mtime hasn't moved can be descended into without listing it or
+    statting its files.
+    """
+    def __init__(self, rows=()):
+        self.known = {row['path']: row for row in rows}
+        self.updated = {}     # path -> (mtime_ns, entries, digest, subdirs, scanned_at_ns) seen this scan
+        self.removed = set()  # subdirectories that have disappeared, with everything below them
+
+    @classmethod
+    def load(cls):
+        conn = get_db_connection()
+        try:
+            return cls(conn.execute("SELECT * FROM scan_directories").fetchall())
+        except sqlite3.Error as e:
+            logging.error(f"Error loading directory fingerprints, rescanning everything: {e}")
+            return cls()
+        finally:
+            conn.close()
+
+    def unchanged_subdirs(self, path, mtime_ns):
+        """The subdirectory names of a directory that is unchanged since it was fingerprinted, else None."""
+        row = self.known.get(path)
+        if row is None or row['mtime_ns'] != mtime_ns:
+            return None
+        # An entry added in the same mtime tick as the last listing wouldn't have moved the mtime.
+        if row['mtime_ns'] >= row['scanned_at_ns'] - MTIME_GRANULARITY_NS:
+            return None
+        return json.loads(row['subdirs'])
+
+    def record(self, path, mtime_ns, files, subdirs, scanned_at_ns):
+        """Stores a directory's new listing; returns False if its video files are the same as last time."""
+        entries = len(files) + len(subdirs)
+        digest = hashlib.blake2b(repr((sorted(files), sorted(subdirs))).encode(), digest_size=16).hexdigest()
+        self.updated[path] = (mtime_ns, entries, digest, json.dumps(subdirs), scanned_at_ns)
+        row = self.known.get(path)
+        if row is not None:
+            self.removed.update(os.path.join(path, name) for name in set(json.loads(row['subdirs'])) - set(subdirs))
+        return row is None or (row['entries'], row['digest']) != (entries, digest)
+
+    def save(self, failed_dirs=()):
+        """
+        Persists this scan's listings. Directories holding a file that failed to ingest are forgotten
+        instead, so the next scan lists them again and retries it.
+        """
+        conn = get_db_connection()
+        try:
+            with conn:
+                for path in self.removed:
+                    prefix = os.path.join(path, '')
+                    conn.execute("DELETE FROM scan_directories WHERE path = ? OR substr(path, 1, ?) = ?", (path, len(prefix), prefix))
+                conn.executemany("""
+                    INSERT INTO scan_directories (path, mtime_ns, entries, digest, subdirs, scanned_at_ns) VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (path) DO UPDATE SET mtime_ns = excluded.mtime_ns, entries = excluded.entries, digest = excluded.digest,
+                        subdirs = excluded.subdirs, scanned_at_ns = excluded.scanned_at_ns
+                """, [(path, *values) for path, values in self.updated.items() if path not in failed_dirs])
+                conn.executemany("DELETE FROM scan_directories WHERE path = ?", [(path,) for path in failed_dirs])
+        except sqlite3.Error as e:
+            logging.error(f"Error saving directory fingerprints: {e}")
+        finally:
+            conn.close()
+
+def _list_directory(directory):
+    """One scandir pass: ([(name, size, mtime_ns, mtime)] for the video files, [subdirectory names])."""
+    files, subdirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(VIDEO_EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_size, stat.st_mtime_ns, stat.st_mtime))
+            except OSError as e:
+                logging.warning(f"Could not stat '{entry.path}': {e}")
+    return files, subdirs
+
+def _walk_media_files(roots, fingerprints=None, stats=None):
+    """
+    Pipeline stage 1: walks each library root and yields (path, is_tv, mtime) for every video file.
+    With fingerprints, unchanged directories are only descended through, and a directory whose
+    video files are all as they were yields none of them.
+    """
+    for root_dir, is_tv in roots:
+        pending = [root_dir]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError as e:
+                logging.warning(f"Could not stat '{directory}': {e}")
+                continue
+            subdirs = fingerprints.unchanged_subdirs(directory, mtime_ns) if fingerprints else None
+            if subdirs is not None:
+                if stats: stats.dirs_skipped += 1
+            else:
+                scanned_at_ns = time.time_ns()
+                try:
+                    files, subdirs = _list_directory(directory)
+                except OSError as e:
+                    logging.warning(f"Could not list '{directory}': {e}")
+                    continue
+                if stats: stats.dirs_listed += 1
+                if not fingerprints or fingerprints.record(directory, mtime_ns, [f[:3] for f in files], subdirs, scanned_at_ns):
+                    for name, _, _, mtime in files:
+                        yield os.path.join(directory, name), is_tv, mtime
+            pending.extend(os.path.join(directory, name) for name in reversed(subdirs))
+
+def _filter_changed_files(candidates, conn, stats):
+    """
+    Pipeline stage 2: drops the files whose stored mtime is unchanged. Every stored path and mtime
+    is loaded in one query up front; candidates without an mtime are statted here.
+    """
+    stored = dict(conn.execute("SELECT path, last_modified FROM movies UNION ALL SELECT path, last_modified FROM episodes").fetchall())
+    for path, is_tv, current_mtime in candidates:
+        stats.files_seen += 1
+        if current_mtime is None:
+            try:
+                current_mtime = os.path.getmtime(path)
+            except OSError as e:
+                logging.warning(f"Could not stat '{path}': {e}")
+                continue
+        if stored.get(path) == current_mtime:
+            continue
+        yield path, is_tv, current_mtime
+
+def _parse_files(changed, batch_size=DEFAULT_SCAN_BATCH_SIZE):
+    """Pipeline stage 3: parses the release names of the changed files, a batch at a time."""
+    changed = iter(changed)
+    while True:
+        batch = list(islice(changed, batch_size))
+        if not batch:
+            return
+        for (path, is_tv, current_mtime), parsed in zip(batch, release_parser.parse_many(path for path, _, _ in batch)):
+            yield path, is_tv, current_mtime, parsed
+
+class ScanStats:
+    """Counters reported at the end of a library scan."""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.cache_stats_at_start = tmdb_client.get_stats()['cache']
+        self.dirs_listed = 0
+        self.dirs_skipped = 0
+        self.files_seen = 0
+        self.files_changed = 0
+        self.records_written = 0
+        self.failures = 0
+        self.failed_dirs = set()
+        self._lock = Lock()
+
+    def record_failures(self, paths):
+        with self._lock:
+            self.failures += len(paths)
+            self.failed_dirs.update(os.path.dirname(path) for path in paths)
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        cache_stats = tmdb_client.get_stats()['cache']
+        tmdb_calls = cache_stats['network_calls'] - self.cache_stats_at_start['network_calls']
+        calls_saved = cache_stats['calls_saved'] - self.cache_stats_at_start['calls_saved']
+        return (f"{self.dirs_listed} directories listed, {self.dirs_skipped} unchanged, "
+                f"{self.files_seen} files seen, {self.files_changed} changed, {self.records_written} written, "
+                f"{self.failures} failed in {elapsed:.1f}s ({self.files_seen / elapsed:.1f} files/s, "
+                f"{tmdb_calls} TMDb calls at {tmdb_calls / elapsed:.1f} calls/s, {calls_saved} served from cache)")
+
+class _BatchWriter(Thread):
+    """Pipeline stage 5: the only thread that writes scan results, committing them in batches."""
+    def __init__(self, batch_size, stats):
+        super().__init__(name='library-scan-writer', daemon=True)
+        self.batch_size = batch_size
+        self.stats = stats
+        self.records = Queue(maxsize=batch_size * 4)
+
+    def run(self):
+        self.batch = []
+        try:
+            self._write_batches()
+        except Exception as e:
+            # Keep consuming so the workers and run_scan_pipeline never block on a dead writer.
+            logging.error(f"Library scan writer stopped, failing the rest of this scan: {e}")
+            self.stats.record_failures([_record_path(record) for record in self.batch])
+            while True:
+                record = self.records.get()
+                if record is _END_OF_SCAN:
+                    break
+                self.stats.record_failures([_record_path(record)])
+
+    def _write_batches(self):
+        conn = get_db_connection()
+        if conn is None:
+            raise sqlite3.OperationalError("no database connection")
+        try:
+            while True:
+                try:
+                    record = self.records.get(timeout=WRITER_IDLE_FLUSH_SECONDS)
+                except Empty:
+                    # Nothing arrived for a while (slow lookups); commit what we have so it shows up.
+                    self._flush(conn)
+                    continue
+                if record is _END_OF_SCAN:
+                    break
+                self.batch.append(record)
+                if len(self.batch) >= self.batch_size:
+                    self._flush(conn)
+            self._flush(conn)
+        finally:
+            conn.close()
+
+    def _flush(self, conn):
+        batch = self.batch
+        if not batch:
+            return
+        try:
+            with conn:
+                cursor = conn.cursor()
+                for record in batch:
+                    write_media_record(cursor, record)
+            self.stats.records_written += len(batch)
+        except Exception as e:
+            logging.error(f"Error committing batch of {len(batch)} scanned files: {e}")
+            self.stats.record_failures([_record_path(record) for record in batch])
+            batch.clear()
+            return
+        for record in batch:
+            try:
+                image_cache.prefetch(_record_images(record))
+            except Exception as e:
+                logging.warning(f"Could not queue image prefetch for '{_record_path(record)}': {e}")
+        batch.clear()
+
+def _fetch_into_writer(writer, stats, memo, path, is_tv, current_mtime, parsed):
+    """Pipeline stage 4 (runs in the worker pool): fetches metadata and hands the row to the writer."""
+    try:
+        record = fetch_media_record(path, parsed, current_mtime, is_tv, memo)
+    except Exception as e:
+        logging.error(f"Error fetching metadata for '{path}': {e}")
+        record = None
+    if record is None:
+        stats.record_failures([path])
+        return
+    writer.records.put(record)
+
+def run_scan_pipeline(candidates, workers=DEFAULT_SCAN_WORKERS, batch_size=DEFAULT_SCAN_BATCH_SIZE, stats=None):
+    """Runs filter -> parse -> metadata pool -> batched writer over (path, is_tv, mtime or None) candidates."""
+    stats = stats or ScanStats()
+    memo = ScanMemo()
+    writer = _BatchWriter(batch_size, stats)
+    writer.start()
+    # Bounds the work queued ahead of the pool so a huge library doesn't become 40k pending futures.
+    in_flight = BoundedSemaphore(workers * 2)
     conn = get_db_connection()
     try:
-        # We need an app context to access the config
-        with app_instance.app_context():
-            movie_dir = app_instance.config.get('MOVIE_DIR')
-            tv_dir = app_instance.config.get('TV_DIR')
-
-            # Process Movies
-            if movie_dir and os.path.exists(movie_dir):
-                for root, _, files in os.walk(movie_dir):
-                    for file in files:
-                        if file.lower().endswith(('.mkv', '.mp4', '.avi')):
-                            process_media_file(os.path.join(root, file), conn, is_tv=False)
-            
-            # Process TV Shows
-            if tv_dir and os.path.exists(tv_dir):
-                for root, _, files in os.walk(tv_dir):
-                    for file in files:
-                        if file.lower().endswith(('.mkv', '.mp4', '.avi')):
-                            process_media_file(os.path.join(root, file), conn, is_tv=True)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='library-scan') as executor:
+            for path, is_tv, current_mtime, parsed in _parse_files(_filter_changed_files(candidates, conn, stats), batch_size):
+                stats.files_changed += 1
+                logging.info(f"Processing new/updated file: {path}")
+                in_flight.acquire()
+                future = executor.submit(_fetch_into_writer, writer, stats, memo, path, is_tv, current_mtime, parsed)
+                future.add_done_callback(lambda _: in_flight.release())
     finally:
         conn.close()
-    logging.info("Library scan finished.")
-
-def process_media_file(path, conn, is_tv):
-    """Processes a single media file, adding or updating it in the database."""
-    cursor = conn.cursor()
-    cursor.execute("SELECT last_modified FROM movies WHERE path = ? UNION ALL SELECT last_modified FROM tv_shows WHERE path = ?", (path, path))
-    result = cursor.fetchone()
-    
-    current_mtime = os.path.getmtime(path)
+        writer.records.put(_END_OF_SCAN)
+        writer.join()
+    return stats
 
-    if result and result['last_modified'] == current_mtime:
-        return # File hasn't changed
+def _library_roots():
+    """Returns the configured (directory, is_tv) pairs that exist on disk."""
+    roots = []
+    with app_instance.app_context():
+        movie_dir = app_instance.config.get('MOVIE_DIR')
+        tv_dir = app_instance.config.get('TV_DIR')
+    if movie_dir and os.path.exists(movie_dir):
+        roots.append((movie_dir, False))
+    if tv_dir and os.path.exists(tv_dir):
+        roots.append((tv_dir, True))
+    return roots
+
+def _scan_settings():
+    """Reads the scan concurrency and batch size from the app config."""
+    with app_instance.app_context():
+        workers = int(app_instance.config.get('SCAN_WORKERS') or DEFAULT_SCAN_WORKERS)
+        batch_size = int(app_instance.config.get('SCAN_BATCH_SIZE') or DEFAULT_SCAN_BATCH_SIZE)
+    return max(workers, 1), max(batch_size, 1)
+
+def scan_and_update_library(full=False, wait=False):
+    """
+    Scans media directories and updates the database. Directories unchanged since the last scan
+    are skipped unless full is set (e.g. after files were rewritten in place). If a scan is already
+    running this returns None, or with wait set, runs once that scan has finished.
+    """
+    # Only one scan may run at a time.
+    if not _scan_lock.acquire(blocking=wait):
+        logging.info("Library scan already in progress; skipping.")
+        return None
+    try:
+        logging.info("Starting library scan...")
+        workers, batch_size = _scan_settings()
+        fingerprints = DirectoryFingerprints() if full else DirectoryFingerprints.load()
+        stats = ScanStats()
+        run_scan_pipeline(_walk_media_files(_library_roots(), fingerprints, stats), workers=workers, batch_size=batch_size, stats=stats)
+        fingerprints.save(stats.failed_dirs)
+        logging.info(f"Library scan finished: {stats.summary()}")
+        # Entries past their stale window can never be served again; without this the file only grows.
+        tmdb_cache.purge_expired()
+        return stats
+    finally:
+        _scan_lock.release()
+
+def _library_kind(path, roots):
+    """Returns is_tv for a path inside one of the library roots, or None if it is outside them."""
+    path = os.path.abspath(path)
+    for root_dir, is_tv in roots:
+        root_dir = os.path.abspath(root_dir)
+        if path == root_dir or path.startswith(root_dir.rstrip(os.sep) + os.sep):
+            return is_tv
+    return None
+
+def _rewrite_paths(cursor, src, dest, is_directory):
+    """Points stored rows at a moved file or directory. Returns the number of rows updated."""
+    updated = 0
+    for table in ('movies', 'episodes'):
+        if is_directory:
+            prefix = src.rstrip(os.sep) + os.sep
+            cursor.execute(f"UPDATE {table} SET path = ? || substr(path, ?) WHERE substr(path, 1, ?) = ?",
+                           (dest.rstrip(os.sep) + os.sep, len(prefix) + 1, len(prefix), prefix))
+        else:
+            cursor.execute(f"UPDATE {table} SET path = ? WHERE path = ?", (dest, src))
+        updated += cursor.rowcount
+    return updated
+
+def _delete_paths(cursor, path, is_directory):
+    """Removes the rows for a deleted file, or for everything under a deleted directory."""
+    for table in ('movies', 'episodes'):
+        if is_directory:
+            prefix = path.rstrip(os.sep) + os.sep
+            cursor.execute(f"DELETE FROM {table} WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+        else:
+            cursor.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+def _prune_empty_shows(cursor):
+    """Drops seasons and shows that no longer have any episode files."""
+    cursor.execute("DELETE FROM seasons WHERE NOT EXISTS (SELECT 1 FROM episodes WHERE episodes.season_id = seasons.id)")
+    cursor.execute("DELETE FROM shows WHERE NOT EXISTS (SELECT 1 FROM episodes WHERE episodes.show_id = shows.id)")
+
+def apply_library_changes(changes):
+    """
+    Applies a batch of coalesced filesystem changes without rescanning the whole library.
+    Each change is (action, path, dest_path, is_directory) with action 'ingest', 'delete' or 'move'.
+    """
+    roots = _library_roots()
+    to_ingest = []
+    with _scan_lock:
+        conn = get_db_connection()
+        try:
+            with conn:
+                cursor = conn.cursor()
+                for action, path, dest_path, is_directory in changes:
+                    if action == 'move':
+                        src_kind, dest_kind = _library_kind(path, roots), _library_kind(dest_path, roots)
+                        if dest_kind is not None and src_kind == dest_kind and _rewrite_paths(cursor, path, dest_path, is_directory):
+                            logging.info(f"Kept library entry for moved path: {path} -> {dest_path}")
+                            continue
+                        # Unknown source, or moved between/out of libraries: treat as delete + ingest.
+                        _delete_paths(cursor, path, is_directory)
+                        if dest_kind is not None:
+                            to_ingest.append((dest_path, dest_kind, is_directory))
+                    elif action == 'delete':
+                        logging.info(f"Removing deleted path from library: {path}")
+                        _delete_paths(cursor, path, is_directory)
+                    else:
+                        kind = _library_kind(path, roots)
+                        if kind is not None:
+                            to_ingest.append((path, kind, is_directory))
+                _prune_empty_shows(cursor)
+        except sqlite3.Error as e:
+            logging.error(f"Error applying library changes: {e}")
+        finally:
+            conn.close()
+
+        if to_ingest:
+            candidates = []
+            for path, is_tv, is_directory in to_ingest:
+                if is_directory:
+                    candidates.extend(_walk_media_files([(path, is_tv)]))
+                elif os.path.exists(path):
+                    candidates.append((path, is_tv, None))
+            workers, batch_size = _scan_settings()
+            stats = run_scan_pipeline(candidates, workers=workers, batch_size=batch_size)
+            logging.info(f"Incremental update finished: {stats.summary()}")
+
+def _format_cast(details):
+    return json.dumps([{'name': c['name'], 'character': c['character'], 'profile_path': f"https://image.tmdb.org/t/p/w185{c['profile_path']}" if c['profile_path'] else None} for c in details.get('credits', {}).get('cast', [])[:10]])
+
+def _format_recommendations(details):
+    return json.dumps([{'id': r['id'], 'title': r.get('title') or r.get('name'), 'year': (r.get('release_date') or r.get('first_air_date','-')).split('-')[0], 'poster': f"https://image.tmdb.org/t/p/w500{r['poster_path']}", 'type': r['media_type']} for r in details.get('recommendations', {}).get('results', [])[:10]])
+
+def _normalize_title(title):
+    return re.sub(r'[^a-z0-9]+', ' ', (title or '').lower()).strip()
+
+class ScanMemo:
+    """
+    Per-scan memo shared by the metadata workers. Concurrent requests for the same key wait
+    for the first one instead of issuing duplicate TMDb calls.
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = [Event(), None]
+        if owner:
+            try:
+                entry[1] = compute()
+            finally:
+                entry[0].set()
+        else:
+            entry[0].wait()
+        return entry[1]
+
+def _fetch_series_fields(title, year):
+    """Looks up a series once and pre-formats the columns every one of its episodes shares."""
+    tmdb_show_info = get_tmdb_data(title, year, is_tv=True)
+    if not tmdb_show_info: return None
+
+    details = get_tmdb_details(tmdb_show_info['id'], is_tv=True)
+    if not details: return None
+
+    return {
+        'tmdb_id': str(details.get('id')),
+        'title': details.get('name') or title,
+        'genre': json.dumps([g['name'] for g in details.get('genres', [])]),
+        'poster': f"https://image.tmdb.org/t/p/w500{details.get('poster_path')}",
+        'backdrop_path': f"https://image.tmdb.org/t/p/w1280{details.get('backdrop_path')}",
+        'overview': details.get('overview'),
+        'release_date': details.get('first_air_date'),
+        'cast': _format_cast(details),
+        'recommendations': _format_recommendations(details),
+    }
+
+def _fetch_season_episodes(series_id, season_number):
+    """Fetches a whole season and returns its episodes keyed by episode number."""
+    try:
+        season = tmdb_client.get_json(f"/tv/{series_id}/season/{season_number}", {'api_key': tmdb_api_key})
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Error fetching TMDb season {season_number} of series {series_id}: {e}")
+        return {}
+    return {ep.get('episode_number'): ep for ep in season.get('episodes', [])}
 
-    logging.info(f"Processing new/updated file: {path}")
-    parsed = parse_filename(path)
-    
+def fetch_media_record(path, parsed, current_mtime, is_tv, memo=None):
+    """Looks up TMDb metadata for a parsed file and returns the (table, values) row to store, or None."""
     if is_tv:
-        # For TV, we group by show title
-        tmdb_show_info = get_tmdb_data(parsed['title'], parsed['year'], is_tv=True)
-        if not tmdb_show_info: return
+        memo = memo or ScanMemo()
+        # Series details are shared by every episode of the show, so look them up once per scan.
+        series_key = ('series', _normalize_title(parsed['title']), parsed['year'])
+        series = memo.get(series_key, lambda: _fetch_series_fields(parsed['title'], parsed['year']))
+        if not series: return None
 
-        details = get_tmdb_details(tmdb_show_info['id'], is_tv=True)
-        if not details: return
-
-        # Get episode-specific details
+        # One season request covers all of its episodes.
         episode_details = {}
         if parsed['season'] and parsed['episode']:
-            try:
-                ep_url = f"https://api.themoviedb.org/3/tv/{details['id']}/season/{parsed['season']}/episode/{parsed['episode']}?api_key={tmdb_api_key}"
-                ep_res = requests.get(ep_url).json()
-                episode_details['title'] = ep_res.get('name')
-                episode_details['overview'] = ep_res.get('overview')
-                episode_details['still_path'] = ep_res.get('still_path')
-            except Exception:
-                pass
-
-        cursor.execute("""
-            INSERT OR REPLACE INTO tv_shows (id, title, path, genre, season, episode, episode_title, episode_overview, poster, backdrop_path, overview, release_date, tmdb_id, episode_still_path, last_modified, cast, recommendations)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            str(uuid.uuid4()), parsed['title'], path, json.dumps([g['name'] for g in details.get('genres', [])]),
-            parsed['season'], parsed['episode'], episode_details.get('title'), episode_details.get('overview'),
-            f"https://image.tmdb.org/t/p/w500{details.get('poster_path')}",
-            f"https://image.tmdb.org/t/p/w1280{details.get('backdrop_path')}",
-            details.get('overview'), details.get('first_air_date'), str(details.get('id')),
-            f"https://image.tmdb.org/t/p/w300{episode_details.get('still_path')}" if episode_details.get('still_path') else None,
-            current_mtime,
-            json.dumps([{'name': c['name'], 'character': c['character'], 'profile_path': f"https://image.tmdb.org/t/p/w185{c['profile_path']}" if c['profile_path'] else None} for c in details.get('credits', {}).get('cast', [])[:10]]),
-            json.dumps([{'id': r['id'], 'title': r.get('title') or r.get('name'), 'year': (r.get('release_date') or r.get('first_air_date','-')).split('-')[0], 'poster': f"https://image.tmdb.org/t/p/w500{r['poster_path']}", 'type': r['media_type']} for r in details.get('recommendations', {}).get('results', [])[:10]])
-        ))
-    else: # Movie
-        tmdb_movie_info = get_tmdb_data(parsed['title'], parsed['year'])
-        if not tmdb_movie_info: return
-
-        details = get_tmdb_details(tmdb_movie_info['id'])
-        if not details: return
-
+            season_episodes = memo.get(('season', series['tmdb_id'], parsed['season']),
+                                       lambda: _fetch_season_episodes(series['tmdb_id'], parsed['season']))
+            episode_details = season_episodes.get(parsed['episode'], {})
+
+        return ('episodes', {
+            'show': series,
+            'season': parsed['season'],
+            'episode': parsed['episode'],
+            'episode_title': episode_details.get('name'),
+            'episode_overview': episode_details.get('overview'),
+            'episode_still_path': f"https://image.tmdb.org/t/p/w300{episode_details.get('still_path')}" if episode_details.get('still_path') else None,
+            'path': path,
+            'last_modified': current_mtime,
+        })
+
+    tmdb_movie_info = get_tmdb_data(parsed['title'], parsed['year'])
+    if not tmdb_movie_info: return None
+
+    details = get_tmdb_details(tmdb_movie_info['id'])
+    if not details: return None
+
+    return ('movies', (
+        str(uuid.uuid4()), parsed['title'], path, json.dumps([g['name'] for g in details.get('genres', [])]),
+        parsed['year'], f"https://image.tmdb.org/t/p/w500{details.get('poster_path')}",
+        f"https://image.tmdb.org/t/p/w1280{details.get('backdrop_path')}",
+        details.get('overview'), details.get('release_date'), str(details.get('id')), current_mtime,
+        _format_cast(details), _format_recommendations(details)
+    ))
+
+def _write_episode(cursor, values):
+    """Upserts an episode file together with its show and season rows."""
+    show = values['show']
+    cursor.execute("""
+        INSERT INTO shows (id, tmdb_id, title, genre, poster, backdrop_path, overview, release_date, cast, recommendations, last_modified)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (tmdb_id) DO UPDATE SET
+            title = excluded.title, genre = excluded.genre, poster = excluded.poster, backdrop_path = excluded.backdrop_path,
+            overview = excluded.overview, release_date = excluded.release_date, cast = excluded.cast,
+            recommendations = excluded.recommendations, last_modified = MAX(COALESCE(shows.last_modified, 0), excluded.last_modified)
+    """, (str(uuid.uuid4()), show['tmdb_id'], show['title'], show['genre'], show['poster'], show['backdrop_path'], show['overview'],
+          show['release_date'], show['cast'], show['recommendations'], values['last_modified']))
+    show_id = cursor.execute("SELECT id FROM shows WHERE tmdb_id = ?", (show['tmdb_id'],)).fetchone()[0]
+
+    season_number = values['season'] or 0
+    cursor.execute("INSERT OR IGNORE INTO seasons (show_id, season_number) VALUES (?, ?)", (show_id, season_number))
+    season_id = cursor.execute("SELECT id FROM seasons WHERE show_id = ? AND season_number = ?", (show_id, season_number)).fetchone()[0]
+
+    # Upsert on path so a re-scanned file keeps its id (playback history refers to it).
+    cursor.execute("""
+        INSERT INTO episodes (id, show_id, season_id, season, episode, episode_title, episode_overview, episode_still_path, path, last_modified)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (path) DO UPDATE SET
+            show_id = excluded.show_id, season_id = excluded.season_id, season = excluded.season, episode = excluded.episode,
+            episode_title = excluded.episode_title, episode_overview = excluded.episode_overview,
+            episode_still_path = excluded.episode_still_path, last_modified = excluded.last_modified
+    """, (str(uuid.uuid4()), show_id, season_id, values['season'], values['episode'], values['episode_title'],
+          values['episode_overview'], values['episode_still_path'], values['path'], values['last_modified']))
+
+def write_media_record(cursor, record):
+    """Writes a row built by fetch_media_record."""
+    table, values = record
+    if table == 'episodes':
+        _write_episode(cursor, values)
+    else:
         cursor.execute("""
-            INSERT OR REPLACE INTO movies (id, title, path, genre, year, poster, backdrop_path, overview, release_date, tmdb_id, last_modified, cast, recommendations)
+            INSERT INTO movies (id, title, path, genre, year, poster, backdrop_path, overview, release_date, tmdb_id, last_modified, cast, recommendations)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            str(uuid.uuid4()), parsed['title'], path, json.dumps([g['name'] for g in details.get('genres', [])]),
-            parsed['year'], f"https://image.tmdb.org/t/p/w500{details.get('poster_path')}",
-            f"https://image.tmdb.org/t/p/w1280{details.get('backdrop_path')}",
-            details.get('overview'), details.get('release_date'), str(details.get('id')), current_mtime,
-            json.dumps([{'name': c['name'], 'character': c['character'], 'profile_path': f"https://image.tmdb.org/t/p/w185{c['profile_path']}" if c['profile_path'] else None} for c in details.get('credits', {}).get('cast', [])[:10]]),
-            json.dumps([{'id': r['id'], 'title': r.get('title') or r.get('name'), 'year': (r.get('release_date') or r.get('first_air_date','-')).split('-')[0], 'poster': f"https://image.tmdb.org/t/p/w500{r['poster_path']}", 'type': r['media_type']} for r in details.get('recommendations', {}).get('results', [])[:10]])
-        ))
-    conn.commit()
+            ON CONFLICT (path) DO UPDATE SET
+                title = excluded.title, genre = excluded.genre, year = excluded.year, poster = excluded.poster,
+                backdrop_path = excluded.backdrop_path, overview = excluded.overview, release_date = excluded.release_date,
+                tmdb_id = excluded.tmdb_id, last_modified = excluded.last_modified, cast = excluded.cast,
+                recommendations = excluded.recommendations
+        """, values)
+
+def _record_path(record):
+    table, values = record
+    return values['path'] if table == 'episodes' else values[2]
+
+def _record_images(record):
+    """The image columns of a row built by fetch_media_record, for image_cache.prefetch."""
+    table, values = record
+    if table == 'episodes':
+        return {'poster': values['show']['poster'], 'backdrop_path': values['show']['backdrop_path']}
+    return {'poster': values[5], 'backdrop_path': values[6]}
 
 # --- Library Data Retrieval ---
-def get_library_movies(sort_by='title', limit=None):
+LIBRARY_TABLES = {'movie': ('movies', 'title, year, poster, id'), 'tv': ('shows', 'title, release_date, poster, id')}
+# sort -> (key expression, direction); each matches an (expression, id) index created in database.init_db.
+LIBRARY_SORTS = {'title': ('title COLLATE NOCASE', 'ASC'), 'added': ('COALESCE(last_modified, 0)', 'DESC')}
+
+def _encode_cursor(sort_value, item_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, item_id]).encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    """The (sort value, id) a page ended on; ValueError for anything _encode_cursor didn't produce."""
+    try:
+        sort_value, item_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid library cursor: {cursor!r}") from e
+    return sort_value, item_id
+
+def get_library_page(media_type, sort_by='title', cursor=None, limit=LIBRARY_PAGE_SIZE):
+    """
+    One page of the movie ('movie') or TV ('tv') library, A-Z by title or newest first ('added'),
+    plus the cursor of the next page (None on the last). Pages are keyset-paginated: each one
+    is an index seek past the previous page's last row, so deep pages cost the same as the first.
+    """
+    table, columns = LIBRARY_TABLES[media_type]
+    key, direction = LIBRARY_SORTS[sort_by]
+    limit = max(1, min(int(limit), MAX_LIBRARY_PAGE_SIZE))
+    params = {'limit': limit + 1}
+    where = ''
+    if cursor:
+        params['value'], params['id'] = _decode_cursor(cursor)
+        op = '>' if direction == 'ASC' else '<'
+        # The first term is a range the index can seek to; the second skips ties already shown.
+        where = f"WHERE {key} {op}= :value AND ({key} {op} :value OR id {op} :id)"
     conn = get_db_connection()
-    order_column = 'last_modified' if sort_by == 'added' else 'title'
-    query = f"SELECT DISTINCT title, year, poster, id FROM movies ORDER BY {order_column} DESC"
-    if limit:
-        query += f" LIMIT {limit}"
-    movies = conn.execute(query).fetchall()
-    conn.close()
-    return [dict(row) for row in movies]
+    try:
+        rows = conn.execute(f"SELECT {columns}, {key} AS sort_value FROM {table} {where} ORDER BY {key} {direction}, id {direction} LIMIT :limit",
+                            params).fetchall()
+    finally:
+        conn.close()
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = _encode_cursor(items[-1]['sort_value'], items[-1]['id']) if len(rows) > limit else None
+    for item in items:
+        del item['sort_value']
+    return {'items': items, 'next_cursor': next_cursor}
+
+def get_library_movies(sort_by='title', limit=None):
+    """The first `limit` movies (at most one page of MAX_LIBRARY_PAGE_SIZE); see get_library_page."""
+    return get_library_page('movie', sort_by, limit=limit or MAX_LIBRARY_PAGE_SIZE)['items']
 
 def get_library_tv_shows(sort_by='title', limit=None):
-    conn = get_db_connection()
-    order_column = 'MAX(last_modified)' if sort_by == 'added' else 'title'
-    query = f"SELECT title, release_date, poster, id FROM tv_shows GROUP BY title ORDER BY {order_column} DESC"
-    if limit:
-        query += f" LIMIT {limit}"
-    shows = conn.execute(query).fetchall()
-    conn.close()
-    return [dict(row) for row in shows]
+    """The first `limit` shows (at most one page of MAX_LIBRARY_PAGE_SIZE); see get_library_page."""
+    return get_library_page('tv', sort_by, limit=limit or MAX_LIBRARY_PAGE_SIZE)['items']
 
 def get_movie_details_by_id(movie_id):
     conn = get_db_connection()
@@ -208,34 +690,111 @@ def get_movie_details_by_id(movie_id):
     conn.close()
     return dict(movie) if movie else None
 
+def get_media_file(media_id):
+    """Returns (path, media_type) for a movie or episode id, or (None, None) if it isn't in the library."""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT path, 'movie' AS media_type FROM movies WHERE id = ?
+        UNION ALL
+        SELECT path, 'tv' AS media_type FROM episodes WHERE id = ?
+    """, (media_id, media_id)).fetchone()
+    conn.close()
+    return (row['path'], row['media_type']) if row else (None, None)
+
 def get_tv_show_details_by_id(show_id):
     conn = get_db_connection()
-    show_episode = conn.execute("SELECT * FROM tv_shows WHERE id = ?", (show_id,)).fetchone()
-    if not show_episode:
+    show = conn.execute("SELECT * FROM shows WHERE id = ?", (show_id,)).fetchone()
+    if not show:
+        # Links from before the shows table existed used an episode id.
+        show = conn.execute("SELECT shows.* FROM episodes JOIN shows ON shows.id = episodes.show_id WHERE episodes.id = ?", (show_id,)).fetchone()
+    if not show:
         conn.close()
         return None
-    
-    all_episodes = conn.execute("SELECT * FROM tv_shows WHERE title = ? ORDER BY season, episode", (show_episode['title'],)).fetchall()
+
+    all_episodes = conn.execute("""
+        SELECT episodes.*, seasons.season_number FROM episodes
+        JOIN seasons ON seasons.id = episodes.season_id
+        WHERE episodes.show_id = ? ORDER BY episodes.season, episodes.episode
+    """, (show['id'],)).fetchall()
     conn.close()
 
-    show_dict = dict(show_episode)
+    show_dict = dict(show)
     show_dict['seasons'] = {}
     for ep in all_episodes:
-        s_num = ep['season']
-        if s_num not in show_dict['seasons']:
-            show_dict['seasons'][s_num] = []
-        show_dict['seasons'][s_num].append(dict(ep))
-    
+        show_dict['seasons'].setdefault(ep['season_number'], []).append(dict(ep))
+
     return show_dict
 
 # --- Filesystem Monitoring ---
+def _is_media_path(path):
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
 class MediaChangeHandler(FileSystemEventHandler):
-    """Handles events from the directory watcher."""
+    """
+    Collects watcher events into a coalescing queue. A path is only processed once it has been
+    quiet for the debounce period, so copying a season pack becomes one incremental update
+    instead of hundreds of full rescans.
+    """
+    def __init__(self, quiet_period=WATCHER_QUIET_PERIOD_SECONDS):
+        super().__init__()
+        self.quiet_period = quiet_period
+        self._pending = {}  # path -> [action, dest_path, is_directory, last_event_time]
+        self._lock = Lock()
+        Thread(target=self._drain_loop, name='library-watcher', daemon=True).start()
+
     def on_any_event(self, event):
-        if event.is_directory or not any(event.src_path.lower().endswith(ext) for ext in ['.mkv', '.mp4', '.avi']):
+        if event.event_type not in ('created', 'modified', 'deleted', 'moved'):
+            return
+        dest_path = getattr(event, 'dest_path', None)
+        if event.is_directory:
+            # Directory "modified" events just mean a child changed; the child has its own event.
+            if event.event_type == 'modified':
+                return
+        elif not (_is_media_path(event.src_path) or (dest_path and _is_media_path(dest_path))):
             return
-        logging.info(f"Detected change: {event.src_path}, event: {event.event_type}")
-        scan_and_update_library()
+        logging.debug(f"Detected change: {event.src_path}, event: {event.event_type}")
+        with self._lock:
+            self._coalesce(event.event_type, event.src_path, dest_path, event.is_directory)
+
+    def _coalesce(self, event_type, path, dest_path, is_directory):
+        now = time.monotonic()
+        if event_type == 'moved':
+            pending = self._pending.pop(path, None)
+            if pending and pending[0] == 'ingest':
+                # Never stored yet, so there is no row to keep: just ingest it at its new location.
+                self._pending[dest_path] = ['ingest', None, is_directory, now]
+            else:
+                self._pending[path] = ['move', dest_path, is_directory, now]
+                self._pending.pop(dest_path, None)
+        elif event_type == 'deleted':
+            self._pending[path] = ['delete', None, is_directory, now]
+        else:
+            pending = self._pending.get(path)
+            if pending and pending[0] == 'ingest':
+                pending[3] = now
+            else:
+                self._pending[path] = ['ingest', None, is_directory, now]
+
+    def _take_quiet_changes(self):
+        now = time.monotonic()
+        with self._lock:
+            ready = [path for path, pending in self._pending.items() if now - pending[3] >= self.quiet_period]
+            changes = [self._pending.pop(path) + [path] for path in ready]
+        # Moves first so later ingests of the destination see the rewritten row, then deletes.
+        order = {'move': 0, 'delete': 1, 'ingest': 2}
+        changes.sort(key=lambda change: order[change[0]])
+        return [(action, path, dest_path, is_directory) for action, dest_path, is_directory, _, path in changes]
+
+    def _drain_loop(self):
+        while True:
+            time.sleep(min(self.quiet_period, 1.0))
+            changes = self._take_quiet_changes()
+            if changes:
+                logging.info(f"Applying {len(changes)} coalesced library change(s).")
+                try:
+                    apply_library_changes(changes)
+                except Exception as e:
+                    logging.error(f"Error applying library changes: {e}")
 
 def monitor_directories():
     """Sets up and starts the directory monitoring."""
@@ -268,6 +827,8 @@ def start_media_scanner(app):
     app_instance = app
     with app.app_context():
         tmdb_api_key = app.config.get('TMDB_API_KEY')
+        tmdb_client.configure(rate_limit=app.config.get('TMDB_RATE_LIMIT'), burst=app.config.get('TMDB_BURST'),
+                              timeout=app.config.get('TMDB_TIMEOUT'), max_retries=app.config.get('TMDB_MAX_RETRIES'))
 
     # FIX: Run the initial scan in a background thread to prevent blocking
     scan_thread = Thread(target=scan_and_update_library, daemon=True)
@@ -0,0 +1,214 @@
+# media_streaming.py
+import mimetypes
+import os
+import re
+import uuid
+from flask import Response, request
+from werkzeug.http import http_date, quote_etag
+from werkzeug.wsgi import wrap_file
+
+# --- Configuration ---
+STREAM_CHUNK_SIZE = 256 * 1024      # block size handed to wsgi.file_wrapper / read per iteration
+READAHEAD_BYTES = 8 * 1024 * 1024   # asked of the kernel up front so a seek doesn't stall on disk
+MAX_RANGES = 16                     # more than this in one request is ignored and the file sent whole
+_RANGE_SPEC = re.compile(r'^(\d*)\s*-\s*(\d*)$')
+MEDIA_MIME_TYPES = {'.mkv': 'video/x-matroska', '.mp4': 'video/mp4', '.m4v': 'video/mp4', '.avi': 'video/x-msvideo'}
+
+# --- Path Whitelist ---
+def resolve_library_path(file_path, roots):
+    """
+    Maps a /stream/<path> value to a real file inside one of the library roots, or None.
+    Symlinks and '..' are resolved before the check, so nothing outside the roots is reachable.
+    """
+    real_roots = [os.path.realpath(root) for root in roots if root]
+    candidates = [file_path if os.path.isabs(file_path) else os.sep + file_path]
+    # Links pass library paths without their leading '/' (a '//' in the URL gets redirected).
+    candidates += [os.path.join(root, file_path.lstrip('/')) for root in real_roots]
+    for candidate in candidates:
+        real = os.path.realpath(candidate)
+        if not os.path.isfile(real):
+            continue
+        if any(os.path.commonpath([real, root]) == root for root in real_roots):
+            return real
+    return None
+
+# --- Ranges ---
+def parse_byte_ranges(header, size):
+    """
+    Parses a Range header against a file size. Returns None if the header should be ignored
+    (absent, malformed, other unit, too many ranges), [] if no range is satisfiable, otherwise
+    sorted, coalesced (start, end) pairs with end exclusive.
+    """
+    if not header or '=' not in header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    items = [item.strip() for item in spec.split(',') if item.strip()]
+    if not items or len(items) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for item in items:
+        match = _RANGE_SPEC.match(item)
+        if not match or not any(match.groups()):
+            return None
+        first, last = match.groups()
+        if not first:
+            length = int(last)  # suffix range: the last N bytes
+            if length > 0 and size > 0:
+                ranges.append((max(size - length, 0), size))
+            continue
+        start = int(first)
+        end = int(last) + 1 if last else size
+        if last and end <= start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size)))
+
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+class FileRange:
+    """
+    File-like view of [start, end) of an open file. fileno() and the underlying position are
+    exposed so servers with sendfile support (gunicorn) send the range zero-copy; everything
+    else just calls read().
+    """
+    def __init__(self, file, start, end):
+        self.file = file
+        self.remaining = end - start
+        file.seek(start)
+        _advise_readahead(file, start, end - start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+def _advise_readahead(file, start, length):
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = file.fileno()
+        os.posix_fadvise(fd, start, length, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(fd, start, min(length, READAHEAD_BYTES), os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+
+def _multipart_parts(ranges, size, content_type, boundary):
+    """Returns ([(part_header, start, end)], closing_delimiter, total_length) for a byteranges body."""
+    parts = []
+    total = 0
+    for start, end in ranges:
+        header = (f"--{boundary}\r\nContent-Type: {content_type}\r\n"
+                  f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n").encode('latin-1')
+        parts.append((header, start, end))
+        total += len(header) + (end - start) + 2
+    closing = f"--{boundary}--\r\n".encode('latin-1')
+    return parts, closing, total + len(closing)
+
+def _multipart_body(path, parts, closing):
+    with open(path, 'rb') as f:
+        for header, start, end in parts:
+            yield header
+            part = FileRange(f, start, end)
+            while True:
+                chunk = part.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            yield b'\r\n'
+        yield closing
+
+# --- Responses ---
+def file_etag(stat):
+    """Strong validator that changes whenever the file is replaced or rewritten."""
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+def _if_range_allows(etag, last_modified):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if request.if_range.etag:
+        return value.strip() == quote_etag(etag)  # strong comparison; a weak tag never matches
+    return request.if_range.date is not None and int(request.if_range.date.timestamp()) == last_modified
+
+def _precondition_status(etag, last_modified):
+    """Returns 412 or 304 when the conditional headers say so, otherwise None."""
+    if request.if_match and not (request.if_match.star_tag or request.if_match.contains(etag)):
+        return 412
+    if 'If-Match' not in request.headers and request.if_unmodified_since and last_modified > request.if_unmodified_since.timestamp():
+        return 412
+    if request.if_none_match:
+        if request.if_none_match.star_tag or request.if_none_match.contains_weak(etag):
+            return 304
+    elif request.if_modified_since and last_modified <= request.if_modified_since.timestamp():
+        return 304
+    return None
+
+def stream_file(path):
+    """
+    Serves a media file for the current request with byte-range support: single and
+    multi-range (multipart/byteranges) 206 responses, If-Range, ETag/Last-Modified
+    conditional GETs and 416 for unsatisfiable ranges.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = file_etag(stat)
+    content_type = MEDIA_MIME_TYPES.get(os.path.splitext(path)[1].lower()) or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': 'private, max-age=0, must-revalidate',
+    }
+
+    status = _precondition_status(etag, last_modified)
+    if status:
+        return Response(status=status, headers=headers)
+
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_allows(etag, last_modified):
+        ranges = parse_byte_ranges(request.headers.get('Range'), size)
+    if ranges == []:
+        headers['Content-Range'] = f"bytes */{size}"
+        return Response(status=416, headers=headers)
+
+    if not ranges:
+        start, end, status = 0, size, 200
+    elif len(ranges) == 1:
+        (start, end), status = ranges[0], 206
+        headers['Content-Range'] = f"bytes {start}-{end - 1}/{size}"
+    else:
+        boundary = uuid.uuid4().hex
+        parts, closing, length = _multipart_parts(ranges, size, content_type, boundary)
+        response = Response(_multipart_body(path, parts, closing), status=206, headers=headers,
+                            content_type=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True)
+        response.content_length = length
+        return response
+
+    body = wrap_file(request.environ, FileRange(open(path, 'rb'), start, end), STREAM_CHUNK_SIZE)
+    response = Response(body, status=status, headers=headers, mimetype=content_type, direct_passthrough=True)
+    response.content_length = end - start
+    return response
@@ -2,32 +2,74 @@
 import json
 
 class Movie:
+    __slots__ = ('title', 'id', 'downloaded')
+
     def __init__(self, title, unique_id=None, downloaded=False):
         self.title = title
         self.id = unique_id
         self.downloaded = downloaded
 
     def to_dict(self):
-        return self.__dict__
+        return {'title': self.title, 'id': self.id, 'downloaded': self.downloaded}
+
+    @classmethod
+    def from_dict(cls, dct):
+        return cls(dct['title'], dct.get('id'), bool(dct.get('downloaded', False)))
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Movie({self.title!r}, {self.id!r}, downloaded={self.downloaded!r})"
 
 class Show:
+    __slots__ = ('title', 'id', 'downloaded_all')
+
     def __init__(self, title, unique_id=None, downloaded_all=False):
         self.title = title
         self.id = unique_id
         self.downloaded_all = downloaded_all
 
     def to_dict(self):
-        return self.__dict__
+        return {'title': self.title, 'id': self.id, 'downloaded_all': self.downloaded_all}
+
+    @classmethod
+    def from_dict(cls, dct):
+        return cls(dct['title'], dct.get('id'), bool(dct.get('downloaded_all', False)))
+
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Show({self.title!r}, {self.id!r}, downloaded_all={self.downloaded_all!r})"
 
 class SearchResult:
-    def __init__(self, title, link, size, seeders):
+    __slots__ = ('title', 'link', 'size', 'seeders', 'peers', 'infohash', 'imdbid', 'tvdbid', 'tracker',
+                 'score', 'trackers')
+
+    def __init__(self, title, link, size, seeders, peers=None, infohash=None, imdbid=None, tvdbid=None, tracker=None,
+                 score=None, trackers=None):
         self.title = title
         self.link = link
         self.size = size
         self.seeders = seeders
+        self.peers = peers
+        self.infohash = infohash
+        self.imdbid = imdbid
+        self.tvdbid = tvdbid
+        self.tracker = tracker
+        self.score = score          # set by release_ranking
+        self.trackers = trackers    # every tracker listing this release, once deduped
 
     def to_dict(self):
-        return self.__dict__
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, dct):
+        return cls(**{name: dct[name] for name in cls.__slots__ if name in dct})
+
+    def __repr__(self):
+        return f"SearchResult({self.title!r}, seeders={self.seeders!r}, tracker={self.tracker!r})"
 
 def json_encoder(obj):
     """
@@ -42,10 +84,9 @@ def json_decoder(dct):
     JSON decoder to restore custom objects from a dictionary.
     """
     if 'title' in dct and 'downloaded' in dct:
-        return Movie(**dct)
+        return Movie.from_dict(dct)
     if 'title' in dct and 'downloaded_all' in dct:
-        return Show(**dct)
+        return Show.from_dict(dct)
     if 'title' in dct and 'seeders' in dct:
-        return SearchResult(**dct)
+        return SearchResult.from_dict(dct)
     return dct
-
@@ -0,0 +1,153 @@
+# playback_telemetry.py
+import atexit
+import logging
+import time
+from threading import Condition, Lock, Thread
+import database
+
+# --- Configuration ---
+FLUSH_INTERVAL_SECONDS = 5.0
+FLUSH_THRESHOLD = 200          # queued plays + (user, media) positions that trigger an early flush
+MAX_QUEUED_PLAYS = 10000       # kept while the database is unavailable; the oldest are dropped past this
+RESUME_MIN_SECONDS = 30        # earlier positions start from the beginning...
+FINISHED_FRACTION = 0.95       # ...and so do positions this far through
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def _timestamp(epoch):
+    """Same format as SQLite's CURRENT_TIMESTAMP, so queued plays sort with the rest of playback_history."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+# --- Recorder ---
+class PlaybackRecorder:
+    """
+    Write-behind queue for the player's /log_play calls. Plays are kept in order; progress
+    heartbeats are coalesced per (user, media), so only the latest position is written. A
+    background thread writes everything in one transaction every `interval` seconds, sooner
+    once `threshold` entries are waiting, and once more at exit.
+    """
+    def __init__(self, interval=FLUSH_INTERVAL_SECONDS, threshold=FLUSH_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._plays = []
+        self._progress = {}
+        self._cond = Condition()
+        self._flush_lock = Lock()
+        self._thread = None
+        self._stopped = False
+        self._stats = {'plays': 0, 'heartbeats': 0, 'coalesced': 0, 'flushes': 0, 'rows_written': 0, 'failed_flushes': 0}
+
+    def _queued(self):
+        return len(self._plays) + len(self._progress)
+
+    def _queue_changed(self):
+        """Called with the condition held: starts the writer on first use, wakes it at the threshold."""
+        if self._thread is None and not self._stopped:
+            self._thread = Thread(target=self._run, name='playback-writer', daemon=True)
+            self._thread.start()
+        if self._queued() >= self.threshold:
+            self._cond.notify()
+
+    def record_play(self, user_id, media_id, media_type):
+        with self._cond:
+            self._plays.append((user_id, media_id, media_type, _timestamp(time.time())))
+            self._stats['plays'] += 1
+            self._queue_changed()
+
+    def record_progress(self, user_id, media_id, media_type, position, duration=None):
+        with self._cond:
+            key = (user_id, media_id)
+            previous = self._progress.get(key)
+            if previous is not None:
+                self._stats['coalesced'] += 1
+                if duration is None:
+                    duration = previous[2]
+            self._progress[key] = (media_type, position, duration, time.time())
+            self._stats['heartbeats'] += 1
+            self._queue_changed()
+
+    def get_progress(self, user_id, media_id):
+        """Latest known position for a user and title: a queued heartbeat, else the stored row."""
+        with self._cond:
+            queued = self._progress.get((user_id, media_id))
+        if queued is not None:
+            media_type, position, duration, updated_at = queued
+            return {'media_type': media_type, 'position': position, 'duration': duration, 'updated_at': updated_at}
+        return database.get_watch_progress(user_id, media_id)
+
+    def flush(self):
+        """Writes whatever is queued in one transaction; returns the number of rows written."""
+        with self._flush_lock:
+            with self._cond:
+                plays, self._plays = self._plays, []
+                progress, self._progress = self._progress, {}
+            if not plays and not progress:
+                return 0
+            rows = [(user_id, media_id, media_type, position, duration, updated_at)
+                    for (user_id, media_id), (media_type, position, duration, updated_at) in progress.items()]
+            if database.record_playback_batch(plays, rows):
+                with self._cond:
+                    self._stats['flushes'] += 1
+                    self._stats['rows_written'] += len(plays) + len(rows)
+                return len(plays) + len(rows)
+            # Keep them for the next flush; positions reported in the meantime are newer and win.
+            with self._cond:
+                self._stats['failed_flushes'] += 1
+                self._plays[:0] = plays
+                if len(self._plays) > MAX_QUEUED_PLAYS:
+                    logging.warning(f"Dropping {len(self._plays) - MAX_QUEUED_PLAYS} queued play(s); the database is unavailable.")
+                    del self._plays[:len(self._plays) - MAX_QUEUED_PLAYS]
+                for key, value in progress.items():
+                    self._progress.setdefault(key, value)
+            return 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._queued() >= self.threshold, timeout=self.interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def stop(self, timeout=10):
+        """Stops the writer and writes what is still queued."""
+        with self._cond:
+            self._stopped = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def get_stats(self):
+        with self._cond:
+            return dict(self._stats, queued_plays=len(self._plays), queued_positions=len(self._progress))
+
+_recorder = PlaybackRecorder()
+atexit.register(_recorder.stop)
+
+# --- Module Functions ---
+def record_play(user_id, media_id, media_type):
+    """Queues a play for playback_history."""
+    _recorder.record_play(user_id, media_id, media_type)
+
+def record_progress(user_id, media_id, media_type, position, duration=None):
+    """Queues a heartbeat; only the latest position per user and title is written."""
+    _recorder.record_progress(user_id, media_id, media_type, position, duration)
+
+def get_resume_position(user_id, media_id):
+    """Seconds to resume a title from, or None to start at the beginning (never watched, barely started or finished)."""
+    progress = _recorder.get_progress(user_id, media_id)
+    if not progress or progress['position'] < RESUME_MIN_SECONDS:
+        return None
+    duration = progress['duration']
+    if duration and progress['position'] >= duration * FINISHED_FRACTION:
+        return None
+    return progress['position']
+
+def flush():
+    return _recorder.flush()
+
+def get_stats():
+    return _recorder.get_stats()
@@ -0,0 +1,218 @@
+# release_parser.py
+import os
+import re
+from functools import lru_cache
+
+# --- Token Tables ---
+# Canonical value -> spellings seen in release names. Everything is compiled once into _TOKEN below.
+RESOLUTIONS = {
+    '2160p': ('2160p', '4k', 'uhd'),
+    '1080p': ('1080p', '1080i'),
+    '720p': ('720p',),
+    '576p': ('576p',),
+    '480p': ('480p',),
+}
+SOURCES = {
+    'Remux': ('remux', 'bdremux'),
+    'BluRay': ('bluray', 'blu-ray', 'bdrip', 'brrip', 'bd25', 'bd50'),
+    'WEB-DL': ('web-dl', 'webdl', 'web'),
+    'WEBRip': ('webrip', 'web-rip'),
+    'HDTV': ('hdtv', 'pdtv', 'dsr'),
+    'DVD': ('dvdrip', 'dvd', 'dvd5', 'dvd9'),
+    'CAM': ('cam', 'hdcam', 'camrip'),
+    'TS': ('ts', 'hdts', 'telesync'),
+    'Screener': ('scr', 'screener', 'dvdscr'),
+}
+CODECS = {
+    'x264': ('x264',),
+    'H.264': ('h264', 'h.264', 'avc'),
+    'x265': ('x265',),
+    'HEVC': ('h265', 'h.265', 'hevc'),
+    'AV1': ('av1',),
+    'XviD': ('xvid', 'divx'),
+}
+AUDIO = {
+    'DDP': ('ddp', 'ddp5.1', 'ddp2.0', 'ddp7.1', 'dd+', 'eac3', 'e-ac-3'),
+    'DD': ('dd5.1', 'dd2.0', 'ac3'),
+    'DTS': ('dts', 'dts-hd', 'dts-x', 'dts-ma'),
+    'TrueHD': ('truehd',),
+    'Atmos': ('atmos',),
+    'AAC': ('aac', 'aac2.0', 'aac5.1'),
+    'FLAC': ('flac',),
+}
+FLAGS = ('repack', 'proper', 'internal', 'extended', 'remastered', 'unrated', 'limited', 'imax',
+         'hdr', 'hdr10', 'dv', 'dovi', '10bit', 'multi', 'subbed', 'dubbed', 'complete')
+# Tokens that are also ordinary words, so they never cut a title short when no year or episode is found.
+AMBIGUOUS = {'web', 'dvd', 'cam', 'ts', 'scr', 'dv', 'avc', 'multi', 'complete', 'limited', 'proper', 'internal', 'extended'}
+# A remux is usually tagged BluRay as well; it wins whichever tag comes first.
+PREFERRED_SOURCES = {'Remux'}
+VIDEO_EXTENSIONS = {'.mkv', '.mp4', '.m4v', '.avi', '.mov', '.wmv', '.ts', '.webm', '.mpg', '.mpeg', '.srt'}
+
+def _alternation(table):
+    spellings = sorted({spelling for values in table.values() for spelling in values}, key=len, reverse=True)
+    return '|'.join(re.escape(spelling) for spelling in spellings)
+
+def _lookup(table):
+    return {spelling: canonical for canonical, values in table.items() for spelling in values}
+
+_CANONICAL = {'resolution': _lookup(RESOLUTIONS), 'source': _lookup(SOURCES), 'codec': _lookup(CODECS), 'audio': _lookup(AUDIO)}
+
+# One pass over the lowercased name finds every token; the alternatives are tried in this order at
+# each word start. Consuming the separator (rather than a lookbehind) lets most positions fail on one
+# character, and matching lowercase text without IGNORECASE is much faster.
+_TOKEN = re.compile(r'''
+    (?:^|[^a-z0-9])(?:
+        (?P<episode>s(?P<ep_season>\d{1,3})[ ._-]?e(?P<ep_first>\d{1,4})(?P<ep_more>(?:[ ._-]?-?e\d{1,4}|-\d{1,4}(?![\dp]))*))
+      | (?P<cross>(?P<x_season>\d{1,2})x(?P<x_episode>\d{2,3}))
+      | (?P<season>(?:s|season[ ._]?)(?P<season_number>\d{1,2})(?:[ ._-]?(?:s|season[ ._]?)?-?(?P<season_last>\d{1,2}))?)
+      | (?P<absolute>(?:ep|episode[ ._]?)(?P<absolute_number>\d{1,4}))
+      | (?P<year>[(\[]?(?P<year_number>(?:19|20)\d{2})[)\]]?)
+      | (?P<resolution>''' + _alternation(RESOLUTIONS) + r''')
+      | (?P<source>''' + _alternation(SOURCES) + r''')
+      | (?P<codec>''' + _alternation(CODECS) + r''')
+      | (?P<audio>''' + _alternation(AUDIO) + r''')
+      | (?P<flag>''' + '|'.join(sorted(FLAGS, key=len, reverse=True)) + r''')
+    )(?![a-z0-9])
+''', re.VERBOSE)
+_EPISODE_MORE = re.compile(r'(-?)[ ._]?e?(\d+)')
+_DASH_ABSOLUTE = re.compile(r'\s-\s(\d{1,4})(?:v\d)?(?=[\s\[(]|$)')       # "[Group] Show - 123 [1080p]"
+_LEADING_TAGS = re.compile(r'^(?:\s*\[[^\]]*\]\s*-?\s*)+')
+_LEADING_GROUP = re.compile(r'^\[([^\]\s.]+)\]')
+_TRAILING_GROUP = re.compile(r'-\s?([a-z0-9]+)(?:\[[^\]]*\])?$', re.IGNORECASE)
+_TITLE_SEPARATORS = re.compile(r'[._\s]+')
+_TITLE_TRAILING = re.compile(r'[\s\-\[(]+$')
+
+# --- Parsing ---
+def _empty(name):
+    return {'name': name, 'title': '', 'year': None, 'season': None, 'episode': None, 'episodes': [],
+            'absolute_episode': None, 'resolution': None, 'source': None, 'codec': None, 'audio': None,
+            'group': None, 'flags': []}
+
+def _strip_extension(name):
+    root, extension = os.path.splitext(name)
+    return root if extension.lower() in VIDEO_EXTENSIONS else name
+
+def _lowercase(text):
+    """Lowercase with every character kept in place, so token positions index the original name."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(c if len(c.lower()) != 1 else c.lower() for c in text)   # e.g. 'İ' lowers to two characters
+
+def _episode_list(first, more):
+    """S01E01E02 -> [1, 2]; a dash is a range, so S01E01-E03 and S01E01-03 -> [1, 2, 3]."""
+    episodes = [first]
+    for dash, number in _EPISODE_MORE.findall(more):
+        number = int(number)
+        if number <= episodes[-1]:
+            continue
+        if dash:
+            episodes.extend(range(episodes[-1] + 1, number + 1))
+        else:
+            episodes.append(number)
+    return episodes
+
+@lru_cache(maxsize=8192)
+def _parse(name):
+    info = _empty(name)
+    base = _strip_extension(name.strip())
+    tags = _LEADING_TAGS.match(base)
+    title_start = tags.end() if tags else 0
+
+    title_end = None
+    fallback_end = None
+    years = []
+    technical = []
+    token_end = 0
+    for match in _TOKEN.finditer(_lowercase(base), max(title_start - 1, 0)):
+        kind = match.lastgroup   # the outer group closes last, so this is the token's category
+        start = match.start(kind)
+        token_end = match.end()
+        if kind == 'year':
+            # A year at the very start is usually the title itself ("1917", "2012.2009.1080p").
+            if start > title_start:
+                years.append(match)
+            continue
+        if kind in ('episode', 'cross', 'season', 'absolute'):
+            if title_end is None:
+                title_end = start
+            if kind == 'absolute':
+                if info['absolute_episode'] is None:
+                    info['absolute_episode'] = int(match.group('absolute_number'))
+            elif info['season'] is None:
+                if kind == 'episode':
+                    info['season'] = int(match.group('ep_season'))
+                    info['episodes'] = _episode_list(int(match.group('ep_first')), match.group('ep_more'))
+                elif kind == 'cross':
+                    info['season'] = int(match.group('x_season'))
+                    info['episodes'] = [int(match.group('x_episode'))]
+                else:
+                    info['season'] = int(match.group('season_number'))
+        else:
+            technical.append((start, kind, match.group(kind)))
+            if fallback_end is None and technical[-1][2] not in AMBIGUOUS:
+                fallback_end = start
+
+    if years:
+        # The last year before any episode marker wins: "Blade Runner 2049 (2017)" -> 2017.
+        candidates = [m for m in years if title_end is None or m.start('year') < title_end] or years
+        year = candidates[-1]
+        info['year'] = int(year.group('year_number'))
+        title_end = min(title_end, year.start('year')) if title_end is not None else year.start('year')
+    if title_end is None:
+        absolute = _DASH_ABSOLUTE.search(base, title_start)
+        if absolute and not 1900 <= int(absolute.group(1)) <= 2099:
+            info['absolute_episode'] = int(absolute.group(1))
+            title_end = absolute.start()
+    if title_end is None:
+        title_end = fallback_end if fallback_end is not None else len(base)
+
+    if info['episodes']:
+        info['episode'] = info['episodes'][0]
+    title = _TITLE_SEPARATORS.sub(' ', base[title_start:title_end])
+    info['title'] = _TITLE_TRAILING.sub('', title).strip()
+
+    # Words inside the title ("Charlotte's Web") are not tags; the first tag of each kind after it wins.
+    for start, kind, token in technical:
+        if start < title_end:
+            continue
+        if kind == 'flag':
+            if token not in info['flags']:
+                info['flags'].append(token)
+        elif info[kind] is None or (kind == 'source' and _CANONICAL[kind][token] in PREFERRED_SOURCES):
+            info[kind] = _CANONICAL[kind][token]
+
+    # "-GRP" at the end, unless the dash belongs to a tag ("WEB-DL"); else an anime-style "[Group]" prefix.
+    group = _TRAILING_GROUP.search(base)
+    if group and group.start() >= max(title_end, token_end):
+        info['group'] = group.group(1)
+    else:
+        leading = _LEADING_GROUP.match(base)
+        if leading:
+            info['group'] = leading.group(1)
+    return info
+
+def parse(name):
+    """
+    Parses a release or file name ("Show.Name.S01E02E03.1080p.WEB-DL.x264-GRP.mkv") into title,
+    year, season, episode(s), absolute episode, resolution, source, codec, audio, group and flags.
+    A directory part is ignored. Returns a new dict; values not found are None (or empty lists).
+    """
+    info = _parse(os.path.basename(name or ''))
+    return dict(info, episodes=list(info['episodes']), flags=list(info['flags']))
+
+def parse_many(names):
+    """
+    Parses a batch of names (a library scan, a Jackett feed), returning dicts in input order.
+    Each distinct name is parsed once; repeats share the work.
+    """
+    parsed = {}
+    results = []
+    for name in names:
+        info = parsed.get(name)
+        if info is None:
+            info = parsed[name] = parse(name)
+            results.append(info)
+        else:
+            results.append(dict(info, episodes=list(info['episodes']), flags=list(info['flags'])))
+    return results
@@ -0,0 +1,135 @@
+# release_ranking.py
+import heapq
+import math
+import re
+import release_parser
+
+# --- Configuration ---
+DEFAULT_SHORTLIST = 10
+# Keyed on release_parser's canonical resolution and source names; the parser decides which a title has.
+RESOLUTION_SCORES = {'2160p': 30, '1080p': 25, '720p': 15, '576p': 6, '480p': 5}
+UNKNOWN_RESOLUTION_SCORE = 8
+SOURCE_SCORES = {'Remux': 20, 'BluRay': 18, 'WEB-DL': 16, 'WEBRip': 14, 'HDTV': 8, 'DVD': 6,
+                 'CAM': -40, 'TS': -40, 'Screener': -40}
+SEEDER_WEIGHT = 10          # per e-fold of seeders: 1 -> 7, 10 -> 24, 100 -> 46, 1000 -> 69
+SIZE_WEIGHT = 4             # per doubling of size in GiB, capped, so bigger only wins among similar releases
+MAX_SIZE_SCORE = 16
+TINY_RELEASE_BYTES = 200 * 1024 * 1024
+TINY_RELEASE_PENALTY = -25  # samples, fakes and mislabelled junk
+_SIZE = re.compile(r'^\s*([\d.,]+)\s*([kmgt]i?b|b|bytes)?\s*$', re.I)
+_SIZE_UNITS = {'b': 1, 'bytes': 1, 'kb': 1000, 'mb': 1000 ** 2, 'gb': 1000 ** 3, 'tb': 1000 ** 4,
+               'kib': 1024, 'mib': 1024 ** 2, 'gib': 1024 ** 3, 'tib': 1024 ** 4}
+_LEADING_TAGS = re.compile(r'^(\s*[\[(][^\])]*[\])]\s*-?\s*)+')
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+_FILLED_FIELDS = ('infohash', 'imdbid', 'tvdbid', 'size', 'peers')
+
+# --- Release Attributes ---
+def parse_size(value):
+    """Size in bytes from an int or a string like '1.4 GB' / '700MiB'; None if unknown."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value >= 0 else None
+    match = _SIZE.match(str(value))
+    if not match:
+        return None
+    try:
+        number = float(match.group(1).replace(',', ''))
+    except ValueError:
+        return None
+    return int(number * _SIZE_UNITS[(match.group(2) or 'b').lower()])
+
+def normalize_release_name(title):
+    """Lowercase name with separators collapsed and leading [site] tags dropped, for cross-tracker matching."""
+    name = _LEADING_TAGS.sub('', (title or '').lower())
+    return _NON_ALNUM.sub(' ', name).strip()
+
+def _seeders(result):
+    """Seeder count as a non-negative int; parsers leave None (or junk) when a tracker omits it."""
+    try:
+        return max(int(result.seeders), 0)
+    except (TypeError, ValueError):
+        return 0
+
+def score_release(result):
+    """Higher is better: seeders dominate, then resolution and source tags, then size."""
+    parsed = release_parser.parse(result.title)
+    score = SEEDER_WEIGHT * math.log1p(_seeders(result))
+    score += RESOLUTION_SCORES.get(parsed['resolution'], UNKNOWN_RESOLUTION_SCORE)
+    score += SOURCE_SCORES.get(parsed['source'], 0)
+    size = parse_size(result.size)
+    if size is not None:
+        if size < TINY_RELEASE_BYTES:
+            score += TINY_RELEASE_PENALTY
+        else:
+            score += min(SIZE_WEIGHT * math.log2(1 + size / 1024 ** 3), MAX_SIZE_SCORE)
+    return score
+
+# --- Dedup & Ranking ---
+class _Release:
+    """One release and every tracker that listed it."""
+    __slots__ = ('best', 'seeders', 'infohash', 'trackers')
+
+    def __init__(self, result):
+        self.best = result
+        self.seeders = _seeders(result)
+        self.infohash = result.infohash
+        self.trackers = [result.tracker] if result.tracker else []
+
+    def merge(self, result):
+        if result.tracker and result.tracker not in self.trackers:
+            self.trackers.append(result.tracker)
+        seeders = _seeders(result)
+        if seeders > self.seeders:
+            self.best, self.seeders, result = result, seeders, self.best
+        # Fill what the chosen listing is missing from the others.
+        best = self.best
+        for field in _FILLED_FIELDS:
+            if getattr(best, field) is None:
+                setattr(best, field, getattr(result, field))
+        self.infohash = best.infohash
+
+def dedupe_releases(results):
+    """
+    Merges listings of the same release across trackers: same infohash, or same normalized
+    name when at least one side has no infohash. Two listings with different infohashes are
+    never merged, whatever their names. Returns one entry per release, in first-seen order.
+    """
+    releases = []
+    by_hash = {}
+    by_name = {}
+    for result in results:
+        if not result.title:
+            continue
+        infohash = result.infohash = (result.infohash or '').lower() or None
+        release = by_hash.get(infohash) if infohash else None
+        if release is not None:
+            release.merge(result)
+            continue
+        name = normalize_release_name(result.title)
+        release = by_name.get(name)
+        if release is not None and (infohash is None or release.infohash is None):
+            release.merge(result)
+        else:
+            release = _Release(result)
+            releases.append(release)
+            by_name.setdefault(name, release)
+        if release.infohash:
+            by_hash.setdefault(release.infohash, release)
+    return releases
+
+def rank_releases(results, k=DEFAULT_SHORTLIST):
+    """
+    Dedups `results` (SearchResults from any number of trackers) and returns the k best as
+    SearchResults, best first (ties go to the first seen), each with `score` and `trackers`
+    set. O(n log k).
+    """
+    releases = dedupe_releases(results)
+    scored = ((score_release(release.best), -index, release) for index, release in enumerate(releases))
+    shortlist = []
+    for score, _, release in heapq.nlargest(k, scored):
+        result = release.best
+        result.score = round(score, 2)
+        result.trackers = release.trackers
+        shortlist.append(result)
+    return shortlist
@@ -4,126 +4,336 @@ import requests
 import xml.etree.ElementTree as ET
 import logging
 import re
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+import database
+import release_parser
+import torznab
 from media_scanner import get_tmdb_data
 
 # --- Configuration ---
-REQUESTS_FILE = 'requests.json'
+REQUESTS_FILE = 'requests.json'   # pre-database request store, imported once by migrate_requests_file()
+REQUESTS_PAGE_SIZE = 25
+MEDIA_TYPES = ('movie', 'tv')
+JACKETT_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+TMDB_POSTER_URL = 'https://image.tmdb.org/t/p/w500'
+POSTER_WORKERS = 6            # concurrent TMDb lookups; tmdb_client rate-limits on top of this
+POSTER_WAIT_SECONDS = 1.5     # how long enrichment waits before returning placeholders
+POSTER_CACHE_SIZE = 2048
+POSTER_TTL = 24 * 3600
+POSTER_MISS_TTL = 15 * 60     # titles TMDb didn't match (or a failed lookup) are retried sooner
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # --- Helper Functions ---
-def parse_jackett_item(item):
-    """Parses an XML item from Jackett into a dictionary."""
-    title = item.find('title').text if item.find('title') is not None else 'N/A'
-    year_match = re.search(r'\(?(\d{4})\)?', title)
-    year = year_match.group(1) if year_match else None
-    clean_title = re.sub(r'\(?\d{4}\)?', '', title).strip()
-    clean_title = re.sub(r'[._\s-](S\d{1,2}(E\d{1,2})?|1080p|720p|WEB-DL|BluRay).*', '', clean_title, flags=re.IGNORECASE).strip()
-    return {'title': title, 'clean_title': clean_title, 'year': year}
-
-# --- Request File Management ---
-def load_requests():
-    """Loads requests from the JSON file."""
-    if not os.path.exists(REQUESTS_FILE):
-        return {"movies": {"pending": [], "approved": []}, "tv": {"pending": [], "approved": []}}
+def parse_jackett_items(items):
+    """Turns parsed Torznab items from Jackett into display dictionaries, parsing the titles as one batch."""
+    titles = [item.get('title') or 'N/A' for item in items]
+    results = []
+    for item, title, parsed in zip(items, titles, release_parser.parse_many(titles)):
+        year = str(parsed['year']) if parsed['year'] else None
+        results.append({'title': title, 'clean_title': parsed['title'] or title, 'year': year,
+                        'size': item.get('size'), 'seeders': item.get('seeders'), 'infohash': item.get('infohash')})
+    return results
+
+# --- Request Queue ---
+def _title_key(title):
+    """Case- and whitespace-insensitive form of a title; at most one request per key and media type."""
+    return ' '.join(title.casefold().split())
+
+def _log_event(conn, request_id, action, actor):
+    conn.execute("INSERT INTO media_request_events (request_id, action, actor) VALUES (?, ?, ?)", (request_id, action, actor))
+
+def migrate_requests_file(path=REQUESTS_FILE):
+    """One-time import of the old requests.json into the database; the file is renamed afterwards."""
+    if not os.path.exists(path):
+        return
     try:
-        with open(REQUESTS_FILE, 'r') as f:
+        with open(path, 'r') as f:
             content = f.read()
-            return json.loads(content) if content else {"movies": {"pending": [], "approved": []}, "tv": {"pending": [], "approved": []}}
+        data = json.loads(content) if content else {}
     except (IOError, json.JSONDecodeError) as e:
-        logging.error(f"Error loading requests file: {e}")
-        return {"movies": {"pending": [], "approved": []}, "tv": {"pending": [], "approved": []}}
+        logging.error(f"Error loading requests file for migration: {e}")
+        return
+
+    conn = database.get_db_connection()
+    if conn is None: return
+    imported = 0
+    try:
+        with conn:
+            # add_request used to file TV requests under 'tvs', so both keys are read.
+            for key, media_type in (('movies', 'movie'), ('tv', 'tv'), ('tvs', 'tv')):
+                for status in ('pending', 'approved'):
+                    for item in data.get(key, {}).get(status, []):
+                        title = (item.get('title') or '').strip()
+                        if not title:
+                            continue
+                        cursor = conn.execute("""
+                            INSERT OR IGNORE INTO media_requests (media_type, title, title_key, status, requested_by)
+                            VALUES (?, ?, ?, ?, ?)
+                        """, (media_type, title, _title_key(title), status, item.get('requested_by')))
+                        if cursor.rowcount:
+                            imported += 1
+                            _log_event(conn, cursor.lastrowid, 'imported', None)
+    except sqlite3.Error as e:
+        logging.error(f"Error migrating requests file: {e}")
+        return
+    finally:
+        conn.close()
+
+    try:
+        os.replace(path, path + '.migrated')
+    except OSError as e:
+        logging.warning(f"Could not rename {path} after migrating it: {e}")
+    logging.info(f"Imported {imported} request(s) from {path}.")
 
-def save_requests(data):
-    """Saves data to the requests JSON file."""
+def list_requests(media_type, status, page=1, per_page=REQUESTS_PAGE_SIZE):
+    """One page of requests with the given type and status, oldest first, plus paging info."""
+    page = max(page or 1, 1)
+    listing = {'rows': [], 'page': page, 'pages': 1, 'total': 0}
+    conn = database.get_db_connection()
+    if conn is None: return listing
     try:
-        with open(REQUESTS_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
-    except IOError as e:
-        logging.error(f"Error saving requests file: {e}")
+        total = conn.execute("SELECT COUNT(*) FROM media_requests WHERE media_type = ? AND status = ?", (media_type, status)).fetchone()[0]
+        rows = conn.execute("""
+            SELECT id, title, requested_by, requested_at, decided_by, decided_at
+            FROM media_requests
+            WHERE media_type = ? AND status = ?
+            ORDER BY id
+            LIMIT ? OFFSET ?
+        """, (media_type, status, per_page, (page - 1) * per_page)).fetchall()
+        listing.update(rows=[dict(row) for row in rows], total=total, pages=max(-(-total // per_page), 1))
+    except sqlite3.Error as e:
+        logging.error(f"Error listing {status} {media_type} requests: {e}")
+    finally:
+        conn.close()
+    return listing
+
+def get_request_pages(pages=None, per_page=REQUESTS_PAGE_SIZE):
+    """
+    Pending and approved requests per media type, in the old requests.json shape ('movies'/'tv'),
+    each list paged independently. `pages` maps e.g. 'movie_pending' to a page number.
+    """
+    pages = pages or {}
+    return {group: {status: list_requests(media_type, status, pages.get(f"{media_type}_{status}", 1), per_page)
+                    for status in ('pending', 'approved')}
+            for group, media_type in (('movies', 'movie'), ('tv', 'tv'))}
+
+def get_request_history(media_type, title):
+    """Every state change of a request (requested, approved, denied, ...), oldest first."""
+    conn = database.get_db_connection()
+    if conn is None: return []
+    try:
+        rows = conn.execute("""
+            SELECT e.action, e.actor, e.created_at
+            FROM media_requests r
+            JOIN media_request_events e ON e.request_id = r.id
+            WHERE r.media_type = ? AND r.title_key = ?
+            ORDER BY e.id
+        """, (media_type, _title_key(title))).fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        logging.error(f"Error getting history for request '{title}': {e}")
+        return []
+    finally:
+        conn.close()
 
 # --- Jackett Interaction ---
-def search_jackett(url, api_key, query, is_tv=False, limit=None):
+def _fetch_jackett_items(url, params, limit=None, timeout=JACKETT_TIMEOUT):
+    """Streams a Jackett feed through the Torznab parser, closing the connection once `limit` items are in."""
+    items = []
+    with requests.get(url, params=params, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        try:
+            for item in torznab.iter_items(response.raw, limit):
+                items.append(item)
+        except ET.ParseError as e:
+            logging.error(f"Malformed Jackett feed, keeping {len(items)} item(s) parsed before the error: {e}")
+    return parse_jackett_items(items)
+
+def search_jackett(url, api_key, query, is_tv=False, limit=None, timeout=JACKETT_TIMEOUT):
     """Searches Jackett and returns structured data."""
     if not all([url, api_key, query]): return []
     params = {'apikey': api_key, 't': 'search', 'q': query, 'cat': '5000' if is_tv else '2000'}
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        root = ET.fromstring(response.content)
-        items = root.findall('.//item')
-        results = [parse_jackett_item(item) for item in items]
-        return results[:limit] if limit else results
-    except (requests.RequestException, ET.ParseError) as e:
+        return _fetch_jackett_items(url, params, limit, timeout)
+    except requests.RequestException as e:
         logging.error(f"Error with Jackett search: {e}")
         return []
 
-def get_recent_from_jackett(url, api_key, is_tv=False):
+def get_recent_from_jackett(url, api_key, is_tv=False, limit=10):
     """Gets the most recent items from a Jackett feed."""
     if not all([url, api_key]): return []
-    params = {'apikey': api_key, 't': 'search', 'limit': 10, 'cat': '5000' if is_tv else '2000'}
+    params = {'apikey': api_key, 't': 'search', 'limit': limit, 'cat': '5000' if is_tv else '2000'}
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        root = ET.fromstring(response.content)
-        items = root.findall('.//item')
-        return [parse_jackett_item(item) for item in items]
-    except (requests.RequestException, ET.ParseError) as e:
+        return _fetch_jackett_items(url, params, limit)
+    except requests.RequestException as e:
         logging.error(f"Error getting recent from Jackett: {e}")
         return []
 
-def enrich_with_tmdb_posters(results, is_tv=False):
-    """Adds TMDb poster paths to Jackett results."""
+# --- Poster Enrichment ---
+class PosterLookup:
+    """
+    TMDb poster lookups keyed by (is_tv, title, year), shared by every request: each distinct key
+    is fetched once on a small worker pool, concurrent callers share the in-flight lookup, and
+    answers (including "no poster") are kept in a bounded LRU.
+    """
+    def __init__(self, workers=POSTER_WORKERS, max_entries=POSTER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poster')
+        self._entries = OrderedDict()  # key -> (poster url or None, expires_at)
+        self._pending = {}             # key -> Future of a running lookup
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'lookups': 0, 'shared': 0, 'timeouts': 0}
+
+    def _resolve(self, key):
+        is_tv, title, year = key
+        try:
+            tmdb_info = get_tmdb_data(title, year, is_tv=is_tv)
+            poster_path = (tmdb_info or {}).get('poster_path')
+            poster = f"{TMDB_POSTER_URL}{poster_path}" if poster_path else None
+            with self._lock:
+                self._entries[key] = (poster, time.monotonic() + (POSTER_TTL if poster else POSTER_MISS_TTL))
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return poster
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def lookup(self, keys):
+        """Returns ({key: poster} for keys already known, {key: Future} for the rest), starting lookups as needed."""
+        known, pending = {}, {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(key)
+                    known[key] = entry[0]
+                    self._stats['hits'] += 1
+                    continue
+                future = self._pending.get(key)
+                if future is None:
+                    future = self._pending[key] = self._executor.submit(self._resolve, key)
+                    self._stats['lookups'] += 1
+                else:
+                    self._stats['shared'] += 1
+                pending[key] = future
+        return known, pending
+
+    def get_posters(self, keys, timeout):
+        """Posters for `keys`, waiting at most `timeout` seconds; keys still being looked up are left out."""
+        known, pending = self.lookup(keys)
+        if pending and timeout > 0:
+            wait(pending.values(), timeout=timeout)
+        for key, future in pending.items():
+            if future.done() and future.exception() is None:
+                known[key] = future.result()
+            else:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+        return known
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats, cached=len(self._entries), in_flight=len(self._pending))
+
+_posters = PosterLookup()
+
+def _poster_key(item, is_tv):
+    title = re.sub(r'[._\s]+', ' ', item.get('clean_title') or '').strip().lower()
+    return (is_tv, title, item.get('year'))
+
+def enrich_with_tmdb_posters(results, is_tv=False, timeout=POSTER_WAIT_SECONDS):
+    """
+    Adds TMDb poster URLs to Jackett results. Releases of the same (title, year) share one lookup;
+    rows whose lookup hasn't finished within `timeout` seconds get poster=None and
+    poster_pending=True (it keeps running, so a later call finds it cached).
+    """
+    keys = [_poster_key(item, is_tv) for item in results]
+    posters = _posters.get_posters({key for key in keys if key[1]}, timeout)
     enriched = []
-    for item in results:
-        tmdb_info = get_tmdb_data(item['clean_title'], item['year'], is_tv=is_tv)
-        if tmdb_info and tmdb_info.get('poster_path'):
-            enriched.append({
-                'title': item['title'],
-                'poster': f"https://image.tmdb.org/t/p/w500{tmdb_info['poster_path']}",
-                'year': item['year']
-            })
+    for item, key in zip(results, keys):
+        enriched.append({
+            'title': item['title'],
+            'poster': posters.get(key),
+            'poster_pending': bool(key[1]) and key not in posters,
+            'year': item['year']
+        })
     return enriched
 
+def get_poster_stats():
+    """Poster lookup counters: cache hits, TMDb lookups started, lookups shared between rows/requests."""
+    return _posters.get_stats()
+
 # --- Request Lifecycle Management ---
 def add_request(media_type, title, requested_by):
-    """Adds a new item to the pending requests list."""
-    requests_data = load_requests()
-    key = media_type + 's'
-    if key not in requests_data: requests_data[key] = {"pending": [], "approved": []}
-    
-    is_duplicate = any(req['title'].lower() == title.lower() for req in requests_data[key]['pending'] + requests_data[key]['approved'])
-    if not is_duplicate:
-        requests_data[key]['pending'].append({"title": title, "requested_by": requested_by})
-        save_requests(requests_data)
+    """Adds a new pending request, unless the title is already pending or approved; a denied one is reopened."""
+    title = (title or '').strip()
+    if media_type not in MEDIA_TYPES or not title:
+        return False
+    conn = database.get_db_connection()
+    if conn is None: return False
+    try:
+        with conn:
+            rows = conn.execute("""
+                INSERT INTO media_requests (media_type, title, title_key, requested_by) VALUES (?, ?, ?, ?)
+                ON CONFLICT (media_type, title_key) DO UPDATE SET
+                    title = excluded.title, status = 'pending', requested_by = excluded.requested_by,
+                    requested_at = CURRENT_TIMESTAMP, decided_by = NULL, decided_at = NULL
+                WHERE media_requests.status = 'denied'
+                RETURNING id
+            """, (media_type, title, _title_key(title), requested_by)).fetchall()
+            for row in rows:
+                _log_event(conn, row['id'], 'requested', requested_by)
+    except sqlite3.Error as e:
+        logging.error(f"Error adding request for '{title}': {e}")
+        return False
+    finally:
+        conn.close()
+    if rows:
         logging.info(f"Added '{title}' to pending {media_type} requests.")
         return True
     logging.warning(f"Request for '{title}' already exists.")
     return False
 
-def approve_request(media_type, title):
+def _decide(media_type, title, status, decided_by):
+    """Moves a pending request to `status`; the status check in the UPDATE makes it safe across workers."""
+    conn = database.get_db_connection()
+    if conn is None: return False
+    try:
+        with conn:
+            rows = conn.execute("""
+                UPDATE media_requests SET status = ?, decided_by = ?, decided_at = CURRENT_TIMESTAMP
+                WHERE media_type = ? AND title_key = ? AND status = 'pending'
+                RETURNING id
+            """, (status, decided_by, media_type, _title_key(title or ''))).fetchall()
+            for row in rows:
+                _log_event(conn, row['id'], status, decided_by)
+        return bool(rows)
+    except sqlite3.Error as e:
+        logging.error(f"Error marking request '{title}' {status}: {e}")
+        return False
+    finally:
+        conn.close()
+
+def approve_request(media_type, title, decided_by=None):
     """Moves a request from pending to approved."""
-    requests_data = load_requests()
-    key, pending_list = media_type + 's', requests_data.get(media_type + 's', {}).get('pending', [])
-    item_to_approve = next((item for item in pending_list if item['title'] == title), None)
-    if item_to_approve:
-        pending_list.remove(item_to_approve)
-        requests_data[key]['approved'].append(item_to_approve)
-        save_requests(requests_data)
+    if _decide(media_type, title, 'approved', decided_by):
         logging.info(f"Approved request for '{title}'.")
         return True
     logging.warning(f"Could not find pending request for '{title}' to approve.")
     return False
 
-def deny_request(media_type, title):
-    """Removes a request from the pending list."""
-    requests_data = load_requests()
-    key, pending_list = media_type + 's', requests_data.get(media_type + 's', {}).get('pending', [])
-    item_to_deny = next((item for item in pending_list if item['title'] == title), None)
-    if item_to_deny:
-        pending_list.remove(item_to_deny)
-        save_requests(requests_data)
+def deny_request(media_type, title, decided_by=None):
+    """Marks a pending request denied; it can be requested again later."""
+    if _decide(media_type, title, 'denied', decided_by):
         logging.info(f"Denied request for '{title}'.")
         return True
     logging.warning(f"Could not find pending request for '{title}' to deny.")
     return False
-
@@ -0,0 +1,154 @@
+# search_orchestrator.py
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+import request_handler as rh
+
+# --- Configuration ---
+SEARCH_WORKERS = 8
+SEARCH_DEADLINE_SECONDS = 12.0   # the page stops waiting for remote sources after this
+SOURCE_READ_TIMEOUT = 8.0        # per-source socket read timeout, so a stalled indexer gives up on its own
+JOB_TTL_SECONDS = 120            # a job whose stream is never opened is dropped after this
+MAX_JOBS = 256
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Search Jobs ---
+class SearchJob:
+    """
+    One /search request's remote sources. Each source runs on the shared pool and publishes
+    events as it finishes; the SSE stream reads them in order until every source is done or
+    the deadline passes.
+    """
+    def __init__(self, query, sources, deadline=SEARCH_DEADLINE_SECONDS):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.created = time.monotonic()
+        self.deadline = self.created + deadline
+        self.timings = {name: {'status': 'pending', 'ms': None, 'count': 0} for name in sources}
+        self._events = []
+        self._running = set(sources)
+        self._cond = Condition()
+
+    def _elapsed_ms(self):
+        return round((time.monotonic() - self.created) * 1000)
+
+    def record(self, source, status, count=0):
+        """Records how a source ended and how long it took from the start of the search."""
+        with self._cond:
+            self.timings[source] = {'status': status, 'ms': self._elapsed_ms(), 'count': count}
+
+    def publish(self, event, data):
+        with self._cond:
+            self._events.append((event, data))
+            self._cond.notify_all()
+
+    def finish(self, source):
+        with self._cond:
+            self._running.discard(source)
+            self._cond.notify_all()
+
+    def events(self):
+        """Yields (event, data) as sources publish, then a final 'done' with per-source timings."""
+        cursor = 0
+        while True:
+            with self._cond:
+                while cursor == len(self._events) and self._running and time.monotonic() < self.deadline:
+                    self._cond.wait(self.deadline - time.monotonic())
+                batch = self._events[cursor:]
+                cursor = len(self._events)
+                finished = not self._running or time.monotonic() >= self.deadline
+            yield from batch
+            if finished and not batch:
+                break
+        with self._cond:
+            for source, timing in self.timings.items():
+                if timing['status'] == 'pending':
+                    timing.update(status='timeout', ms=self._elapsed_ms())
+            timings = {source: dict(timing) for source, timing in self.timings.items()}
+        summary = [f"{source} {timing['status']} in {timing['ms']} ms" for source, timing in timings.items()]
+        logging.info(f"Search '{self.query}': {', '.join(summary)}")
+        yield 'done', {'timings': timings}
+
+# --- Sources ---
+def _jackett_source(job, source, url, api_key, is_tv):
+    """Searches one Jackett feed, publishes its rows, then publishes posters that arrive before the deadline."""
+    try:
+        results = rh.search_jackett(url, api_key, job.query, is_tv=is_tv, timeout=(rh.JACKETT_TIMEOUT[0], SOURCE_READ_TIMEOUT))
+        rows = rh.enrich_with_tmdb_posters(results, is_tv=is_tv, timeout=0)
+        for row in rows:
+            row['media_type'] = 'tv' if is_tv else 'movie'
+        job.record(source, 'done', len(rows))
+        job.publish('results', {'source': source, 'results': rows})
+
+        if any(row['poster_pending'] for row in rows):
+            remaining = job.deadline - time.monotonic()
+            enriched = rh.enrich_with_tmdb_posters(results, is_tv=is_tv, timeout=max(remaining, 0))
+            posters = [[index, row['poster']] for index, row in enumerate(enriched)
+                       if rows[index]['poster_pending'] and row['poster']]
+            if posters:
+                job.publish('posters', {'source': source, 'posters': posters})
+    except Exception as e:
+        logging.error(f"Search source {source} failed: {e}")
+        job.record(source, 'error')
+    finally:
+        job.finish(source)
+
+class SearchOrchestrator:
+    """Starts the remote sources for a search on a bounded pool and keeps jobs until their stream is read."""
+    def __init__(self, workers=SEARCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+        self._jobs = OrderedDict()
+        self._lock = Lock()
+
+    def start(self, query, config, deadline=SEARCH_DEADLINE_SECONDS):
+        """Starts every configured Jackett source for `query`; returns the job, or None if none is configured."""
+        api_key = config.get('JACKETT_API_KEY')
+        sources = {}
+        if api_key and config.get('JACKETT_MOVIE_TORZNAB_URL'):
+            sources['jackett_movies'] = (config['JACKETT_MOVIE_TORZNAB_URL'], False)
+        if api_key and config.get('JACKETT_TV_TORZNAB_URL'):
+            sources['jackett_tv'] = (config['JACKETT_TV_TORZNAB_URL'], True)
+        if not sources:
+            return None
+
+        job = SearchJob(query, list(sources), deadline)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        for source, (url, is_tv) in sources.items():
+            self._executor.submit(_jackett_source, job, source, url, api_key, is_tv)
+        return job
+
+    def take(self, job_id):
+        """Removes and returns a started job; each job's events are streamed once."""
+        with self._lock:
+            self._prune()
+            return self._jobs.pop(job_id, None)
+
+    def _prune(self):
+        now = time.monotonic()
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if len(self._jobs) <= MAX_JOBS and now - job.created < JOB_TTL_SECONDS:
+                break
+            self._jobs.popitem(last=False)
+
+_orchestrator = SearchOrchestrator()
+
+def start_search(query, config, deadline=SEARCH_DEADLINE_SECONDS):
+    """Starts the remote half of a search in the background; see SearchOrchestrator.start."""
+    return _orchestrator.start(query, config, deadline)
+
+def take_search(job_id):
+    """Returns the job started by start_search, or None if it's unknown (expired, or another worker's)."""
+    return _orchestrator.take(job_id) if job_id else None
+
+def event_stream(job):
+    """Server-sent events for a job: 'results' and 'posters' per source, then 'done' with timings."""
+    for event, data in job.events():
+        yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
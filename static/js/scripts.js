@@ -60,3 +60,64 @@ function recentMedia(mediaType) {
     };
 }
 
+
+// Alpine.js data function for the search page: Jackett results arrive over SSE as each source answers
+function remoteSearch(streamUrl) {
+    return {
+        results: [], timings: [], loading: true,
+        init() {
+            const events = new EventSource(streamUrl);
+            events.addEventListener('results', e => {
+                const data = JSON.parse(e.data);
+                data.results.forEach((item, index) => this.results.push({ ...item, source: data.source, index, key: `${data.source}-${index}` }));
+            });
+            events.addEventListener('posters', e => {
+                const data = JSON.parse(e.data);
+                const posters = new Map(data.posters);
+                this.results.forEach(item => {
+                    if (item.source === data.source && posters.has(item.index)) item.poster = posters.get(item.index);
+                });
+            });
+            events.addEventListener('done', e => {
+                const timings = JSON.parse(e.data).timings;
+                this.timings = Object.entries(timings).map(([source, t]) => `${source}: ${t.status === 'done' ? t.count + ' in ' + t.ms + ' ms' : t.status}`);
+                this.loading = false;
+                events.close();
+            });
+            events.onerror = () => { this.loading = false; events.close(); };
+        }
+    };
+}
+
+// Alpine.js data function for the library pages: the next keyset page is fetched as the end of the grid nears the viewport
+function libraryScroll(nextUrl) {
+    return {
+        items: [], nextUrl, loading: false,
+        init() {
+            new IntersectionObserver(entries => {
+                if (entries.some(entry => entry.isIntersecting)) this.loadMore();
+            }, { rootMargin: '800px 0px' }).observe(this.$refs.sentinel);
+        },
+        loadMore() {
+            if (!this.nextUrl || this.loading) return;
+            this.loading = true;
+            fetch(this.nextUrl)
+                .then(res => res.json()).then(data => {
+                    if (data.error) { this.nextUrl = null; return; }
+                    this.items.push(...data.items);
+                    this.nextUrl = data.next_url;
+                })
+                .catch(err => { console.error('Fetch Error:', err); this.nextUrl = null; })
+                .finally(() => {
+                    this.loading = false;
+                    // The observer only fires on changes; keep going while the sentinel is still in range.
+                    this.$nextTick(() => {
+                        if (this.$refs.sentinel.getBoundingClientRect().top < window.innerHeight + 800) this.loadMore();
+                    });
+                });
+        },
+        year(item) {
+            return item.release_date ? item.release_date.split('-')[0] : (item.year || '');
+        }
+    };
+}
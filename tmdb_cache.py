@@ -0,0 +1,186 @@
+# tmdb_cache.py
+import json
+import logging
+import re
+import sqlite3
+import time
+from threading import Lock, Thread
+from urllib.parse import urlencode
+
+# --- Configuration ---
+CACHE_DB = 'tmdb_cache.db'
+
+# (fresh TTL, stale-while-revalidate window) in seconds for each endpoint class.
+ENDPOINT_TTLS = {
+    'search': (24 * 3600, 7 * 24 * 3600),
+    'details': (7 * 24 * 3600, 30 * 24 * 3600),
+    'season': (7 * 24 * 3600, 30 * 24 * 3600),
+    'popular': (6 * 3600, 24 * 3600),
+    'configuration': (7 * 24 * 3600, 30 * 24 * 3600),
+}
+
+# Parameters that don't change the response and must not end up in the cache key.
+IGNORED_PARAMS = {'api_key'}
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Key Normalization ---
+def endpoint_class(endpoint):
+    """Classifies a TMDb endpoint path so it gets the right TTL."""
+    endpoint = '/' + endpoint.strip('/').lower()
+    if endpoint.startswith('/search/'):
+        return 'search'
+    if endpoint.endswith('/popular'):
+        return 'popular'
+    if endpoint.startswith('/configuration'):
+        return 'configuration'
+    if '/season/' in endpoint:
+        return 'season'
+    return 'details'
+
+def cache_key(endpoint, params=None):
+    """Builds a stable cache key from an endpoint and its query parameters."""
+    normalized = []
+    for name, value in (params or {}).items():
+        if name in IGNORED_PARAMS or value is None or value == '':
+            continue
+        value = str(value).strip()
+        if name == 'query':
+            value = re.sub(r'\s+', ' ', value).lower()
+        normalized.append((name, value))
+    key = '/' + endpoint.strip('/').lower()
+    if normalized:
+        key += '?' + urlencode(sorted(normalized))
+    return key
+
+# --- Cache ---
+class TMDbCache:
+    """SQLite-backed cache of TMDb JSON responses with per-endpoint TTLs and stale-while-revalidate."""
+    def __init__(self, db_path=CACHE_DB):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = Lock()
+        self._revalidating = set()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'revalidations': 0, 'errors': 0}
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS tmdb_cache (
+                    key TEXT PRIMARY KEY,
+                    endpoint_class TEXT NOT NULL,
+                    body TEXT NOT NULL,
+                    fetched_at REAL NOT NULL
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key):
+        with self._lock:
+            try:
+                return self._connection().execute("SELECT body, fetched_at FROM tmdb_cache WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logging.error(f"Error reading TMDb cache: {e}")
+                return None
+
+    def _store(self, key, cls, data):
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO tmdb_cache (key, endpoint_class, body, fetched_at) VALUES (?, ?, ?, ?)",
+                                 (key, cls, json.dumps(data), time.time()))
+            except sqlite3.Error as e:
+                logging.error(f"Error writing TMDb cache: {e}")
+
+    def _load(self, loader, endpoint, params, key, cls):
+        data = loader(endpoint, params)
+        self._store(key, cls, data)
+        return data
+
+    def _revalidate(self, loader, endpoint, params, key, cls):
+        try:
+            self._load(loader, endpoint, params, key, cls)
+            self._count('revalidations')
+        except Exception as e:
+            self._count('errors')
+            logging.warning(f"Background refresh of {key} failed, keeping stale copy: {e}")
+        finally:
+            with self._lock:
+                self._revalidating.discard(key)
+
+    def get_json(self, endpoint, params, loader):
+        """
+        Returns the JSON body for a TMDb endpoint, from the cache when possible.
+        loader(endpoint, params) performs the real request on a miss or refresh.
+        Stale entries are served immediately and refreshed in the background.
+        Raises whatever the loader raises on a miss.
+        """
+        params = dict(params or {})
+        key = cache_key(endpoint, params)
+        cls = endpoint_class(endpoint)
+        ttl, stale_window = ENDPOINT_TTLS[cls]
+
+        row = self._lookup(key)
+        if row:
+            age = time.time() - row[1]
+            if age < ttl:
+                self._count('hits')
+                return json.loads(row[0])
+            if age < ttl + stale_window:
+                self._count('stale_hits')
+                with self._lock:
+                    start_refresh = key not in self._revalidating
+                    self._revalidating.add(key)
+                if start_refresh:
+                    Thread(target=self._revalidate, args=(loader, endpoint, params, key, cls), daemon=True).start()
+                return json.loads(row[0])
+
+        self._count('misses')
+        try:
+            return self._load(loader, endpoint, params, key, cls)
+        except Exception:
+            self._count('errors')
+            raise
+
+    def get_stats(self):
+        """Returns hit/miss counters; network_calls is how many requests actually went to TMDb."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['network_calls'] = stats['misses'] + stats['revalidations']
+        stats['calls_saved'] = stats['hits'] + stats['stale_hits']
+        return stats
+
+    def purge_expired(self):
+        """Deletes entries that are past their stale window."""
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connection()
+                with conn:
+                    for cls, (ttl, stale_window) in ENDPOINT_TTLS.items():
+                        conn.execute("DELETE FROM tmdb_cache WHERE endpoint_class = ? AND fetched_at < ?", (cls, now - ttl - stale_window))
+            except sqlite3.Error as e:
+                logging.error(f"Error purging TMDb cache: {e}")
+
+# --- Shared Instance ---
+_cache = TMDbCache()
+
+def get_json(endpoint, params, loader):
+    """Fetches a TMDb endpoint through the shared cache, calling loader on a miss."""
+    return _cache.get_json(endpoint, params, loader)
+
+def get_stats():
+    """Returns the shared cache's hit/miss counters."""
+    return _cache.get_stats()
+
+def purge_expired():
+    """Deletes the shared cache's entries that are past their stale window."""
+    _cache.purge_expired()
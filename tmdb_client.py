@@ -0,0 +1,179 @@
+# tmdb_client.py
+import logging
+import re
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+import requests
+from requests.adapters import HTTPAdapter
+import tmdb_cache
+
+# --- Configuration ---
+TMDB_API_URL = 'https://api.themoviedb.org/3'
+DEFAULT_RATE_LIMIT = 40      # sustained requests per second
+DEFAULT_BURST = 20           # requests allowed back-to-back before the limit kicks in
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_POOL_SIZE = 32
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """Thread-safe token bucket. acquire() blocks until a request may be sent."""
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds back every caller for a while, e.g. after the server answered 429."""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+def _retry_after_seconds(response):
+    """Parses a Retry-After header (delta-seconds or HTTP date) into seconds, or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def endpoint_template(endpoint):
+    """Collapses IDs out of an endpoint path so latency is tracked per endpoint, not per title."""
+    return re.sub(r'/\d+', '/{id}', '/' + endpoint.strip('/'))
+
+# --- Client ---
+class TMDbClient:
+    """Pooled keep-alive TMDb client with rate limiting, retries and per-endpoint latency stats."""
+    def __init__(self, rate_limit=DEFAULT_RATE_LIMIT, burst=DEFAULT_BURST, timeout=DEFAULT_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, pool_size=DEFAULT_POOL_SIZE):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(rate_limit, burst)
+        self.session = requests.Session()
+        self.session.headers.update({'Accept': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._stats = {}
+        self._stats_lock = Lock()
+
+    def _record(self, endpoint, elapsed, error=False, retry=False):
+        key = endpoint_template(endpoint)
+        with self._stats_lock:
+            stats = self._stats.setdefault(key, {'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['retries'] += int(retry)
+            stats['total_ms'] += elapsed * 1000
+            stats['max_ms'] = max(stats['max_ms'], elapsed * 1000)
+
+    def _backoff(self, attempt):
+        return min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS)
+
+    def request(self, endpoint, params=None, timeout=None):
+        """
+        GETs a TMDb endpoint and returns the decoded JSON. Retries connection errors, 429 and 5xx
+        with exponential backoff (honouring Retry-After). Raises requests.RequestException once
+        retries are exhausted.
+        """
+        url = TMDB_API_URL + '/' + endpoint.strip('/')
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(endpoint, time.monotonic() - started, error=True, retry=not last_attempt)
+                if last_attempt:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"TMDb request to {endpoint_template(endpoint)} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            elapsed = time.monotonic() - started
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                self._record(endpoint, elapsed, error=True, retry=True)
+                delay = _retry_after_seconds(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                if response.status_code == 429:
+                    # Throttling applies to the whole API key, so every thread has to back off.
+                    self.limiter.pause(delay)
+                logging.warning(f"TMDb answered {response.status_code} for {endpoint_template(endpoint)}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._record(endpoint, elapsed, error=not response.ok)
+            response.raise_for_status()
+            return response.json()
+
+    def get_latency_stats(self):
+        """Returns call counts and latency (ms) per endpoint template."""
+        with self._stats_lock:
+            stats = {key: dict(value) for key, value in self._stats.items()}
+        for value in stats.values():
+            value['avg_ms'] = round(value['total_ms'] / value['calls'], 1) if value['calls'] else 0.0
+            value['total_ms'] = round(value['total_ms'], 1)
+            value['max_ms'] = round(value['max_ms'], 1)
+        return stats
+
+# --- Shared Instance ---
+_client = TMDbClient()
+
+def configure(rate_limit=None, burst=None, timeout=None, max_retries=None):
+    """Replaces the shared client with one using the given settings (None keeps the default)."""
+    global _client
+    if isinstance(timeout, list):
+        timeout = tuple(timeout)  # JSON config has no tuples; requests wants (connect, read)
+    _client = TMDbClient(
+        rate_limit=rate_limit or DEFAULT_RATE_LIMIT,
+        burst=burst or DEFAULT_BURST,
+        timeout=timeout or DEFAULT_TIMEOUT,
+        max_retries=DEFAULT_MAX_RETRIES if max_retries is None else max_retries,
+    )
+
+def request(endpoint, params=None, timeout=None):
+    """Performs an uncached request through the shared client."""
+    return _client.request(endpoint, params, timeout=timeout)
+
+def get_json(endpoint, params=None, cache=True):
+    """Fetches a TMDb endpoint through the response cache, going to the network only on a miss."""
+    if not cache:
+        return _client.request(endpoint, params)
+    return tmdb_cache.get_json(endpoint, params, loader=_client.request)
+
+def get_stats():
+    """Returns cache counters and per-endpoint latency in one dict."""
+    return {'cache': tmdb_cache.get_stats(), 'endpoints': _client.get_latency_stats()}
@@ -0,0 +1,124 @@
+# torznab.py
+import io
+import xml.etree.ElementTree as ET
+
+# --- Configuration ---
+TORZNAB_NS = 'http://torznab.com/schemas/2015/feed'
+READ_CHUNK_SIZE = 64 * 1024
+_ATTR_TAG = f'{{{TORZNAB_NS}}}attr'
+_INT_FIELDS = ('size', 'seeders', 'peers', 'grabs', 'files', 'tvdbid', 'tmdbid')
+_TEXT_FIELDS = {'title': 'title', 'link': 'link', 'guid': 'guid', 'pubDate': 'pubdate', 'comments': 'comments', 'size': 'size'}
+
+# --- Item Extraction ---
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _imdb_id(value):
+    """Normalizes '1856101', 'tt1856101' or 1856101 to 'tt1856101'."""
+    digits = str(value).lower().removeprefix('tt')
+    return f"tt{int(digits):07d}" if digits.isdigit() else None
+
+def _item_from_element(element):
+    """Builds an item dict from a finished <item> in one pass over its children."""
+    item = {'title': None, 'link': None, 'guid': None, 'pubdate': None, 'comments': None, 'size': None,
+            'seeders': None, 'peers': None, 'grabs': None, 'files': None, 'infohash': None, 'magneturl': None,
+            'imdbid': None, 'tvdbid': None, 'tmdbid': None, 'categories': [], 'attrs': {}}
+    for child in element:
+        if child.tag == _ATTR_TAG:
+            name, value = child.get('name'), child.get('value')
+            if not name or value is None:
+                continue
+            if name == 'category':
+                item['categories'].append(value)
+            else:
+                item['attrs'][name] = value
+        elif child.tag in _TEXT_FIELDS:
+            item[_TEXT_FIELDS[child.tag]] = (child.text or '').strip() or None
+        elif child.tag == 'category' and child.text:
+            item['categories'].append(child.text.strip())
+        elif child.tag == 'enclosure' and not item['link']:
+            item['link'] = child.get('url')
+
+    attrs = item['attrs']
+    for name in _INT_FIELDS:
+        item[name] = _to_int(attrs.get(name, item[name]))
+    item['infohash'] = attrs.get('infohash', '').lower() or None
+    item['magneturl'] = attrs.get('magneturl')
+    item['imdbid'] = _imdb_id(attrs.get('imdbid') or attrs.get('imdb') or '')
+    return item
+
+# --- Parsing ---
+class TorznabParser:
+    """
+    Incremental Torznab/RSS parser. feed() it bytes as they arrive; it returns the items each
+    chunk completed and drops them from the tree, so memory stays flat however large the feed.
+    """
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.count = 0
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._open = []  # elements started but not yet ended
+
+    @property
+    def done(self):
+        """True once `limit` items have been produced; the caller can stop reading."""
+        return self.limit is not None and self.count >= self.limit
+
+    def feed(self, data):
+        self._parser.feed(data)
+        return self._drain()
+
+    def close(self):
+        """Finishes the document; raises ET.ParseError if it was truncated or malformed."""
+        self._parser.close()
+        return self._drain()
+
+    def _drain(self):
+        items = []
+        for event, element in self._parser.read_events():
+            if event == 'start':
+                self._open.append(element)
+                continue
+            self._open.pop()
+            if element.tag != 'item':
+                continue
+            if not self.done:
+                items.append(_item_from_element(element))
+                self.count += 1
+            if self._open:
+                self._open[-1].remove(element)
+        return items
+
+def iter_items(source, limit=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yields items from a Torznab feed given as bytes, str or a readable file-like object
+    (e.g. requests' response.raw). Stops reading as soon as `limit` items have been yielded.
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    elif isinstance(source, str):
+        source = io.StringIO(source)
+    parser = TorznabParser(limit)
+    while not parser.done:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            yield from parser.close()
+            return
+        yield from parser.feed(chunk)
+
+def parse(source, limit=None):
+    """Returns up to `limit` items from a Torznab feed (see iter_items)."""
+    return list(iter_items(source, limit))
+
+async def parse_chunks(chunks, limit=None):
+    """Parses a feed arriving as an async iterable of byte chunks (e.g. aiohttp's iter_chunked)."""
+    parser = TorznabParser(limit)
+    items = []
+    async for chunk in chunks:
+        items += parser.feed(chunk)
+        if parser.done:
+            return items
+    return items + parser.close()
@@ -1,10 +1,12 @@
 # tracker_manager.py
 import configparser
+import json
 import os
 
 PROWLARR_CONFIG_FILE = "prowlarr.conf"
 BTN_CONFIG_FILE = "btn.conf"
 PTP_CONFIG_FILE = "ptp.conf"
+TRACKERS_CONFIG_FILE = "trackers_config.json"
 
 def get_config(file_path):
     """Reads a .conf file."""
@@ -31,3 +33,15 @@ def load_ptp_config():
     """Loads PassThePopcorn.me configuration."""
     return get_config(PTP_CONFIG_FILE)
 
+
+def load_trackers_config(file_path=TRACKERS_CONFIG_FILE):
+    """Loads the tracker definitions searched by api.py (// comment lines are allowed)."""
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, 'r') as f:
+        lines = [line for line in f if not line.lstrip().startswith('//')]
+    try:
+        return json.loads(''.join(lines))
+    except json.JSONDecodeError as e:
+        print(f"Warning: Invalid JSON in `{file_path}`: {e}")
+        return []
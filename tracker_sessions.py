@@ -0,0 +1,189 @@
+# tracker_sessions.py
+import asyncio
+import os
+import pickle
+import re
+import time
+from urllib.parse import urlsplit
+import aiohttp
+
+# --- Configuration ---
+COOKIE_DIR = 'tracker_cookies'
+CONNECTION_LIMIT = 64
+CONNECTION_LIMIT_PER_HOST = 8
+AUTH_FAILURE_STATUSES = {401, 403}
+LOGIN_RETRY_SECONDS = 60   # after a failed login, don't hammer the tracker's login page
+
+class TrackerLoginError(aiohttp.ClientError):
+    """Raised when a tracker login fails (or failed too recently to retry)."""
+
+async def _read_text(response):
+    return await response.text()
+
+def _new_stats():
+    return {'searches': 0, 'errors': 0, 'timeouts': 0, 'logins': 0, 'login_failures': 0,
+            'reauthentications': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+# --- Sessions ---
+class TrackerSession:
+    """
+    One tracker's long-lived aiohttp session: its cookie jar (persisted to disk), login state
+    and counters. Logs in only when it has no cookies yet or the tracker rejects them.
+    """
+    def __init__(self, tracker_config, connector, cookie_dir, stats):
+        self.name = tracker_config.get('name', 'Unknown')
+        self.config = tracker_config
+        self.stats = stats
+        self.cookie_path = os.path.join(cookie_dir, re.sub(r'[^\w.-]', '_', self.name) + '.cookies')
+        self.authenticated = False
+        # unsafe=True keeps cookies set by trackers addressed by IP address (common for self-hosted ones).
+        jar = aiohttp.CookieJar(unsafe=True)
+        if self.uses_cookies and os.path.exists(self.cookie_path):
+            try:
+                jar.load(self.cookie_path)
+                self.authenticated = True
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError) as e:
+                print(f"Ignoring unreadable cookie file for {self.name}: {e}")
+        # Sessions share the pool's connector; closing one must not close it for everyone.
+        self.session = aiohttp.ClientSession(connector=connector, connector_owner=False, cookie_jar=jar)
+        self._login_lock = asyncio.Lock()
+        self._login_generation = 0
+        self._login_blocked_until = 0.0
+
+    @property
+    def uses_cookies(self):
+        return bool(self.config.get('auth_type') == 'cookies' and self.config.get('auth_url') and self.config.get('login_data'))
+
+    def save_cookies(self):
+        if not self.uses_cookies:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cookie_path) or '.', exist_ok=True)
+            self.session.cookie_jar.save(self.cookie_path)
+        except OSError as e:
+            print(f"Could not save cookies for {self.name}: {e}")
+
+    async def login(self, seen_generation):
+        """
+        Logs in, unless another request already did so after `seen_generation` was read;
+        concurrent requests that hit an expired session therefore share one login.
+        """
+        async with self._login_lock:
+            if self._login_generation != seen_generation:
+                return
+            if time.monotonic() < self._login_blocked_until:
+                raise TrackerLoginError(f"Login to {self.name} failed recently; not retrying yet")
+            self.stats['logins'] += 1
+            try:
+                async with self.session.post(self.config['auth_url'], data=self.config['login_data']) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        raise TrackerLoginError(f"Login to {self.name} failed with HTTP {response.status}")
+            except aiohttp.ClientError:
+                self.stats['login_failures'] += 1
+                self._login_blocked_until = time.monotonic() + LOGIN_RETRY_SECONDS
+                raise
+            self._login_generation += 1
+            self.authenticated = True
+            self.save_cookies()
+
+    def _needs_login(self, response):
+        if response.status in AUTH_FAILURE_STATUSES:
+            return True
+        if response.history:
+            # Expired sessions are often answered with a redirect to the login page.
+            path = urlsplit(str(response.url)).path.rstrip('/')
+            return path == urlsplit(self.config['auth_url']).path.rstrip('/') or 'login' in path.lower()
+        return False
+
+    async def _get(self, url, params, auth, read):
+        for attempt in range(2):
+            if self.uses_cookies and not self.authenticated:
+                await self.login(self._login_generation)
+            sent_generation = self._login_generation
+            async with self.session.get(url, params=params, auth=auth) as response:
+                if not (self.uses_cookies and attempt == 0 and self._needs_login(response)):
+                    response.raise_for_status()
+                    return await read(response)
+            self.stats['reauthentications'] += 1
+            await self.login(sent_generation)
+
+    async def fetch(self, url, params=None, auth=None, read=None):
+        """
+        GETs a search URL and returns `await read(response)` (the body text by default),
+        re-authenticating once if the session expired. `read` may stop early; the rest of the
+        body is then discarded with the connection.
+        """
+        started = time.monotonic()
+        try:
+            result = await self._get(url, params, auth, read or _read_text)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._record(started, error=True)
+            raise
+        self._record(started)
+        return result
+
+    async def get_text(self, url, params=None, auth=None):
+        """GETs a search URL and returns the body text."""
+        return await self.fetch(url, params, auth)
+
+    def _record(self, started, error=False):
+        elapsed_ms = (time.monotonic() - started) * 1000
+        self.stats['searches'] += 1
+        self.stats['errors'] += int(error)
+        self.stats['total_ms'] += elapsed_ms
+        self.stats['max_ms'] = max(self.stats['max_ms'], elapsed_ms)
+
+    async def close(self):
+        self.save_cookies()
+        await self.session.close()
+
+# --- Pool ---
+class TrackerSessionPool:
+    """One TrackerSession per tracker, all on a shared connection pool, for the running event loop."""
+    def __init__(self, cookie_dir=COOKIE_DIR):
+        self.cookie_dir = cookie_dir
+        self._sessions = {}
+        self._connector = None
+        self._loop = None
+        self._stats = {}  # tracker name -> counters; kept when the loop (and so the sessions) change
+
+    def get(self, tracker_config):
+        """Returns the session for a tracker, creating it (and loading saved cookies) on first use."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # aiohttp sessions belong to one loop; asyncio.run() callers get fresh ones, cookies come back from disk.
+            self._sessions = {}
+            self._connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT, limit_per_host=CONNECTION_LIMIT_PER_HOST, ttl_dns_cache=300)
+            self._loop = loop
+        name = tracker_config.get('name', 'Unknown')
+        session = self._sessions.get(name)
+        if session is None or session.session.closed:
+            session = TrackerSession(tracker_config, self._connector, self.cookie_dir, self._stats.setdefault(name, _new_stats()))
+            self._sessions[name] = session
+        return session
+
+    def record_timeout(self, tracker_name):
+        self._stats.setdefault(tracker_name, _new_stats())['timeouts'] += 1
+
+    async def close(self):
+        """Saves cookies and closes every session and the shared connector."""
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            await session.close()
+        if self._connector is not None:
+            await self._connector.close()
+            self._connector = None
+        self._loop = None
+
+    def get_stats(self):
+        """Per-tracker login counts and search latency (ms)."""
+        stats = {}
+        for name, counters in self._stats.items():
+            stats[name] = dict(counters)
+            stats[name]['avg_ms'] = round(counters['total_ms'] / counters['searches'], 1) if counters['searches'] else 0.0
+            stats[name]['total_ms'] = round(counters['total_ms'], 1)
+            stats[name]['max_ms'] = round(counters['max_ms'], 1)
+        return stats
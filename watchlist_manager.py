@@ -1,31 +1,175 @@
 # watchlist_manager.py
 import json
 import os
-from models import Movie, Show, json_decoder, json_encoder
-
-WATCHLIST_FILE = "watchlist.json"
-
-def load_watchlist(file_path=WATCHLIST_FILE):
-    """Loads the watchlist from a JSON file."""
-    if not os.path.exists(file_path):
-        return {"movies": [], "shows": []}
-    try:
-        with open(file_path, 'r') as f:
-            # Use a custom object hook to convert dictionaries back to objects
-            data = json.load(f, object_hook=json_decoder)
-            # Ensure the structure is correct, even if the file is empty
-            return {
-                "movies": [Movie(**m) for m in data.get("movies", [])],
-                "shows": [Show(**s) for s in data.get("shows", [])]
-            }
-    except json.JSONDecodeError:
-        print(f"Warning: Invalid JSON format in `{file_path}`. Starting with an empty watchlist.")
-        return {"movies": [], "shows": []}
-
-def save_watchlist(watchlist, file_path=WATCHLIST_FILE):
-    """Saves the watchlist to a JSON file."""
-    # Use a custom JSON encoder to handle the custom objects
-    with open(file_path, 'w') as f:
-        json.dump(watchlist, f, indent=4, default=json_encoder)
+import sqlite3
+import time
+from threading import Lock
+from models import Movie, Show, json_decoder
 
+WATCHLIST_DB = "watchlist.db"
+WATCHLIST_FILE = "watchlist.json"   # pre-database watchlist, imported once on first use
 
+# item_type -> model; the table's downloaded column holds Movie.downloaded / Show.downloaded_all
+ITEM_TYPES = {'movie': Movie, 'show': Show}
+
+def _title_key(title):
+    return ' '.join(title.casefold().split())
+
+def _item_type(item):
+    return 'movie' if isinstance(item, Movie) else 'show'
+
+def _from_row(row):
+    item_type, title, unique_id, downloaded = row
+    return ITEM_TYPES[item_type](title, unique_id, bool(downloaded))
+
+def _downloaded(item):
+    return item.downloaded if isinstance(item, Movie) else item.downloaded_all
+
+# --- Store ---
+class WatchlistStore:
+    """
+    SQLite-backed watchlist. Items are keyed by type and case-insensitive title, with an index
+    on their ID; every change is a single transaction, so a crash never leaves a half-written list.
+    """
+    def __init__(self, db_path=WATCHLIST_DB, legacy_file=WATCHLIST_FILE):
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        self._conn = None
+        self._lock = Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS watchlist (
+                        item_type TEXT NOT NULL,
+                        title TEXT NOT NULL,
+                        title_key TEXT NOT NULL,
+                        unique_id TEXT,
+                        downloaded INTEGER NOT NULL DEFAULT 0,
+                        added_at REAL NOT NULL,
+                        UNIQUE (item_type, title_key)
+                    )
+                ''')
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_watchlist_unique_id ON watchlist (unique_id) WHERE unique_id IS NOT NULL")
+            self._conn = conn
+            self._import_legacy_file()
+        return self._conn
+
+    def _import_legacy_file(self):
+        """Moves an old watchlist.json into the table once, then renames the file."""
+        if not self.legacy_file or not os.path.exists(self.legacy_file):
+            return
+        try:
+            with open(self.legacy_file, 'r') as f:
+                data = json.load(f, object_hook=json_decoder)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not import `{self.legacy_file}`: {e}")
+            return
+        items = [item for item in data.get("movies", []) + data.get("shows", []) if isinstance(item, (Movie, Show))]
+        with self._conn:
+            self._upsert(self._conn, items)
+        os.replace(self.legacy_file, self.legacy_file + '.migrated')
+        print(f"Imported {len(items)} watchlist item(s) from `{self.legacy_file}`.")
+
+    @staticmethod
+    def _upsert(conn, items):
+        now = time.time()
+        rows = [(_item_type(item), item.title, _title_key(item.title), item.id, int(bool(_downloaded(item))), now)
+                for item in items]
+        conn.executemany('''
+                INSERT INTO watchlist (item_type, title, title_key, unique_id, downloaded, added_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (item_type, title_key) DO UPDATE SET
+                    unique_id = COALESCE(excluded.unique_id, unique_id),
+                    downloaded = MAX(downloaded, excluded.downloaded)
+            ''', rows)
+
+    def add(self, items):
+        """
+        Adds Movie/Show items in one transaction. An item already listed (same type and title)
+        keeps its place; it picks up a new ID, and a downloaded flag is never cleared by re-adding.
+        """
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                self._upsert(conn, items)
+
+    def remove(self, item_type, titles):
+        """Removes items of one type by case-insensitive title; returns how many were removed."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.executemany("DELETE FROM watchlist WHERE item_type = ? AND title_key = ?",
+                                          [(item_type, _title_key(title)) for title in titles])
+            return cursor.rowcount
+
+    def set_downloaded(self, item_type, title, downloaded=True):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute("UPDATE watchlist SET downloaded = ? WHERE item_type = ? AND title_key = ?",
+                                      (int(downloaded), item_type, _title_key(title)))
+            return cursor.rowcount > 0
+
+    def find_by_title(self, item_type, title):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT item_type, title, unique_id, downloaded FROM watchlist WHERE item_type = ? AND title_key = ?",
+                (item_type, _title_key(title))).fetchone()
+        return _from_row(row) if row else None
+
+    def find_by_id(self, unique_id):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT item_type, title, unique_id, downloaded FROM watchlist WHERE unique_id = ?", (unique_id,)).fetchone()
+        return _from_row(row) if row else None
+
+    def load(self):
+        """The whole watchlist as {"movies": [Movie], "shows": [Show]}, in the order items were added."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT item_type, title, unique_id, downloaded FROM watchlist ORDER BY rowid").fetchall()
+        watchlist = {"movies": [], "shows": []}
+        for row in rows:
+            watchlist["movies" if row[0] == 'movie' else "shows"].append(_from_row(row))
+        return watchlist
+
+    def replace(self, watchlist):
+        """Replaces the whole watchlist atomically."""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM watchlist")
+                self._upsert(conn, watchlist.get("movies", []) + watchlist.get("shows", []))
+
+_store = WatchlistStore()
+
+# --- Module Functions ---
+def load_watchlist():
+    """Loads the whole watchlist."""
+    return _store.load()
+
+def save_watchlist(watchlist):
+    """Replaces the stored watchlist with `watchlist` ({"movies": [...], "shows": [...]})."""
+    _store.replace(watchlist)
+
+def add_to_watchlist(items):
+    """Adds (or updates) Movie/Show items in one transaction."""
+    _store.add(items)
+
+def remove_from_watchlist(item_type, titles):
+    """Removes items of one type ('movie' or 'show') by case-insensitive title."""
+    return _store.remove(item_type, titles)
+
+def find_by_title(item_type, title):
+    return _store.find_by_title(item_type, title)
+
+def find_by_id(unique_id):
+    return _store.find_by_id(unique_id)
+
+def set_downloaded(item_type, title, downloaded=True):
+    return _store.set_downloaded(item_type, title, downloaded)